@@ -0,0 +1,109 @@
+"""Benchmarks da API de escolas.
+
+Cada módulo corre com ``python -m benchmarks.<nome>`` a partir da raiz do
+projeto, contra a base de dados configurada em ``labapp.settings``. Tudo o
+que é escrito na base é desfeito no fim (ver ``transacao_descartavel``).
+"""
+import json
+import os
+import sys
+import time
+from contextlib import contextmanager
+
+
+def configurar_django():
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'labapp.settings')
+    import django
+
+    django.setup()
+    preparar_settings()
+
+
+def preparar_settings():
+    """Ajustes para medir, com o Django já configurado (ver o comando benchmark_escolas)."""
+    from django.conf import settings
+    from django.test import override_settings
+
+    # override_settings também recria as caches já abertas com o CACHES novo
+    override_settings(
+        # Com DEBUG=True cada consulta fica guardada em connection.queries
+        DEBUG=False,
+        # Pedidos do APIRequestFactory, medidos sempre sem a cache das leituras
+        ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver'],
+        CACHES={**settings.CACHES, 'benchmarks': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}},
+        ESCOLAS_CACHE_ALIAS='benchmarks',
+    ).enable()
+
+
+class _Descartar(Exception):
+    pass
+
+
+@contextmanager
+def transacao_descartavel():
+    from django.db import transaction
+
+    try:
+        with transaction.atomic():
+            yield
+            raise _Descartar
+    except _Descartar:
+        pass
+
+
+@contextmanager
+def cronometro(resultado, chave):
+    inicio = time.perf_counter()
+    yield
+    resultado[chave] = time.perf_counter() - inicio
+
+
+PROVINCIAS = [
+    'Bengo', 'Benguela', 'Bié', 'Cabinda', 'Cuando Cubango', 'Cuanza Norte', 'Cuanza Sul', 'Cunene',
+    'Huambo', 'Huíla', 'Luanda', 'Lunda Norte', 'Lunda Sul', 'Malanje', 'Moxico', 'Namibe', 'Uíge', 'Zaire',
+]
+
+
+def semear(linhas):
+    """Insere ``linhas`` escolas sintéticas com uma única instrução SQL.
+
+    Cada escola fica em uma ou duas províncias, com Luanda sobre-representada
+    como nos dados reais. Deve ser chamado dentro de ``transacao_descartavel``.
+    """
+    from django.db import connection
+
+    with connection.cursor() as cursor:
+        cursor.execute(
+            """
+            INSERT INTO escolas_escola (nome, email, numero_salas, provincia)
+            SELECT 'Escola Benchmark ' || i, 'escola' || i || '@benchmark.ao', 1 + i %% 40,
+                   CASE WHEN i %% 3 = 0 THEN ARRAY[(%(provincias)s::varchar[])[1 + i %% 18]]
+                        WHEN i %% 3 = 1 THEN ARRAY['Luanda', (%(provincias)s::varchar[])[1 + (i * 7) %% 18]]
+                        ELSE ARRAY[(%(provincias)s::varchar[])[1 + (i * 7) %% 18], (%(provincias)s::varchar[])[1 + (i * 13) %% 18]]
+                   END
+            FROM generate_series(1, %(linhas)s) AS i
+            """,
+            {'linhas': linhas, 'provincias': PROVINCIAS},
+        )
+        # Os índices GIN preenchidos linha a linha dentro da transação ficam
+        # com a lista pendente cheia e árvores fragmentadas; reconstruí-los dá
+        # o estado de uma tabela em produção (carregada e depois indexada/vacuum).
+        cursor.execute(
+            "SELECT c.relname FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid "
+            "JOIN pg_am am ON am.oid = c.relam WHERE i.indrelid = 'escolas_escola'::regclass AND am.amname = 'gin'"
+        )
+        for (indice,) in cursor.fetchall():
+            cursor.execute(f'REINDEX INDEX "{indice}"')
+        cursor.execute('ANALYZE escolas_escola')
+        # Províncias normalizadas, preenchidas pelos triggers se estiverem ligados (ver escolas/provincias.py)
+        cursor.execute('ANALYZE escolas_provincia, escolas_escolaprovincia')
+
+
+def percentil(amostras, p):
+    ordenadas = sorted(amostras)
+    return ordenadas[min(len(ordenadas) - 1, int(round(p / 100 * (len(ordenadas) - 1))))]
+
+
+def imprimir(resultados):
+    json.dump(resultados, sys.stdout, indent=2, ensure_ascii=False)
+    sys.stdout.write('\n')
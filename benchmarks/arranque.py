@@ -0,0 +1,191 @@
+"""Arranque a frio: importações, tempo até ao primeiro pedido e memória dos workers.
+
+    python -m benchmarks.arranque --modos wsgi asgi --workers 2 --repeticoes 3
+
+Mede três coisas, cada uma num processo novo:
+
+* ``importacoes``: o ``django.setup()`` seguido de ``import labapp.urls`` com
+  ``python -X importtime``; o tempo total, os módulos mais caros e se o
+  pandas, o numpy ou o openpyxl foram carregados (não deviam: só o upload
+  precisa deles);
+* por modo do ``servidor.sh``: o tempo desde o lançamento do gunicorn até à
+  porta aberta e até à primeira resposta 200 (o primeiro pedido é que
+  importa as URLs e as views em cada worker);
+* a memória residente (RSS) de cada worker depois do primeiro pedido e depois
+  de um upload de um XLSX pequeno, que carrega a pilha da importação.
+
+As escolas e o registo do arquivo importado pelo upload são apagados no fim.
+"""
+import argparse
+import http.client
+import re
+import subprocess
+import sys
+import time
+import uuid
+
+from . import configurar_django, imprimir
+from .servidor import RAIZ, _arrancar
+
+PREFIXO = 'Escola Arranque'
+PESADOS = ('pandas', 'numpy', 'openpyxl')
+
+PROGRAMA = f"""
+import os, sys, time
+inicio = time.perf_counter()
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'labapp.settings')
+import django
+django.setup()
+import labapp.urls
+print(time.perf_counter() - inicio)
+print(','.join(m for m in {PESADOS!r} if m in sys.modules))
+"""
+
+_LINHA_IMPORTTIME = re.compile(r'import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)')
+
+
+def importacoes(mais_caros=10):
+    processo = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', PROGRAMA],
+        cwd=RAIZ, capture_output=True, text=True, check=True,
+    )
+    segundos, pesados = processo.stdout.splitlines()
+    # Só os módulos importados diretamente (sem indentação): os acumulados somam o total
+    modulos = [
+        (corresponde.group(4), int(corresponde.group(2)))
+        for corresponde in map(_LINHA_IMPORTTIME.match, processo.stderr.splitlines())
+        if corresponde and len(corresponde.group(3)) == 1
+    ]
+    modulos.sort(key=lambda modulo: modulo[1], reverse=True)
+    return {
+        'segundos': round(float(segundos), 3),
+        'carregados': pesados.split(',') if pesados else [],
+        'mais_caros_ms': {nome: round(micros / 1000, 1) for nome, micros in modulos[:mais_caros]},
+    }
+
+
+def _workers(mestre):
+    with open(f'/proc/{mestre}/task/{mestre}/children') as filhos:
+        return [int(pid) for pid in filhos.read().split()]
+
+
+def _rss_mb(pid):
+    with open(f'/proc/{pid}/status') as estado:
+        for linha in estado:
+            if linha.startswith('VmRSS:'):
+                return round(int(linha.split()[1]) / 1024, 1)
+    return None
+
+
+def _pedido(porta, metodo, caminho, corpo=None, cabecalhos=None):
+    conexao = http.client.HTTPConnection('127.0.0.1', porta, timeout=30)
+    try:
+        conexao.request(metodo, caminho, corpo, cabecalhos or {})
+        resposta = conexao.getresponse()
+        resposta.read()
+        return resposta.status
+    finally:
+        conexao.close()
+
+
+def _primeira_resposta(porta, limite=30):
+    fim = time.monotonic() + limite
+    while time.monotonic() < fim:
+        try:
+            if _pedido(porta, 'GET', '/escolas/?page_size=1') == 200:
+                return
+        except (OSError, http.client.HTTPException):
+            pass
+        time.sleep(0.05)
+    raise RuntimeError('O servidor não respondeu ao primeiro pedido')
+
+
+def _upload(porta, caminho):
+    fronteira = uuid.uuid4().hex
+    with open(caminho, 'rb') as arquivo:
+        conteudo = arquivo.read()
+    corpo = (
+        f'--{fronteira}\r\nContent-Disposition: form-data; name="file"; filename="arranque.xlsx"\r\n'
+        f'Content-Type: application/octet-stream\r\n\r\n'
+    ).encode() + conteudo + f'\r\n--{fronteira}--\r\n'.encode()
+    return _pedido(porta, 'POST', '/escolas/upload-excel/', corpo,
+                   {'Content-Type': f'multipart/form-data; boundary={fronteira}'})
+
+
+def servidor(modo, workers, porta):
+    inicio = time.perf_counter()
+    # Sem --preload cada worker importa a aplicação por si
+    processo = _arrancar(modo, porta, workers, cache=False)
+    try:
+        porta_aberta = time.perf_counter() - inicio
+        _primeira_resposta(porta)
+        primeira = time.perf_counter() - inicio
+        pids = _workers(processo.pid)
+        # Os restantes workers também respondem a um pedido antes de medir a memória
+        for _ in range(4 * workers):
+            _pedido(porta, 'GET', '/escolas/?page_size=1')
+        rss = [_rss_mb(pid) for pid in pids]
+        return processo, {
+            'porta_aberta_s': round(porta_aberta, 3),
+            'primeira_resposta_s': round(primeira, 3),
+            'rss_mb': rss,
+        }
+    except BaseException:
+        processo.terminate()
+        processo.wait()
+        raise
+
+
+def _apagar(caminho):
+    from escolas import alteracoes
+    from escolas.historico import hash_arquivo
+    from escolas.models import ArquivoImportado, Escola
+
+    Escola.objects.filter(nome__startswith=f'{PREFIXO} ').delete()
+    with open(caminho, 'rb') as arquivo:
+        ArquivoImportado.objects.filter(hash=hash_arquivo(arquivo)).delete()
+    alteracoes.registrar()
+
+
+def executar(modos=('wsgi', 'asgi'), workers=2, repeticoes=3, porta=8766):
+    from .importacao import gerar_arquivo
+
+    resultados = [{'medicao': 'importacoes', **importacoes()}]
+    with gerar_arquivo(20, 'xlsx', prefixo=PREFIXO) as caminho:
+        try:
+            for modo in modos:
+                for repeticao in range(repeticoes):
+                    processo, resultado = servidor(modo, workers, porta)
+                    try:
+                        pids = _workers(processo.pid)
+                        estados = set()
+                        # Vários uploads, para todos os workers carregarem a pilha da importação
+                        for _ in range(2 * workers):
+                            estados.add(_upload(porta, caminho))
+                            _apagar(caminho)
+                        resultado['rss_mb_apos_upload'] = [_rss_mb(pid) for pid in pids]
+                        resultado['upload'] = sorted(estados)
+                    finally:
+                        processo.terminate()
+                        processo.wait()
+                    resultados.append({'medicao': 'servidor', 'modo': modo, 'workers': workers,
+                                       'repeticao': repeticao + 1, **resultado})
+        finally:
+            _apagar(caminho)
+    return resultados
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--modos', nargs='+', default=['wsgi', 'asgi'], choices=['wsgi', 'asgi'])
+    parser.add_argument('--workers', type=int, default=2)
+    parser.add_argument('--repeticoes', type=int, default=3)
+    parser.add_argument('--porta', type=int, default=8766)
+    args = parser.parse_args()
+
+    configurar_django()
+    imprimir(executar(args.modos, args.workers, args.repeticoes, args.porta))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,84 @@
+"""Pesquisa por nome/e-mail: tsvector + GIN vs. ``icontains``.
+
+    python -m benchmarks.busca --linhas 100000 1000000
+
+Para cada termo mede a primeira página (20 resultados) de
+``busca.pesquisar`` e da consulta antiga com ``nome__icontains`` (varrimento
+sequencial), sem cache, e reporta p50/p95 em milissegundos.
+"""
+import argparse
+import time
+
+from . import configurar_django, imprimir, percentil, semear, transacao_descartavel
+
+TERMOS = {
+    # Nome quase completo: poucos candidatos
+    'nome': ('Benchmark 123456', 'Benchmark 123456'),
+    # Última palavra incompleta, como se escreve numa caixa de pesquisa
+    'prefixo': ('benchmark 4242', 'Benchmark 4242'),
+    # Parte do e-mail
+    'email': ('escola777', 'escola777'),
+}
+
+
+def nova(termo, pagina=20):
+    from escolas import busca
+    from escolas.serializers import escola_leitura
+
+    return escola_leitura.data(escola_leitura.valores(busca.pesquisar(termo))[:pagina + 1])
+
+
+def antiga(termo, pagina=20):
+    from django.db.models import Q
+    from escolas.models import Escola
+    from escolas.serializers import escola_leitura
+
+    queryset = Escola.objects.filter(Q(nome__icontains=termo) | Q(email__icontains=termo))
+    return escola_leitura.data(escola_leitura.valores(queryset)[:pagina + 1])
+
+
+def _medir(funcao, termo, repeticoes):
+    funcao(termo)
+    amostras = []
+    for _ in range(repeticoes):
+        inicio = time.perf_counter()
+        funcao(termo)
+        amostras.append((time.perf_counter() - inicio) * 1000)
+    return amostras
+
+
+def executar(linhas=(100000, 1000000), repeticoes=50):
+    from escolas import busca
+
+    resultados = []
+    for n in linhas:
+        with transacao_descartavel():
+            semear(n)
+            for cenario, (termo, termo_antigo) in TERMOS.items():
+                nova_ms = _medir(nova, termo, repeticoes)
+                antiga_ms = _medir(antiga, termo_antigo, max(1, repeticoes // 10))
+                resultados.append({
+                    'linhas': n,
+                    'cenario': cenario,
+                    'termo': termo,
+                    'trigramas': busca.trigramas_disponiveis(),
+                    'resultados': len(nova(termo)),
+                    'busca_p50_ms': round(percentil(nova_ms, 50), 2),
+                    'busca_p95_ms': round(percentil(nova_ms, 95), 2),
+                    'icontains_p50_ms': round(percentil(antiga_ms, 50), 2),
+                })
+    return resultados
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--linhas', type=int, nargs='+', default=[100000, 1000000])
+    parser.add_argument('--repeticoes', type=int, default=50)
+    args = parser.parse_args()
+
+    configurar_django()
+    imprimir(executar(args.linhas, args.repeticoes))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,109 @@
+"""Latência por pedido com e sem reutilização de conexões à base de dados.
+
+    python -m benchmarks.conexoes --pedidos 500
+
+Cada pedido passa pelo ``WSGIHandler`` do Django, com os sinais
+request_started/request_finished que abrem e fecham as conexões, tal como
+num worker do gunicorn. Compara:
+
+- ``sem_reutilizacao``: CONN_MAX_AGE=0, uma conexão nova por pedido (o
+  comportamento por omissão);
+- ``persistente``: CONN_MAX_AGE=60 com CONN_HEALTH_CHECKS;
+- ``pool``: pool nativo do Django 5.1+/psycopg 3, se disponível.
+
+A cache das leituras fica desligada para que todos os pedidos consultem a base.
+"""
+import argparse
+import time
+from io import BytesIO
+
+from . import configurar_django, imprimir, percentil, semear
+
+
+def _environ(caminho):
+    return {
+        'REQUEST_METHOD': 'GET', 'PATH_INFO': caminho, 'QUERY_STRING': '', 'SERVER_NAME': 'testserver',
+        'SERVER_PORT': '80', 'HTTP_HOST': 'testserver', 'wsgi.url_scheme': 'http', 'wsgi.input': BytesIO(),
+        'wsgi.errors': BytesIO(), 'wsgi.multithread': False, 'wsgi.multiprocess': True,
+    }
+
+
+def _pedido(handler, caminho):
+    estado = []
+    corpo = b''.join(handler(_environ(caminho), lambda status, cabecalhos: estado.append(status)))
+    assert estado[0].startswith('200'), (estado, corpo[:200])
+
+
+def _configurar(cenario):
+    from django import VERSION
+    from django.db import connections
+
+    connections['default'].close()
+    configuracao = connections['default'].settings_dict
+    configuracao['OPTIONS'] = {key: value for key, value in configuracao.get('OPTIONS', {}).items() if key != 'pool'}
+    configuracao['CONN_MAX_AGE'] = 60 if cenario == 'persistente' else 0
+    configuracao['CONN_HEALTH_CHECKS'] = cenario == 'persistente'
+    if cenario == 'pool':
+        if VERSION < (5, 1) or configuracao['ENGINE'] != 'django.db.backends.postgresql':
+            return False
+        try:
+            import psycopg  # noqa: F401
+            import psycopg_pool  # noqa: F401
+        except ImportError:
+            return False
+        # É o último cenário: a primeira conexão cria o pool com esta configuração
+        configuracao['OPTIONS']['pool'] = {'min_size': 2, 'max_size': 4}
+    return True
+
+
+def executar(pedidos=500, linhas=1000):
+    from django.core.handlers.wsgi import WSGIHandler
+    from django.db import connection
+    from escolas import alteracoes
+    from escolas.models import Escola
+
+    semear(linhas)
+    alteracoes.registrar()
+    semeadas = list(Escola.objects.filter(nome__startswith='Escola Benchmark ').values_list('id', flat=True))
+    ids = semeadas[:100]
+    handler = WSGIHandler()
+    resultados = []
+    try:
+        for cenario in ('sem_reutilizacao', 'persistente', 'pool'):
+            if not _configurar(cenario):
+                resultados.append({'cenario': cenario, 'disponivel': False})
+                continue
+            _pedido(handler, f'/escolas/{ids[0]}/')
+            amostras = []
+            for i in range(pedidos):
+                inicio = time.perf_counter()
+                _pedido(handler, f'/escolas/{ids[i % len(ids)]}/')
+                amostras.append((time.perf_counter() - inicio) * 1000)
+            resultados.append({
+                'cenario': cenario,
+                'disponivel': True,
+                'pedidos': pedidos,
+                'p50_ms': round(percentil(amostras, 50), 3),
+                'p95_ms': round(percentil(amostras, 95), 3),
+                'media_ms': round(sum(amostras) / len(amostras), 3),
+            })
+    finally:
+        _configurar('sem_reutilizacao')
+        with connection.cursor() as cursor:
+            cursor.execute('DELETE FROM escolas_escola WHERE id = ANY(%s)', [semeadas])
+        alteracoes.registrar()
+    return resultados
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--pedidos', type=int, default=500)
+    parser.add_argument('--linhas', type=int, default=1000)
+    args = parser.parse_args()
+
+    configurar_django()
+    imprimir(executar(args.pedidos, args.linhas))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,72 @@
+"""Tamanho e tempo de codificação da listagem de escolas em cada formato.
+
+    python -m benchmarks.formatos --linhas 1000 10000 100000
+
+Para a tabela inteira (como em ``GET /escolas/``) mede, em cada formato
+(JSON, JSON colunar e MessagePack com o msgpack instalado) e com cada
+compressão (nenhuma, gzip e brotli com o pacote instalado), os bytes da
+resposta e o tempo de renderização + compressão. A consulta fica fora da
+medição. ``json_drf`` é o ``JSONRenderer`` do DRF, para referência.
+"""
+import argparse
+import time
+
+from . import configurar_django, imprimir, percentil, semear, transacao_descartavel
+
+
+def formatos():
+    from rest_framework.renderers import JSONRenderer
+    from escolas.renderers import RENDERERS
+
+    return {'json_drf': JSONRenderer(), **{renderer.format: renderer() for renderer in RENDERERS}}
+
+
+def compressoes():
+    from escolas.compressao import brotli, comprimir
+
+    return {
+        'nenhuma': lambda conteudo: conteudo,
+        'gzip': lambda conteudo: comprimir(conteudo, 'gzip'),
+        **({'br': lambda conteudo: comprimir(conteudo, 'br')} if brotli else {}),
+    }
+
+
+def executar(linhas=(1000, 10000, 100000), repeticoes=5):
+    from escolas.models import Escola
+    from escolas.serializers import escola_leitura
+
+    resultados = []
+    for n in linhas:
+        with transacao_descartavel():
+            semear(n)
+            data = escola_leitura.data(escola_leitura.valores(Escola.objects.all()))
+        for formato, renderer in formatos().items():
+            for compressao, comprimir in compressoes().items():
+                amostras = []
+                for _ in range(repeticoes):
+                    inicio = time.perf_counter()
+                    conteudo = comprimir(renderer.render(data))
+                    amostras.append((time.perf_counter() - inicio) * 1000)
+                resultados.append({
+                    'linhas': n,
+                    'formato': formato,
+                    'compressao': compressao,
+                    'bytes': len(conteudo),
+                    'bytes_por_escola': round(len(conteudo) / n, 1),
+                    'p50_ms': round(percentil(amostras, 50), 2),
+                })
+    return resultados
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--linhas', type=int, nargs='+', default=[1000, 10000, 100000])
+    parser.add_argument('--repeticoes', type=int, default=5)
+    args = parser.parse_args()
+
+    configurar_django()
+    imprimir(executar(args.linhas, args.repeticoes))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,122 @@
+"""Débito e memória de pico da importação de escolas.
+
+    python -m benchmarks.importacao --linhas 10000 100000 --formato xlsx csv
+
+Para cada tamanho gera um arquivo temporário, importa-o pelo caminho em blocos
+(``ler_blocos`` + ``importar_blocos``) e, com ``--comparar-pandas``, também
+pelo caminho antigo que lê o arquivo inteiro com ``pd.read_excel``. A memória
+de pico é medida com ``tracemalloc`` (heap Python, incluindo numpy/pandas);
+como o ``tracemalloc`` abranda a execução, ``--sem-memoria`` mede só o débito.
+"""
+import argparse
+import csv
+import os
+import tempfile
+from contextlib import contextmanager
+from io import BytesIO
+import time
+import tracemalloc
+
+from . import configurar_django, imprimir, transacao_descartavel
+
+
+@contextmanager
+def gerar_arquivo(linhas, formato, prefixo='Escola Benchmark'):
+    """Caminho de um arquivo temporário com ``linhas`` escolas, apagado à saída do bloco."""
+    with tempfile.TemporaryDirectory(prefix='benchmark-') as pasta:
+        caminho = os.path.join(pasta, f'escolas.{formato}')
+        _escrever_arquivo(caminho, linhas, formato, prefixo)
+        yield caminho
+
+
+def _escrever_arquivo(caminho, linhas, formato, prefixo):
+    cabecalho = ['nome', 'email', 'numero_salas', 'provincia']
+    dados = (
+        [f'{prefixo} {i}', f'escola{i}@benchmark.ao', i % 40 + 1, 'Luanda,Bengo' if i % 3 else 'Huíla']
+        for i in range(linhas)
+    )
+    if formato == 'csv':
+        with open(caminho, 'w', newline='', encoding='utf-8') as saida:
+            escritor = csv.writer(saida)
+            escritor.writerow(cabecalho)
+            escritor.writerows(dados)
+    else:
+        from openpyxl import Workbook
+
+        workbook = Workbook(write_only=True)
+        folha = workbook.create_sheet()
+        folha.append(cabecalho)
+        for linha in dados:
+            folha.append(linha)
+        workbook.save(caminho)
+
+
+def medir(funcao, memoria=True):
+    if memoria:
+        tracemalloc.start()
+    inicio = time.perf_counter()
+    with transacao_descartavel():
+        resultado = funcao()
+    duracao = time.perf_counter() - inicio
+    pico = None
+    if memoria:
+        _, pico = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+    return resultado, duracao, pico
+
+
+def executar(linhas=(10000,), formatos=('xlsx',), comparar_pandas=False, batch_size=None, memoria=True):
+    resultados = []
+    for formato in formatos:
+        for n in linhas:
+            with gerar_arquivo(n, formato) as caminho:
+                resultados.extend(_medir_modos(caminho, n, formato, comparar_pandas, batch_size, memoria))
+    return resultados
+
+
+def _medir_modos(caminho, n, formato, comparar_pandas, batch_size, memoria):
+    from escolas.importacao import importar_blocos, importar_dataframe, ler_blocos
+
+    def blocos():
+        with open(caminho, 'rb') as arquivo:
+            return importar_blocos(ler_blocos(arquivo, formato, batch_size))
+
+    def pandas():
+        import pandas as pd
+
+        if formato == 'csv':
+            return importar_dataframe(pd.read_csv(caminho))
+        with open(caminho, 'rb') as arquivo:
+            return importar_dataframe(pd.read_excel(BytesIO(arquivo.read())))
+
+    modos = {'blocos': blocos, **({'pandas': pandas} if comparar_pandas else {})}
+    resultados = []
+    for modo, funcao in modos.items():
+        resultado, duracao, pico = medir(funcao, memoria)
+        resultados.append({
+            'formato': formato,
+            'modo': modo,
+            'linhas': n,
+            'inseridas': resultado.inseridas,
+            'segundos': round(duracao, 3),
+            'linhas_por_segundo': round(n / duracao),
+            'memoria_pico_mb': round(pico / 2**20, 1) if pico is not None else None,
+        })
+    return resultados
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--linhas', type=int, nargs='+', default=[10000])
+    parser.add_argument('--formato', nargs='+', choices=['xlsx', 'csv'], default=['xlsx'])
+    parser.add_argument('--batch-size', type=int)
+    parser.add_argument('--comparar-pandas', action='store_true')
+    parser.add_argument('--sem-memoria', action='store_true')
+    args = parser.parse_args()
+
+    configurar_django()
+    imprimir(executar(args.linhas, args.formato, args.comparar_pandas, args.batch_size, not args.sem_memoria))
+
+
+if __name__ == '__main__':
+    main()
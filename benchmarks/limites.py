@@ -0,0 +1,116 @@
+"""Latência das leituras normais com um cliente a inundar as rotas caras.
+
+    python -m benchmarks.limites --abusivos 16 --normais 4 --duracao 10
+
+Arranca o ``servidor.sh`` (SERVIDOR=wsgi) com e sem ``ESCOLAS_LIMITES`` e
+corre ao mesmo tempo ``--abusivos`` threads de um só cliente a pedir
+``filter_by_provincia`` com todas as províncias e ``--normais`` clientes,
+cada um com o seu ``X-Forwarded-For`` (o servidor corre com
+``NUM_PROXIES=1``, como atrás de um proxy), a ler escolas (``/escolas/{id}/``)
+a ~2 pedidos por segundo. Mede p50/p99 dos clientes normais e quantos
+pedidos do cliente abusivo foram servidos ou recusados (429/503).
+"""
+import argparse
+import http.client
+import json
+import random
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from . import PROVINCIAS, configurar_django, imprimir, percentil, semear
+from .servidor import _arrancar
+
+ABUSIVO = ('POST', ['/escolas/filter_by_provincia/'], json.dumps({'provincias': PROVINCIAS}))
+
+
+def _cliente(porta, pedido, clientes, threads, intervalo, duracao):
+    """Corre num processo à parte; devolve latências (ms) e contagens por estado."""
+    metodo, caminhos, corpo = pedido
+    latencias, estados = [], {}
+    lock = threading.Lock()
+    fim = time.monotonic() + duracao
+
+    def ciclo(cliente):
+        conexao = http.client.HTTPConnection('127.0.0.1', porta, timeout=60)
+        cabecalhos = {'X-Forwarded-For': cliente, 'Content-Type': 'application/json'}
+        while time.monotonic() < fim:
+            inicio = time.perf_counter()
+            try:
+                conexao.request(metodo, random.choice(caminhos), body=corpo, headers=cabecalhos)
+                resposta = conexao.getresponse()
+                resposta.read()
+                estado = resposta.status
+            except (OSError, http.client.HTTPException):
+                conexao.close()
+                estado = 'erro'
+            with lock:
+                estados[estado] = estados.get(estado, 0) + 1
+                if estado == 200:
+                    latencias.append((time.perf_counter() - inicio) * 1000)
+            time.sleep(intervalo)
+
+    trabalhadores = [threading.Thread(target=ciclo, args=(clientes[i % len(clientes)],)) for i in range(threads)]
+    for trabalhador in trabalhadores:
+        trabalhador.start()
+    for trabalhador in trabalhadores:
+        trabalhador.join()
+    return latencias, estados
+
+
+def executar(abusivos=16, normais=4, linhas=10000, duracao=10, workers=2, porta=8766):
+    from django.db import connection
+    from escolas import alteracoes
+    from escolas.models import Escola
+
+    semear(linhas)
+    alteracoes.registrar()
+    ids = list(Escola.objects.filter(nome__startswith='Escola Benchmark ').values_list('id', flat=True))
+    resultados = []
+    try:
+        for limites in ('0', '1'):
+            # Os baldes precisam da cache (partilhada pelos workers), mas não as leituras.
+            # Threads por worker: sem elas o compartimento de cada processo é trivial
+            servidor = _arrancar('wsgi', porta, workers, True, ESCOLAS_LIMITES=limites, ESCOLAS_CACHE_TTL='0',
+                                 WEB_THREADS='8', NUM_PROXIES='1')
+            try:
+                with ProcessPoolExecutor(2) as executor:
+                    abuso = executor.submit(_cliente, porta, ABUSIVO, ['10.0.0.1'], abusivos, 0, duracao)
+                    normal = executor.submit(
+                        _cliente, porta, ('GET', [f'/escolas/{pk}/' for pk in ids], None), [f'10.0.1.{i}' for i in range(normais)], normais, 0.5, duracao,
+                    )
+                    latencias, estados = normal.result()
+                    _, estados_abuso = abuso.result()
+                resultados.append({
+                    'limites': limites == '1',
+                    'normais_p50_ms': round(percentil(latencias, 50), 2) if latencias else None,
+                    'normais_p99_ms': round(percentil(latencias, 99), 2) if latencias else None,
+                    'normais_estados': estados,
+                    'abusivo_estados': estados_abuso,
+                })
+            finally:
+                servidor.terminate()
+                servidor.wait()
+    finally:
+        with connection.cursor() as cursor:
+            cursor.execute('DELETE FROM escolas_escola WHERE id = ANY(%s)', [ids])
+        alteracoes.registrar()
+    return resultados
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--abusivos', type=int, default=16)
+    parser.add_argument('--normais', type=int, default=4)
+    parser.add_argument('--linhas', type=int, default=10000)
+    parser.add_argument('--duracao', type=float, default=10)
+    parser.add_argument('--workers', type=int, default=2)
+    parser.add_argument('--porta', type=int, default=8766)
+    args = parser.parse_args()
+
+    configurar_django()
+    imprimir(executar(args.abusivos, args.normais, args.linhas, args.duracao, args.workers, args.porta))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,81 @@
+"""Escrita em lote: N pedidos POST /escolas/ vs. um único POST /escolas/bulk/.
+
+    python -m benchmarks.lote --operacoes 100 1000 5000
+
+Os dois caminhos passam pela view completa (parsing, validação, escrita,
+invalidação da cache) e criam as mesmas escolas; cada medição é desfeita no
+fim.
+"""
+import argparse
+import json
+import time
+
+from . import PROVINCIAS, configurar_django, imprimir, transacao_descartavel
+
+
+def _escolas(n):
+    return [
+        {
+            'nome': f'Escola Lote {i:07d}',
+            'email': f'escola{i}@exemplo.ao',
+            'numero_salas': i % 40 + 1,
+            'provincia': [PROVINCIAS[i % len(PROVINCIAS)]],
+        }
+        for i in range(n)
+    ]
+
+
+def _pedido(view, dados, **kwargs):
+    from rest_framework.test import APIRequestFactory
+
+    request = APIRequestFactory().post('/escolas/', json.dumps(dados), content_type='application/json', **kwargs)
+    resposta = view(request)
+    resposta.render()
+    return resposta
+
+
+def individual(escolas):
+    from escolas.views import EscolaViewSet
+
+    view = EscolaViewSet.as_view({'post': 'create'})
+    for escola in escolas:
+        assert _pedido(view, escola).status_code == 201
+
+
+def lote(escolas):
+    from escolas.views import EscolaViewSet
+
+    view = EscolaViewSet.as_view({'post': 'bulk'})
+    assert _pedido(view, [{'op': 'create', 'data': escola} for escola in escolas]).status_code == 200
+
+
+def executar(operacoes=(100, 1000, 5000)):
+    resultados = []
+    for n in operacoes:
+        escolas = _escolas(n)
+        tempos = {}
+        for nome, funcao in (('individual', individual), ('lote', lote)):
+            with transacao_descartavel():
+                inicio = time.perf_counter()
+                funcao(escolas)
+                tempos[nome] = time.perf_counter() - inicio
+        resultados.append({
+            'operacoes': n,
+            'individual_ops_s': round(n / tempos['individual']),
+            'lote_ops_s': round(n / tempos['lote']),
+            'aceleracao': round(tempos['individual'] / tempos['lote'], 1),
+        })
+    return resultados
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--operacoes', type=int, nargs='+', default=[100, 1000, 5000])
+    args = parser.parse_args()
+
+    configurar_django()
+    imprimir(executar(args.operacoes))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,77 @@
+"""Custo da instrumentação dos pedidos (escolas/metricas.py).
+
+    python -m benchmarks.metricas --pedidos 1000
+
+Mede GET /escolas/{id}/ e GET /escolas/?page_size=50 pelo ``WSGIHandler``
+com ``ESCOLAS_METRICS_SAMPLE_RATE`` a 0, 0.01 e 1, e mostra o cabeçalho
+Server-Timing de um pedido medido. A cache das leituras fica desligada e
+a conexão não é fechada entre pedidos (ver ``benchmarks.conexoes``), para as
+escolas semeadas ficarem na transação descartável.
+"""
+import argparse
+import time
+
+from . import configurar_django, imprimir, percentil, semear, transacao_descartavel
+from .conexoes import _environ
+
+TAXAS = (0, 0.01, 1)
+
+
+def _pedido(handler, caminho):
+    cabecalhos = {}
+    environ = _environ(caminho.split('?')[0])
+    environ['QUERY_STRING'] = caminho.partition('?')[2]
+    b''.join(handler(environ, lambda status, lista: cabecalhos.update(lista)))
+    return cabecalhos
+
+
+def executar(pedidos=1000, linhas=1000):
+    from django.conf import settings
+    from django.core.handlers.wsgi import WSGIHandler
+    from django.core.signals import request_finished, request_started
+    from django.db import close_old_connections
+    from escolas.models import Escola
+
+    request_started.disconnect(close_old_connections)
+    request_finished.disconnect(close_old_connections)
+
+    resultados = []
+    with transacao_descartavel():
+        semear(linhas)
+        ids = list(Escola.objects.filter(nome__startswith='Escola Benchmark ').values_list('id', flat=True)[:100])
+        endpoints = {
+            'retrieve': lambda i: f'/escolas/{ids[i % len(ids)]}/',
+            'lista': lambda i: '/escolas/?page_size=50',
+        }
+        handler = WSGIHandler()
+        for endpoint, caminho in endpoints.items():
+            for taxa in TAXAS:
+                settings.ESCOLAS_METRICS_SAMPLE_RATE = taxa
+                exemplo = _pedido(handler, caminho(0))
+                amostras = []
+                for i in range(pedidos):
+                    inicio = time.perf_counter()
+                    _pedido(handler, caminho(i))
+                    amostras.append((time.perf_counter() - inicio) * 1000)
+                resultados.append({
+                    'endpoint': endpoint,
+                    'amostragem': taxa,
+                    'p50_ms': round(percentil(amostras, 50), 3),
+                    'media_ms': round(sum(amostras) / len(amostras), 3),
+                    'server_timing': exemplo.get('Server-Timing'),
+                })
+    return resultados
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--pedidos', type=int, default=1000)
+    parser.add_argument('--linhas', type=int, default=1000)
+    args = parser.parse_args()
+
+    configurar_django()
+    imprimir(executar(args.pedidos, args.linhas))
+
+
+if __name__ == '__main__':
+    main()
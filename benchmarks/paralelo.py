@@ -0,0 +1,106 @@
+"""Importação de um livro com várias folhas num processo e em vários.
+
+    python -m benchmarks.paralelo --folhas 8 --linhas 20000 --processos 1 2 4
+    python -m benchmarks.paralelo --formato csv --folhas 8 --linhas 20000
+
+Gera um XLSX com ``--folhas`` folhas de ``--linhas`` escolas cada (ou, com
+``--formato csv``, um CSV com as mesmas linhas, dividido em intervalos de
+``--linhas``) e mede o tempo de parede da importação com 1 processo
+(``ler_blocos`` + ``importar_linhas_novas``, como sem
+``ESCOLAS_IMPORT_PROCESSOS``) e com cada número de processos de
+``--processos`` (``importar_em_paralelo``). Os
+processos fazem commit, por isso as escolas importadas são apagadas no fim
+de cada medição. O ganho para de crescer com o número de núcleos ou quando
+a base de dados deixa de aceitar mais escritas em paralelo.
+"""
+import argparse
+import os
+import tempfile
+import time
+from contextlib import contextmanager
+
+from . import configurar_django, imprimir
+
+PREFIXO = 'Escola Paralela'
+
+
+@contextmanager
+def gerar_livro(folhas, linhas):
+    from openpyxl import Workbook
+
+    from escolas.management.commands.seed_escolas import PESOS_PROVINCIAS
+
+    workbook = Workbook(write_only=True)
+    for numero, provincia in zip(range(folhas), PESOS_PROVINCIAS):
+        folha = workbook.create_sheet(provincia)
+        folha.append(['nome', 'email', 'numero_salas', 'provincia'])
+        for i in range(linhas):
+            folha.append([f'{PREFIXO} {numero}-{i}', f'escola{numero}.{i}@paralela.ao', i % 40 + 1, provincia])
+    with tempfile.TemporaryDirectory(prefix='benchmark-') as pasta:
+        caminho = os.path.join(pasta, 'escolas.xlsx')
+        workbook.save(caminho)
+        yield caminho
+
+
+def _apagar():
+    from escolas import alteracoes
+    from escolas.models import Escola
+
+    Escola.objects.filter(nome__startswith=f'{PREFIXO} ').delete()
+    alteracoes.registrar()
+
+
+def executar(folhas=8, linhas=20000, processos=(1, 2, 4), formato='xlsx'):
+    from django.test import override_settings
+
+    from escolas.historico import importar_linhas_novas
+    from escolas.importacao import ResultadoImportacao, ler_blocos
+    from escolas.paralelo import importar_em_paralelo
+
+    from .importacao import gerar_arquivo
+
+    if formato == 'csv':
+        gerado = gerar_arquivo(folhas * linhas, 'csv', prefixo=PREFIXO)
+    else:
+        gerado = gerar_livro(folhas, linhas)
+    resultados = []
+    with gerado as caminho:
+        try:
+            for n in processos:
+                _apagar()
+                inicio = time.perf_counter()
+                with open(caminho, 'rb') as arquivo:
+                    if n > 1:
+                        with override_settings(ESCOLAS_IMPORT_LINHAS_POR_PARTE=linhas):
+                            resultado = importar_em_paralelo(arquivo, formato, n)
+                    else:
+                        resultado = ResultadoImportacao()
+                        importar_linhas_novas(ler_blocos(arquivo, formato, folhas=resultado.folhas), resultado)
+                duracao = time.perf_counter() - inicio
+                resultados.append({
+                    'formato': formato,
+                    'processos': n,
+                    'linhas': folhas * linhas,
+                    'inseridas': resultado.inseridas,
+                    'segundos': round(duracao, 2),
+                    'linhas_por_segundo': round(folhas * linhas / duracao),
+                })
+        finally:
+            _apagar()
+    return resultados
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--folhas', type=int, default=8)
+    parser.add_argument('--linhas', type=int, default=20000, help="Escolas por folha.")
+    parser.add_argument('--processos', type=int, nargs='+', default=[1, 2, 4])
+    parser.add_argument('--formato', default='xlsx', choices=['xlsx', 'csv'])
+    args = parser.parse_args()
+
+    configurar_django()
+    imprimir(executar(args.folhas, args.linhas, args.processos, args.formato))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,205 @@
+"""Latência do filtro por província em função do tamanho da tabela.
+
+    python -m benchmarks.provincias --linhas 1000 10000 100000 --provincias Luanda Huíla
+
+Compara a consulta antiga (um ``provincia__contains`` por província, unidos
+por OR, com as províncias disponíveis calculadas em Python) com a atual
+(``provincia__overlap`` servido pelo índice GIN e DISTINCT/unnest na base).
+O cenário ``estatisticas`` compara as contas por província feitas no
+cliente a partir da listagem completa com o agregado de /escolas/stats/.
+A versão ``normalizada`` é a atual com ``ESCOLAS_PROVINCIAS_NORMALIZADAS``:
+junções com as tabelas Provincia e EscolaProvincia em vez do array (com os
+triggers ligados, como pede essa opção).
+
+    python -m benchmarks.provincias --escrita --linhas 20000 100000
+
+Com ``--escrita`` mede o custo dos triggers nas escritas: linhas por
+segundo do COPY do ``seed_escolas`` e da importação de um CSV, com os
+triggers desligados (a omissão) e ligados.
+"""
+import argparse
+import io
+import json
+import time
+
+from . import configurar_django, imprimir, percentil, semear, transacao_descartavel
+
+
+def consulta_antiga(provincias):
+    from escolas.models import Escola
+
+    queryset = Escola.objects.none()
+    for provincia in provincias:
+        queryset |= Escola.objects.filter(provincia__contains=[provincia])
+    return queryset
+
+
+def consulta_atual(provincias):
+    from escolas.models import Escola
+    from escolas.provincias import filtrar_por_provincias
+
+    return filtrar_por_provincias(Escola.objects.all(), provincias)
+
+
+def endpoint_antigo(provincias):
+    from django.http import JsonResponse
+    from escolas.serializers import EscolaSerializer
+
+    escolas = EscolaSerializer(consulta_antiga(provincias), many=True).data
+    provincias_disponiveis = list(set(p for escola in escolas for p in escola['provincia']))
+    return JsonResponse({'escolas': escolas, 'provincias_disponiveis': provincias_disponiveis})
+
+
+def endpoint_atual(provincias):
+    from escolas.views import EscolaViewSet
+    from rest_framework.test import APIRequestFactory
+
+    request = APIRequestFactory().post('/escolas/filter_by_provincia/', {'provincias': provincias}, format='json')
+    return EscolaViewSet.as_view({'post': 'filter_by_provincia'})(request)
+
+
+def provincias_antigas(provincias):
+    from escolas.serializers import EscolaSerializer
+
+    escolas = EscolaSerializer(consulta_antiga(provincias), many=True).data
+    return set(p for escola in escolas for p in escola['provincia'])
+
+
+def provincias_atuais(provincias):
+    from escolas.provincias import provincias_distintas
+
+    return list(provincias_distintas(consulta_atual(provincias)))
+
+
+def estatisticas_cliente():
+    from escolas.models import Escola
+    from escolas.renderers import EscolaJSONRenderer
+    from escolas.serializers import escola_leitura
+
+    # O que um dashboard fazia: descarregar /escolas/ e agregar do seu lado
+    escolas = json.loads(EscolaJSONRenderer().render(escola_leitura.data(escola_leitura.valores(Escola.objects.all()))))
+    salas = {}
+    for escola in escolas:
+        for provincia in set(escola['provincia']):
+            salas.setdefault(provincia, []).append(escola['numero_salas'])
+    return {provincia: (len(valores), sum(valores), min(valores), max(valores)) for provincia, valores in salas.items()}
+
+
+def estatisticas_base():
+    from escolas import estatisticas
+
+    return estatisticas.por_provincia()
+
+
+CENARIOS = {
+    # Só a consulta: ids das escolas filtradas
+    'consulta': (
+        lambda p: list(consulta_antiga(p).values_list('id', flat=True)),
+        lambda p: list(consulta_atual(p).values_list('id', flat=True)),
+    ),
+    # Lista de províncias disponíveis (em Python sobre os dicts serializados vs. na base)
+    'provincias_disponiveis': (provincias_antigas, provincias_atuais),
+    'endpoint': (endpoint_antigo, endpoint_atual),
+    'estatisticas': (lambda p: estatisticas_cliente(), lambda p: estatisticas_base()),
+}
+
+
+def medir(funcao, repeticoes):
+    funcao()
+    amostras = []
+    for _ in range(repeticoes):
+        inicio = time.perf_counter()
+        funcao()
+        amostras.append((time.perf_counter() - inicio) * 1000)
+    return {'p50_ms': round(percentil(amostras, 50), 2), 'p95_ms': round(percentil(amostras, 95), 2)}
+
+
+def normalizada(funcao):
+    from django.test import override_settings
+
+    def medida(provincias):
+        with override_settings(ESCOLAS_PROVINCIAS_NORMALIZADAS=True):
+            return funcao(provincias)
+    return medida
+
+
+def executar(linhas=(1000, 10000), provincias=('Huíla', 'Namibe'), repeticoes=10):
+    from escolas.provincias import ligar
+
+    resultados = []
+    for n in linhas:
+        with transacao_descartavel():
+            # As tabelas normalizadas são preenchidas pelos triggers
+            ligar()
+            semear(n)
+            for cenario, (antigo, atual) in CENARIOS.items():
+                versoes = (('antigo', antigo), ('atual', atual), ('normalizada', normalizada(atual)))
+                for versao, funcao in versoes:
+                    resultados.append({
+                        'linhas': n,
+                        'cenario': cenario,
+                        'versao': versao,
+                        'provincias': list(provincias),
+                        **medir(lambda: funcao(list(provincias)), repeticoes),
+                    })
+    return resultados
+
+
+def _seed(n):
+    from django.core.management import call_command
+
+    call_command('seed_escolas', n, indices='manter', sem_vacuum=True, stdout=io.StringIO())
+
+
+def _importar_csv(caminho):
+    from escolas.importacao import importar_blocos, ler_blocos
+
+    with open(caminho, 'rb') as arquivo:
+        importar_blocos(ler_blocos(arquivo, 'csv'))
+
+
+def escrita(linhas=(20000,), repeticoes=3):
+    """Linhas por segundo das escritas com e sem os triggers das províncias."""
+    from escolas.provincias import ligar
+
+    from .importacao import gerar_arquivo
+
+    resultados = []
+    for n in linhas:
+        with gerar_arquivo(n, 'csv') as caminho:
+            for cenario, funcao in (('seed_copy', lambda: _seed(n)), ('importacao_csv', lambda: _importar_csv(caminho))):
+                for triggers in (False, True):
+                    amostras = []
+                    for _ in range(repeticoes):
+                        with transacao_descartavel():
+                            if triggers:
+                                ligar()
+                            inicio = time.perf_counter()
+                            funcao()
+                            amostras.append(time.perf_counter() - inicio)
+                    resultados.append({
+                        'linhas': n,
+                        'cenario': cenario,
+                        'triggers': triggers,
+                        'linhas_por_segundo': round(n / percentil(amostras, 50)),
+                    })
+    return resultados
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--linhas', type=int, nargs='+', default=[1000, 10000, 100000])
+    parser.add_argument('--provincias', nargs='+', default=['Huíla', 'Namibe'])
+    parser.add_argument('--repeticoes', type=int, default=10)
+    parser.add_argument('--escrita', action='store_true', help="Mede o custo dos triggers nas escritas.")
+    args = parser.parse_args()
+
+    configurar_django()
+    if args.escrita:
+        imprimir(escrita(args.linhas, args.repeticoes))
+    else:
+        imprimir(executar(args.linhas, args.provincias, args.repeticoes))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,68 @@
+"""Serialização da listagem de escolas: EscolaSerializer vs. leitura rápida.
+
+    python -m benchmarks.serializacao --linhas 1000 10000 100000
+
+Mede consulta + serialização + renderização JSON da tabela inteira pelos dois
+caminhos: ``EscolaSerializer(many=True)`` com o ``JSONRenderer`` do DRF e
+``escola_leitura`` (``.values()``) com o ``EscolaJSONRenderer``.
+"""
+import argparse
+import time
+
+from . import configurar_django, imprimir, percentil, semear, transacao_descartavel
+
+
+def serializer_drf():
+    from escolas.models import Escola
+    from escolas.serializers import EscolaSerializer
+    from rest_framework.renderers import JSONRenderer
+
+    return JSONRenderer().render(EscolaSerializer(Escola.objects.all(), many=True).data)
+
+
+def leitura_rapida():
+    from escolas.models import Escola
+    from escolas.renderers import EscolaJSONRenderer
+    from escolas.serializers import escola_leitura
+
+    return EscolaJSONRenderer().render(escola_leitura.data(escola_leitura.valores(Escola.objects.all())))
+
+
+def executar(linhas=(1000, 10000, 100000), repeticoes=5):
+    from escolas.renderers import orjson
+
+    resultados = []
+    for n in linhas:
+        with transacao_descartavel():
+            semear(n)
+            assert serializer_drf() == leitura_rapida()
+            tempos = {}
+            for nome, funcao in (('serializer_drf', serializer_drf), ('leitura_rapida', leitura_rapida)):
+                amostras = []
+                for _ in range(repeticoes):
+                    inicio = time.perf_counter()
+                    funcao()
+                    amostras.append((time.perf_counter() - inicio) * 1000)
+                tempos[nome] = percentil(amostras, 50)
+            resultados.append({
+                'linhas': n,
+                'orjson': orjson is not None,
+                'serializer_drf_ms': round(tempos['serializer_drf'], 2),
+                'leitura_rapida_ms': round(tempos['leitura_rapida'], 2),
+                'aceleracao': round(tempos['serializer_drf'] / tempos['leitura_rapida'], 1),
+            })
+    return resultados
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--linhas', type=int, nargs='+', default=[1000, 10000, 100000])
+    parser.add_argument('--repeticoes', type=int, default=5)
+    args = parser.parse_args()
+
+    configurar_django()
+    imprimir(executar(args.linhas, args.repeticoes))
+
+
+if __name__ == '__main__':
+    main()
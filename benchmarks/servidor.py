@@ -0,0 +1,159 @@
+"""Teste de carga: servidor WSGI (vistas síncronas) vs. ASGI (vistas assíncronas).
+
+    python -m benchmarks.servidor --modos wsgi asgi --clientes 1 16 64 --duracao 10
+
+Arranca o ``servidor.sh`` em cada modo (gunicorn, ou gunicorn + uvicorn com
+``ESCOLAS_ASYNC_VIEWS=1``) numa porta local e mede, com clientes HTTP
+concorrentes noutros processos, pedidos por segundo e latências p50/p99.
+Ao contrário dos outros benchmarks, as escolas semeadas são gravadas (os
+servidores são outros processos) e apagadas no fim. Sem ``--cache`` o
+servidor corre com CACHE_BACKEND=dummy e cada pedido vai à base de dados.
+"""
+import argparse
+import http.client
+import os
+import random
+import socket
+import subprocess
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+from . import configurar_django, imprimir, percentil, semear
+
+RAIZ = Path(__file__).resolve().parent.parent
+
+ENDPOINTS = {
+    'retrieve': lambda ids: f'/escolas/{random.choice(ids)}/',
+    'search': lambda ids: f'/escolas/search/?q=benchmark+{random.choice(ids) % 1000}',
+    'lista': lambda ids: '/escolas/?page_size=50',
+}
+
+
+def _esperar_porta(porta, processo, limite=30):
+    fim = time.monotonic() + limite
+    while time.monotonic() < fim:
+        if processo.poll() is not None:
+            raise RuntimeError(f'O servidor terminou com o código {processo.returncode}')
+        try:
+            socket.create_connection(('127.0.0.1', porta), timeout=0.5).close()
+            return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError(f'O servidor não abriu a porta {porta}')
+
+
+def _arrancar(modo, porta, workers, cache, **extra):
+    env = {
+        **os.environ,
+        'SERVIDOR': modo,
+        'WEB_BIND': f'127.0.0.1:{porta}',
+        'WEB_WORKERS': str(workers),
+        'WEB_ACCESS_LOG': '',
+        # Todos os clientes vêm de 127.0.0.1: sem os limites por cliente
+        'ESCOLAS_LIMITES': '0',
+        **extra,
+    }
+    if not cache:
+        env['CACHE_BACKEND'] = 'dummy'
+    processo = subprocess.Popen(['sh', 'servidor.sh'], cwd=RAIZ, env=env, stdout=subprocess.DEVNULL)
+    _esperar_porta(porta, processo)
+    return processo
+
+
+def _cliente(porta, endpoint, ids, threads, duracao):
+    """Corre num processo à parte: ``threads`` clientes em ciclo durante ``duracao`` s."""
+    latencias, erros = [], [0]
+    fim = time.monotonic() + duracao
+
+    def ciclo():
+        conexao = http.client.HTTPConnection('127.0.0.1', porta, timeout=30)
+        while time.monotonic() < fim:
+            inicio = time.perf_counter()
+            try:
+                conexao.request('GET', ENDPOINTS[endpoint](ids))
+                resposta = conexao.getresponse()
+                resposta.read()
+                if resposta.status != 200:
+                    erros[0] += 1
+            except (OSError, http.client.HTTPException):
+                erros[0] += 1
+                conexao.close()
+                continue
+            latencias.append((time.perf_counter() - inicio) * 1000)
+
+    trabalhadores = [threading.Thread(target=ciclo) for _ in range(threads)]
+    for trabalhador in trabalhadores:
+        trabalhador.start()
+    for trabalhador in trabalhadores:
+        trabalhador.join()
+    return latencias, erros[0]
+
+
+def carga(porta, endpoint, ids, clientes, duracao, processos):
+    processos = max(1, min(processos, clientes))
+    por_processo = [clientes // processos + (i < clientes % processos) for i in range(processos)]
+    with ProcessPoolExecutor(processos) as executor:
+        futuros = [executor.submit(_cliente, porta, endpoint, ids, n, duracao) for n in por_processo]
+        partes = [futuro.result() for futuro in futuros]
+    latencias = [latencia for parte, _ in partes for latencia in parte]
+    return {
+        'pedidos_s': round(len(latencias) / duracao, 1),
+        'p50_ms': round(percentil(latencias, 50), 2) if latencias else None,
+        'p99_ms': round(percentil(latencias, 99), 2) if latencias else None,
+        'erros': sum(erros for _, erros in partes),
+    }
+
+
+def executar(modos=('wsgi', 'asgi'), clientes=(1, 16, 64), endpoints=('retrieve', 'search'), linhas=10000,
+             duracao=10, workers=2, processos=4, cache=False, porta=8765):
+    from django.db import connection
+    from escolas import alteracoes
+    from escolas.models import Escola
+
+    semear(linhas)
+    alteracoes.registrar()
+    ids = list(Escola.objects.filter(nome__startswith='Escola Benchmark ').values_list('id', flat=True))
+    resultados = []
+    try:
+        for modo in modos:
+            servidor = _arrancar(modo, porta, workers, cache)
+            try:
+                for endpoint in endpoints:
+                    carga(porta, endpoint, ids, 1, 1, 1)  # aquecimento
+                    for n in clientes:
+                        resultados.append({
+                            'modo': modo, 'endpoint': endpoint, 'clientes': n, 'workers': workers,
+                            **carga(porta, endpoint, ids, n, duracao, processos),
+                        })
+            finally:
+                servidor.terminate()
+                servidor.wait()
+    finally:
+        with connection.cursor() as cursor:
+            cursor.execute('DELETE FROM escolas_escola WHERE id = ANY(%s)', [ids])
+        alteracoes.registrar()
+    return resultados
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--modos', nargs='+', default=['wsgi', 'asgi'], choices=['wsgi', 'asgi'])
+    parser.add_argument('--clientes', type=int, nargs='+', default=[1, 16, 64])
+    parser.add_argument('--endpoints', nargs='+', default=['retrieve', 'search'], choices=list(ENDPOINTS))
+    parser.add_argument('--linhas', type=int, default=10000)
+    parser.add_argument('--duracao', type=float, default=10)
+    parser.add_argument('--workers', type=int, default=2)
+    parser.add_argument('--processos', type=int, default=os.cpu_count() or 1, help='Processos de clientes HTTP.')
+    parser.add_argument('--cache', action='store_true', help='Mantém a cache das leituras no servidor.')
+    parser.add_argument('--porta', type=int, default=8765)
+    args = parser.parse_args()
+
+    configurar_django()
+    imprimir(executar(args.modos, args.clientes, args.endpoints, args.linhas, args.duracao, args.workers,
+                      args.processos, args.cache, args.porta))
+
+
+if __name__ == '__main__':
+    main()
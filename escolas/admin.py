@@ -1,5 +1,7 @@
 from django.contrib import admin
-from . models import Escola
+from . models import ArquivoImportado, Escola, Importacao
 
 # Register your models here.
-admin.site.register(Escola)
\ No newline at end of file
+admin.site.register(Escola)
+admin.site.register(Importacao)
+admin.site.register(ArquivoImportado)
\ No newline at end of file
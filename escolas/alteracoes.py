@@ -0,0 +1,61 @@
+import threading
+from contextlib import contextmanager
+
+from . import cache
+from .models import Escola, Versao
+
+_estado = threading.local()
+
+
+def registrar(pks=()):
+    """Regista uma escrita em ``Escola``.
+
+    Sobe a versão da tabela (ETag/Last-Modified das listagens) e invalida o
+    cache das listagens e das escolas ``pks``. Os caminhos que não disparam
+    ``post_save``/``post_delete`` (bulk_create, bulk_update, SQL) têm de a
+    chamar explicitamente.
+    """
+    pendentes = getattr(_estado, 'pks', None)
+    if pendentes is not None:
+        pendentes.update(pks)
+        return
+    Versao.incrementar(Escola._meta.db_table)
+    contagem = getattr(_estado, 'contagem', None)
+    if contagem is not None:
+        contagem.subidas += 1
+    cache.invalidar(pks)
+
+
+class Contagem:
+    subidas = 0
+
+
+@contextmanager
+def contar():
+    """Conta as subidas da versão feitas por esta thread dentro do bloco.
+
+    Com a versão lida antes do bloco, permite saber se mais alguém escreveu
+    em ``Escola`` entretanto (ver ``historico.importar_arquivo``).
+    """
+    anterior = getattr(_estado, 'contagem', None)
+    contagem = _estado.contagem = Contagem()
+    try:
+        yield contagem
+    finally:
+        _estado.contagem = anterior
+        if anterior is not None:
+            anterior.subidas += contagem.subidas
+
+
+@contextmanager
+def em_lote():
+    """Junta as escritas feitas dentro do bloco num único ``registrar``."""
+    if getattr(_estado, 'pks', None) is not None:
+        yield
+        return
+    _estado.pks = set()
+    try:
+        yield
+    finally:
+        pks, _estado.pks = _estado.pks, None
+        registrar(pks)
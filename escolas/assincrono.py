@@ -0,0 +1,170 @@
+"""Vistas assíncronas de leitura das escolas, para servir por ASGI.
+
+Com ``ESCOLAS_ASYNC_VIEWS`` ligado, os GET de /escolas/, /escolas/{id}/ e
+/escolas/search/ e o POST /escolas/filter_by_provincia/ passam por estas
+vistas. Cache, versão da tabela (ETag) e consultas usam as APIs assíncronas
+do Django (``aget``, ``async for``), e a resposta tem os mesmos bytes e
+cabeçalhos que a do EscolaViewSet, com as mesmas entradas de cache.
+
+Tudo o resto segue para o EscolaViewSet, executado numa thread pelo Django:
+os outros métodos das mesmas rotas, o browsable API (Accept: text/html ou
+``?format=``), os pedidos com erro e a paginação por cursor, que no DRF só
+existe síncrona. Uma vista assíncrona devolve ``None`` para delegar.
+"""
+import json
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.http import HttpResponse
+from django.urls import path
+from django.views.decorators.csrf import csrf_exempt
+from rest_framework.request import Request
+
+from . import busca, cache, condicional, limites, metricas
+from .models import Escola
+from .paginacao import BuscaPagination
+from .provincias import filtrar_por_provincias, provincias_distintas
+from .renderers import RENDERERS, EscolaJSONRenderer
+from .serializers import EscolaSerializer, escola_leitura
+from .views import EscolaViewSet
+
+METODOS = ('get', 'post', 'put', 'patch', 'delete', 'head', 'options')
+
+
+def _rota(acoes, detalhe, assincrona, metodo='GET'):
+    sincrona = EscolaViewSet.as_view(acoes, basename='escola', detail=detalhe)
+    # Os mesmos cabeçalhos que o APIView.finalize_response do DRF acrescenta
+    permitidos = [m for m in METODOS if m in acoes or m == 'options' or (m == 'head' and 'get' in acoes)]
+    cabecalhos = {'Allow': ', '.join(m.upper() for m in permitidos), 'Vary': 'Accept'}
+
+    @csrf_exempt
+    async def view(request, *args, **kwargs):
+        if request.method == metodo and _so_json(request):
+            response = await assincrona(request, *args, **kwargs)
+            if response is not None:
+                for cabecalho, valor in cabecalhos.items():
+                    response[cabecalho] = valor
+                return response
+        return await sync_to_async(sincrona)(request, *args, **kwargs)
+
+    return view
+
+
+def _so_json(request):
+    # A API navegável e os outros formatos (colunar, msgpack) ficam no EscolaViewSet
+    accept = request.headers.get('Accept', '')
+    return 'format' not in request.GET and not any(
+        tipo in accept for tipo in ('text/html', *(r.media_type for r in RENDERERS[1:]))
+    )
+
+
+def _paginada(request):
+    return settings.ESCOLAS_PAGE_SIZE or 'page_size' in request.GET or 'cursor' in request.GET
+
+
+def _json(data, headers):
+    with metricas.medir('serializacao'):
+        conteudo = EscolaJSONRenderer().render(data)
+    return HttpResponse(conteudo, content_type='application/json', headers=headers)
+
+
+async def lista(request):
+    etag, ultima_modificacao = await condicional.avalidadores_tabela('lista', request)
+    if condicional.nao_modificado(request, etag, ultima_modificacao):
+        return condicional.resposta_304(etag, ultima_modificacao)
+
+    chave = await cache.achave_consulta('lista', request)
+    data = await cache.aobter(chave)
+    if data is None:
+        if _paginada(request):
+            return None
+        with limites.ocupar(request):
+            data = escola_leitura.data([linha async for linha in escola_leitura.valores(Escola.objects.all())])
+        await cache.aguardar(chave, data)
+    return _json(data, condicional.cabecalhos(etag, ultima_modificacao))
+
+
+async def escola(request, pk):
+    chave = await cache.achave_escola(pk)
+    entrada = await cache.aobter(chave)
+    if entrada is None:
+        try:
+            instancia = await Escola.objects.aget(pk=pk)
+        except Escola.DoesNotExist:
+            return None
+        etag, ultima_modificacao = condicional.validadores_escola(instancia)
+        if condicional.nao_modificado(request, etag, ultima_modificacao):
+            return condicional.resposta_304(etag, ultima_modificacao)
+        entrada = (etag, ultima_modificacao, EscolaSerializer(instancia).data)
+        await cache.aguardar(chave, entrada)
+
+    etag, ultima_modificacao, data = entrada
+    if condicional.nao_modificado(request, etag, ultima_modificacao):
+        return condicional.resposta_304(etag, ultima_modificacao)
+    return _json(data, condicional.cabecalhos(etag, ultima_modificacao))
+
+
+async def filtro_provincias(request):
+    if request.content_type != 'application/json':
+        return None
+    try:
+        dados = json.loads(request.body)
+    except ValueError:
+        return None
+    provincias_desejadas = dados.get('provincias', []) if isinstance(dados, dict) else None
+    if not isinstance(provincias_desejadas, list) or not all(isinstance(p, str) for p in provincias_desejadas):
+        return None
+
+    provincias = sorted(set(provincias_desejadas))
+    etag, ultima_modificacao = await condicional.avalidadores_tabela('provincias', request, provincias=provincias)
+    if condicional.nao_modificado(request, etag, ultima_modificacao):
+        return condicional.resposta_304(etag, ultima_modificacao)
+
+    chave = await cache.achave_consulta('provincias', request, provincias=provincias)
+    resposta = await cache.aobter(chave)
+    if resposta is None:
+        if _paginada(request):
+            return None
+        queryset = filtrar_por_provincias(Escola.objects.all(), provincias_desejadas)
+        with limites.ocupar(request):
+            resposta = {
+                'escolas': escola_leitura.data([linha async for linha in escola_leitura.valores(queryset)]),
+                'provincias_disponiveis': [provincia async for provincia in provincias_distintas(queryset)],
+            }
+        await cache.aguardar(chave, resposta)
+    return _json(resposta, condicional.cabecalhos(etag, ultima_modificacao))
+
+
+async def pesquisa(request):
+    texto = request.GET.get('q', '')
+    if not busca.palavras(texto):
+        return None
+
+    etag, ultima_modificacao = await condicional.avalidadores_tabela('busca', request)
+    if condicional.nao_modificado(request, etag, ultima_modificacao):
+        return condicional.resposta_304(etag, ultima_modificacao)
+
+    chave = await cache.achave_consulta('busca', request)
+    data = await cache.aobter(chave)
+    if data is None:
+        with limites.ocupar(request):
+            # Consulta síncrona só na primeira vez; depois fica em memória
+            await sync_to_async(busca.trigramas_disponiveis)()
+            paginator = BuscaPagination()
+            pagina = await paginator.apaginate_queryset(escola_leitura.valores(busca.pesquisar(texto)), Request(request))
+            data = paginator.get_paginated_response(escola_leitura.data(pagina)).data
+        await cache.aguardar(chave, data)
+    return _json(data, condicional.cabecalhos(etag, ultima_modificacao))
+
+
+# Antes das rotas do router em labapp/urls.py, com os mesmos nomes
+urlpatterns = [
+    path('escolas/', _rota({'get': 'list', 'post': 'create'}, False, lista), name='escola-list'),
+    path('escolas/search/', _rota({'get': 'search'}, False, pesquisa), name='escola-search'),
+    path('escolas/filter_by_provincia/', _rota(
+        {'post': 'filter_by_provincia'}, False, filtro_provincias, metodo='POST'
+    ), name='escola-filter-by-provincia'),
+    path('escolas/<int:pk>/', _rota(
+        {'get': 'retrieve', 'put': 'update', 'patch': 'partial_update', 'delete': 'destroy'}, True, escola
+    ), name='escola-detail'),
+]
@@ -0,0 +1,59 @@
+"""Pesquisa de escolas por nome e e-mail (GET /escolas/search/?q=).
+
+Duas fontes de candidatos, ambas servidas por índices GIN:
+
+- ``busca``: tsvector gerado pela base de dados a partir do nome (peso A) e
+  do e-mail (peso B). As palavras completas de ``q`` são procuradas tal como
+  estão e a última como prefixo (pesquisa enquanto se escreve), por isso
+  "escola lua" encontra "Escola Primária de Luanda". Prefixos em todas as
+  palavras obrigariam o GIN a juntar as listas inteiras de palavras comuns
+  como "escola", em vez de saltar para as raras;
+- ``nome % q`` (pg_trgm), só quando a extensão está instalada: apanha nomes
+  mal escritos ("Escla Luamda").
+
+Os resultados são ordenados pela maior das duas pontuações e depois por
+nome.
+"""
+import re
+from functools import lru_cache
+
+from django.contrib.postgres.search import SearchQuery, SearchRank, TrigramSimilarity
+from django.db import connections
+from django.db.models import F, Q
+from django.db.models.functions import Greatest
+
+from .models import Escola
+
+# O parser do PostgreSQL também separa palavras no '_'
+PALAVRAS = re.compile(r'[^\W_]+')
+MAXIMO_PALAVRAS = 10
+TAMANHO_MAXIMO = 255
+
+
+def palavras(texto):
+    return PALAVRAS.findall(texto.lower())[:MAXIMO_PALAVRAS]
+
+
+@lru_cache(maxsize=None)
+def trigramas_disponiveis(alias='default'):
+    with connections[alias].cursor() as cursor:
+        cursor.execute("SELECT EXISTS (SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm')")
+        return cursor.fetchone()[0]
+
+
+def pesquisar(texto, queryset=None):
+    """Escolas que correspondem a ``texto``, da mais para a menos relevante."""
+    queryset = Escola.objects.all() if queryset is None else queryset
+    # As palavras só têm letras e dígitos, por isso podem ir entre aspas no tsquery
+    termos = [f"'{palavra}'" for palavra in palavras(texto)]
+    termos[-1] += ':*'
+    consulta = SearchQuery(' & '.join(termos), search_type='raw', config='simple')
+    condicao = Q(busca=consulta)
+    relevancia = SearchRank(F('busca'), consulta)
+
+    if trigramas_disponiveis():
+        texto = texto.strip()[:TAMANHO_MAXIMO]
+        condicao |= Q(nome__trigram_similar=texto)
+        relevancia = Greatest(relevancia, TrigramSimilarity('nome', texto))
+
+    return queryset.filter(condicao).annotate(relevancia=relevancia).order_by('-relevancia', 'nome', 'id')
@@ -0,0 +1,126 @@
+"""Cache das leituras de escolas sobre o cache framework do Django.
+
+As chaves das listagens levam um número de geração global e as de cada
+escola um número de versão próprio. Uma escrita incrementa a geração (e a
+versão das escolas afetadas) logo a seguir e outra vez no commit: o que um
+leitor tenha guardado entretanto a partir de dados antigos fica numa chave
+que já ninguém consulta, por isso nenhuma leitura feita depois de a escrita
+terminar vê dados desatualizados.
+
+As funções com prefixo ``a`` são as versões assíncronas, para as vistas
+de escolas/assincrono.py.
+
+Com o backend locmem cada processo tem o seu próprio cache. Os workers do
+gunicorn precisam de ver as mesmas gerações: o servidor.sh usa o backend de
+arquivos (CACHE_BACKEND=file) e o gunicorn.conf.py recusa o locmem com mais
+de um worker.
+"""
+import hashlib
+import json
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+
+CHAVE_GERACAO = 'escolas:geracao'
+
+
+def _cache():
+    return caches[settings.ESCOLAS_CACHE_ALIAS]
+
+
+def _inicial():
+    # Se a chave for descartada pelo LRU, recomeça num valor nunca usado
+    return time.time_ns()
+
+
+def _contador(chave):
+    cache = _cache()
+    valor = cache.get(chave)
+    if valor is None:
+        cache.add(chave, _inicial(), timeout=None)
+        valor = cache.get(chave)
+    return valor
+
+
+async def _acontador(chave):
+    cache = _cache()
+    valor = await cache.aget(chave)
+    if valor is None:
+        await cache.aadd(chave, _inicial(), timeout=None)
+        valor = await cache.aget(chave)
+    return valor
+
+
+def _incrementar(chaves):
+    cache = _cache()
+    for chave in chaves:
+        try:
+            cache.incr(chave)
+        except ValueError:
+            cache.set(chave, _inicial(), timeout=None)
+
+
+def _chave_versao(pk):
+    return f'escolas:versao:{pk}'
+
+
+def chave_escola(pk):
+    return f'escolas:escola:{pk}:{_contador(_chave_versao(pk))}'
+
+
+async def achave_escola(pk):
+    return f'escolas:escola:{pk}:{await _acontador(_chave_versao(pk))}'
+
+
+def resumo_consulta(request, **extra):
+    """Resumo (sha1) do pedido normalizado: host, caminho e parâmetros ordenados."""
+    parametros = {
+        'host': request.get_host(),
+        'path': request.path,
+        'query': sorted(request.GET.lists()),
+        **extra,
+    }
+    return hashlib.sha1(json.dumps(parametros, sort_keys=True, default=str).encode()).hexdigest()
+
+
+def chave_consulta(tipo, request, **extra):
+    """Chave de uma listagem: tipo, geração e parâmetros normalizados."""
+    return f'escolas:{tipo}:{_contador(CHAVE_GERACAO)}:{resumo_consulta(request, **extra)}'
+
+
+async def achave_consulta(tipo, request, **extra):
+    return f'escolas:{tipo}:{await _acontador(CHAVE_GERACAO)}:{resumo_consulta(request, **extra)}'
+
+
+def chave_tabela(tipo):
+    """Chave de um valor que só depende do estado da tabela inteira."""
+    return f'escolas:{tipo}:{_contador(CHAVE_GERACAO)}'
+
+
+async def achave_tabela(tipo):
+    return f'escolas:{tipo}:{await _acontador(CHAVE_GERACAO)}'
+
+
+def obter(chave):
+    return _cache().get(chave)
+
+
+async def aobter(chave):
+    return await _cache().aget(chave)
+
+
+def guardar(chave, valor):
+    _cache().set(chave, valor, settings.ESCOLAS_CACHE_TTL)
+
+
+async def aguardar(chave, valor):
+    await _cache().aset(chave, valor, settings.ESCOLAS_CACHE_TTL)
+
+
+def invalidar(pks=()):
+    """Invalida as listagens e as escolas ``pks``; chamar depois de cada escrita."""
+    chaves = [CHAVE_GERACAO] + [_chave_versao(pk) for pk in pks]
+    _incrementar(chaves)
+    transaction.on_commit(lambda: _incrementar(chaves))
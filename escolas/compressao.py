@@ -0,0 +1,175 @@
+"""Compressão das respostas (gzip ou brotli) acima de um tamanho mínimo.
+
+O ``CompressaoMiddleware`` comprime as respostas com pelo menos
+``ESCOLAS_COMPRESSAO_MINIMO`` bytes (0 desliga) quando o cliente as aceita
+(``Accept-Encoding``): com brotli se o cliente o aceitar e o pacote
+``brotli`` estiver instalado, senão com gzip. As respostas em streaming (a
+exportação) são comprimidas à medida que são enviadas. Numa listagem de
+escolas em JSON a maior parte dos bytes são as chaves repetidas de cada
+objeto, que ambos comprimem muito bem.
+
+Só os formatos da API são comprimidos assim (``TIPOS``). As páginas HTML
+(admin, API navegável) levam o token CSRF ao lado de texto do pedido e
+passam pelo ``GZipMiddleware`` do Django, que acrescenta bytes aleatórios a
+cada resposta contra o BREACH.
+
+Cada codificação tem o seu ETag forte, com a codificação no fim
+(``"<etag>-gzip"``, ``"<etag>-br"``), que ``condicional.nao_modificado``
+aceita. As respostas 304 levam o ETag na forma que o cliente enviou.
+"""
+import re
+import zlib
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.middleware.gzip import GZipMiddleware
+from django.utils.cache import patch_vary_headers
+from django.utils.http import parse_etags
+from django.utils.text import compress_sequence, compress_string
+
+from . import condicional, metricas
+
+try:
+    import brotli
+except ImportError:  # brotli é opcional
+    brotli = None
+
+TIPOS = (
+    'application/json',
+    'application/vnd.escolas.colunar+json',
+    'application/x-msgpack',
+    'application/x-ndjson',
+    'text/csv',
+)
+
+_SEM_QUALIDADE = re.compile(r';\s*q\s*=\s*0(\.0*)?\s*$')
+
+
+def aceites(accept_encoding):
+    """Codificações aceites pelo cliente (sem as que têm ``q=0``)."""
+    return {
+        parte.split(';')[0].strip().lower()
+        for parte in accept_encoding.split(',')
+        if parte.strip() and not _SEM_QUALIDADE.search(parte)
+    }
+
+
+def escolher(accept_encoding):
+    codificacoes = aceites(accept_encoding)
+    if brotli is not None and 'br' in codificacoes:
+        return 'br'
+    if 'gzip' in codificacoes:
+        return 'gzip'
+    return None
+
+
+def comprimir(conteudo, codificacao):
+    if codificacao == 'br':
+        return brotli.compress(conteudo, quality=settings.ESCOLAS_BROTLI_QUALIDADE)
+    return compress_string(conteudo)
+
+
+def _brotli_sequencia(sequencia):
+    compressor = brotli.Compressor(quality=settings.ESCOLAS_BROTLI_QUALIDADE)
+    for parte in sequencia:
+        saida = compressor.process(parte)
+        if saida:
+            yield saida
+    yield compressor.finish()
+
+
+async def _brotli_sequencia_assincrona(sequencia):
+    compressor = brotli.Compressor(quality=settings.ESCOLAS_BROTLI_QUALIDADE)
+    async for parte in sequencia:
+        saida = compressor.process(parte)
+        if saida:
+            yield saida
+    yield compressor.finish()
+
+
+async def _gzip_sequencia_assincrona(sequencia):
+    # Como compress_sequence, para os iteradores assíncronos do ASGI
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    async for parte in sequencia:
+        saida = compressor.compress(parte)
+        if saida:
+            yield saida
+    yield compressor.flush()
+
+
+def _etag_304(request, response):
+    # O 304 não tem corpo para comprimir: fica com o ETag que o cliente tem em cache
+    etag = response.get('ETag')
+    codificacao = escolher(request.META.get('HTTP_ACCEPT_ENCODING', ''))
+    if not etag or codificacao is None:
+        return response
+    codificado = condicional.etag_codificado(etag, codificacao)
+    if codificado in parse_etags(request.META.get('HTTP_IF_NONE_MATCH', '')):
+        response['ETag'] = codificado
+    return response
+
+
+def _comprimir_resposta(request, response):
+    minimo = settings.ESCOLAS_COMPRESSAO_MINIMO
+    if not minimo or response.has_header('Content-Encoding'):
+        return response
+    if response.status_code == 304:
+        return _etag_304(request, response)
+    if not response.streaming and len(response.content) < minimo:
+        return response
+
+    patch_vary_headers(response, ('Accept-Encoding',))
+    codificacao = escolher(request.META.get('HTTP_ACCEPT_ENCODING', ''))
+    if codificacao is None:
+        return response
+
+    if response.streaming:
+        if response.is_async:
+            comprimir_sequencia = _brotli_sequencia_assincrona if codificacao == 'br' else _gzip_sequencia_assincrona
+        else:
+            comprimir_sequencia = _brotli_sequencia if codificacao == 'br' else compress_sequence
+        response.streaming_content = comprimir_sequencia(response.streaming_content)
+        del response['Content-Length']
+    else:
+        with metricas.medir('compressao'):
+            comprimido = comprimir(response.content, codificacao)
+        if len(comprimido) >= len(response.content):
+            return response
+        response.content = comprimido
+        response['Content-Length'] = str(len(comprimido))
+
+    etag = response.get('ETag')
+    if etag and etag.startswith('"'):
+        response['ETag'] = condicional.etag_codificado(etag, codificacao)
+    response['Content-Encoding'] = codificacao
+    return response
+
+
+class CompressaoMiddleware:
+    """Comprime as respostas grandes; ver a documentação do módulo."""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.gzip = GZipMiddleware(get_response)
+        self.assincrono = iscoroutinefunction(get_response)
+        if self.assincrono:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.assincrono:
+            return self.__acall__(request)
+        return self._comprimir(request, self.get_response(request))
+
+    async def __acall__(self, request):
+        return self._comprimir(request, await self.get_response(request))
+
+    def _comprimir(self, request, response):
+        tipo = response.get('Content-Type', '').split(';')[0].strip().lower()
+        if response.status_code == 304 or tipo in TIPOS:
+            return _comprimir_resposta(request, response)
+        if not settings.ESCOLAS_COMPRESSAO_MINIMO:
+            return response
+        return self.gzip.process_response(request, response)
@@ -0,0 +1,93 @@
+"""ETag/Last-Modified das escolas e resposta 304 antes de qualquer serialização.
+
+Uma escola tem ETag ``"<id>-<atualizado_em>"``. As listagens usam a versão
+da tabela (``Versao``, incrementada a cada escrita) mais o resumo do pedido,
+por isso o ETag sai de uma única leitura por chave primária, sem olhar para
+o corpo da resposta. O ``CompressaoMiddleware`` junta ao ETag das respostas
+comprimidas a codificação (``"<etag>-gzip"``), que é retirada aqui antes de
+comparar o If-None-Match.
+"""
+from django.http import HttpResponseNotModified
+from django.utils.http import http_date, parse_etags, parse_http_date_safe
+
+from . import cache
+from .models import Escola, Versao
+
+CODIFICACOES = ('gzip', 'br')
+
+
+def validadores_escola(escola):
+    return f'"{escola.pk}-{escola.atualizado_em.timestamp():.6f}"', escola.atualizado_em
+
+
+def versao_tabela():
+    """(versão, atualizado_em) de ``Escola``; em cache até à próxima escrita."""
+    chave = cache.chave_tabela('versao')
+    versao = cache.obter(chave)
+    if versao is None:
+        atual = Versao.atual(Escola._meta.db_table)
+        versao = (atual.valor, atual.atualizado_em)
+        cache.guardar(chave, versao)
+    return versao
+
+
+async def aversao_tabela():
+    chave = await cache.achave_tabela('versao')
+    versao = await cache.aobter(chave)
+    if versao is None:
+        atual = await Versao.aatual(Escola._meta.db_table)
+        versao = (atual.valor, atual.atualizado_em)
+        await cache.aguardar(chave, versao)
+    return versao
+
+
+def _etag_tabela(tipo, valor, request, **extra):
+    # O Accept entra no resumo: cada representação tem o seu ETag forte
+    resumo = cache.resumo_consulta(request, accept=request.META.get('HTTP_ACCEPT', ''), **extra)
+    return f'"{tipo}-{valor}-{resumo[:16]}"'
+
+
+def validadores_tabela(tipo, request, **extra):
+    valor, atualizado_em = versao_tabela()
+    return _etag_tabela(tipo, valor, request, **extra), atualizado_em
+
+
+async def avalidadores_tabela(tipo, request, **extra):
+    valor, atualizado_em = await aversao_tabela()
+    return _etag_tabela(tipo, valor, request, **extra), atualizado_em
+
+
+def etag_codificado(etag, codificacao):
+    """ETag forte da representação comprimida com ``codificacao``."""
+    return f'{etag[:-1]}-{codificacao}"'
+
+
+def _sem_codificacao(etag):
+    # If-None-Match usa a comparação fraca: W/"x" valida "x"
+    etag = etag.removeprefix('W/')
+    for codificacao in CODIFICACOES:
+        sufixo = f'-{codificacao}"'
+        if etag.endswith(sufixo):
+            return f'{etag[:-len(sufixo)]}"'
+    return etag
+
+
+def nao_modificado(request, etag, ultima_modificacao):
+    """Avalia If-None-Match (ou, na sua falta, If-Modified-Since)."""
+    if_none_match = request.META.get('HTTP_IF_NONE_MATCH')
+    if if_none_match:
+        etags = {_sem_codificacao(valor) for valor in parse_etags(if_none_match)}
+        return '*' in etags or etag in etags
+    if_modified_since = parse_http_date_safe(request.META.get('HTTP_IF_MODIFIED_SINCE', ''))
+    return if_modified_since is not None and int(ultima_modificacao.timestamp()) <= if_modified_since
+
+
+def cabecalhos(etag, ultima_modificacao):
+    return {'ETag': etag, 'Last-Modified': http_date(ultima_modificacao.timestamp())}
+
+
+def resposta_304(etag, ultima_modificacao):
+    response = HttpResponseNotModified()
+    for cabecalho, valor in cabecalhos(etag, ultima_modificacao).items():
+        response[cabecalho] = valor
+    return response
@@ -0,0 +1,51 @@
+"""Estatísticas por província (GET /escolas/stats/), calculadas na base de dados.
+
+Uma única consulta agregada sobre ``unnest(provincia)``: cada escola conta
+uma vez em cada província onde está (repetições no array são ignoradas).
+Com ``ESCOLAS_PROVINCIAS_NORMALIZADAS`` a consulta é uma junção com a tabela
+de ligação (ver escolas/provincias.py), sem desfazer os arrays.
+O resultado fica em cache até à próxima escrita, como as listagens.
+"""
+from django.db import connection
+
+from .models import Escola, EscolaProvincia, Provincia
+from .provincias import normalizadas
+
+CONSULTA = """
+    SELECT p.provincia, COUNT(*), SUM(e.numero_salas), AVG(e.numero_salas), MIN(e.numero_salas), MAX(e.numero_salas)
+    FROM {tabela} e
+    CROSS JOIN LATERAL (SELECT DISTINCT unnest(e.provincia) AS provincia) p
+    GROUP BY p.provincia
+    ORDER BY p.provincia
+"""
+
+CONSULTA_NORMALIZADA = """
+    SELECT p.nome, COUNT(*), SUM(e.numero_salas), AVG(e.numero_salas), MIN(e.numero_salas), MAX(e.numero_salas)
+    FROM {ligacao} ep
+    JOIN {provincias} p ON p.id = ep.provincia_id
+    JOIN {tabela} e ON e.id = ep.escola_id
+    GROUP BY p.nome
+    ORDER BY p.nome
+"""
+
+CAMPOS = ('provincia', 'escolas', 'salas_total', 'salas_media', 'salas_minimo', 'salas_maximo')
+
+
+def por_provincia():
+    """Lista de ``{'provincia', 'escolas', 'salas_total', 'salas_media', 'salas_minimo', 'salas_maximo'}``."""
+    nome = connection.ops.quote_name
+    if normalizadas():
+        consulta = CONSULTA_NORMALIZADA.format(
+            ligacao=nome(EscolaProvincia._meta.db_table),
+            provincias=nome(Provincia._meta.db_table),
+            tabela=nome(Escola._meta.db_table),
+        )
+    else:
+        consulta = CONSULTA.format(tabela=nome(Escola._meta.db_table))
+    with connection.cursor() as cursor:
+        cursor.execute(consulta)
+        linhas = cursor.fetchall()
+    return [
+        dict(zip(CAMPOS, (provincia, escolas, total, round(float(media), 2), minimo, maximo)))
+        for provincia, escolas, total, media, minimo, maximo in linhas
+    ]
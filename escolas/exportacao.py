@@ -0,0 +1,163 @@
+"""Exportação da tabela de escolas em CSV, NDJSON e XLSX, em streaming.
+
+As linhas saem de um cursor do lado do servidor (``.iterator(chunk_size)``)
+e cada bloco é enviado ao cliente assim que é formatado, por isso a memória
+não depende do número de escolas. O XLSX é escrito diretamente como ZIP em
+streaming (sem openpyxl), com as mesmas colunas que o UploadExcelView espera.
+"""
+import csv
+import io
+import json
+import re
+import zipfile
+from xml.sax.saxutils import escape
+
+from django.conf import settings
+
+from .serializers import escola_leitura
+
+COLUNAS = ['nome', 'email', 'numero_salas', 'provincia']
+
+TIPOS = {
+    'csv': 'text/csv; charset=utf-8',
+    'ndjson': 'application/x-ndjson',
+    'xlsx': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+}
+
+
+def _tamanho_bloco():
+    return settings.ESCOLAS_EXPORT_CHUNK_SIZE
+
+
+def _em_blocos(iteravel, tamanho):
+    bloco = []
+    for item in iteravel:
+        bloco.append(item)
+        if len(bloco) >= tamanho:
+            yield bloco
+            bloco = []
+    if bloco:
+        yield bloco
+
+
+def _linhas(queryset):
+    # provincia sai como no Excel de importação: "Luanda,Bengo"
+    for nome, email, numero_salas, provincia in queryset.values_list(*COLUNAS).iterator(chunk_size=_tamanho_bloco()):
+        yield nome, email, numero_salas, ','.join(provincia)
+
+
+def exportar(queryset, formato):
+    """Gerador de ``bytes`` com o conteúdo de ``queryset`` no ``formato`` pedido."""
+    return {'csv': _csv, 'ndjson': _ndjson, 'xlsx': _xlsx}[formato](queryset)
+
+
+def _csv(queryset):
+    saida = io.StringIO()
+    escritor = csv.writer(saida)
+    escritor.writerow(COLUNAS)
+    for bloco in _em_blocos(_linhas(queryset), _tamanho_bloco()):
+        escritor.writerows(bloco)
+        yield saida.getvalue().encode()
+        saida.seek(0)
+        saida.truncate()
+    if saida.tell():
+        yield saida.getvalue().encode()
+
+
+def _ndjson(queryset):
+    linhas = escola_leitura.valores(queryset).iterator(chunk_size=_tamanho_bloco())
+    for bloco in _em_blocos(linhas, _tamanho_bloco()):
+        yield ''.join(json.dumps(escola, ensure_ascii=False) + '\n' for escola in escola_leitura.data(bloco)).encode()
+
+
+# Caracteres que o XML 1.0 não admite (os mesmos que o openpyxl recusa)
+CARACTERES_ILEGAIS_XML = re.compile(r'[\x00-\x08\x0b\x0c\x0e-\x1f]')
+
+XLSX_PARTES = {
+    '[Content_Types].xml': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+        '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+        '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+        '<Default Extension="xml" ContentType="application/xml"/>'
+        '<Override PartName="/xl/workbook.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+        '<Override PartName="/xl/worksheets/sheet1.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+        '</Types>'
+    ),
+    '_rels/.rels': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" Target="xl/workbook.xml" '
+        'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument"/>'
+        '</Relationships>'
+    ),
+    'xl/workbook.xml': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+        '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+        'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+        '<sheets><sheet name="escolas" sheetId="1" r:id="rId1"/></sheets></workbook>'
+    ),
+    'xl/_rels/workbook.xml.rels': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" Target="worksheets/sheet1.xml" '
+        'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet"/>'
+        '</Relationships>'
+    ),
+}
+
+
+class _Saida(io.RawIOBase):
+    """Destino não posicionável do ZipFile: acumula os bytes até serem enviados."""
+
+    def __init__(self):
+        self.partes = []
+
+    def writable(self):
+        return True
+
+    def write(self, dados):
+        self.partes.append(bytes(dados))
+        return len(dados)
+
+    def esvaziar(self):
+        dados = b''.join(self.partes)
+        self.partes = []
+        return dados
+
+
+def _celula(valor):
+    if isinstance(valor, int):
+        return f'<c><v>{valor}</v></c>'
+    texto = escape(CARACTERES_ILEGAIS_XML.sub('', str(valor)))
+    return f'<c t="inlineStr"><is><t xml:space="preserve">{texto}</t></is></c>'
+
+
+def _linha_xml(valores):
+    return '<row>' + ''.join(_celula(valor) for valor in valores) + '</row>'
+
+
+def xlsx(linhas):
+    """Gerador de ``bytes`` de um XLSX de uma folha com ``COLUNAS`` e ``linhas``."""
+    saida = _Saida()
+    with zipfile.ZipFile(saida, 'w', zipfile.ZIP_DEFLATED) as arquivo:
+        for nome, conteudo in XLSX_PARTES.items():
+            arquivo.writestr(nome, conteudo)
+        yield saida.esvaziar()
+
+        with arquivo.open('xl/worksheets/sheet1.xml', 'w') as folha:
+            folha.write((
+                '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+                '<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main"><sheetData>'
+                + _linha_xml(COLUNAS)
+            ).encode())
+            for bloco in _em_blocos(linhas, _tamanho_bloco()):
+                folha.write(''.join(_linha_xml(valores) for valores in bloco).encode())
+                yield saida.esvaziar()
+            folha.write(b'</sheetData></worksheet>')
+    yield saida.esvaziar()
+
+
+def _xlsx(queryset):
+    return xlsx(_linhas(queryset))
@@ -0,0 +1,164 @@
+"""Histórico de importações: arquivos e linhas já importados.
+
+O mesmo ``.xlsx`` é muitas vezes enviado várias vezes. Cada importação
+guarda o SHA-256 do arquivo (``ArquivoImportado``) com o relatório e a
+versão da tabela de escolas no fim; enquanto essa versão for a atual, o
+mesmo arquivo (no mesmo modo) devolve o relatório guardado sem ser lido.
+
+No modo de inserção cada escola criada guarda também o hash da linha que a
+criou (``LinhaImportada``). Num arquivo que repete parte de outro, as linhas
+cujo hash corresponde a uma escola que não mudou desde então são saltadas
+antes da validação e do INSERT, que falharia de qualquer forma pela
+unicidade do nome. Apagar a escola apaga a linha do histórico (CASCADE) e
+alterá-la muda o ``atualizado_em``: em ambos os casos a linha volta a ser
+importada. No modo upsert as linhas inalteradas já são detetadas em SQL
+(ver ``importar_upsert``) e só o histórico dos arquivos é usado.
+"""
+import hashlib
+import math
+from dataclasses import dataclass
+from datetime import datetime
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import F
+
+from . import alteracoes, paralelo
+from .importacao import INSERCAO, ResultadoImportacao, importar, importar_dataframe, ler_blocos
+from .models import ArquivoImportado, Escola, LinhaImportada, Versao
+
+SEPARADOR = '\x1f'
+
+REGISTAR_LINHAS = """
+    INSERT INTO {linhas} (escola_id, hash, atualizado_em)
+    SELECT e.id, l.hash, e.atualizado_em
+    FROM unnest(%s::text[], %s::text[]) AS l(nome, hash) JOIN {escolas} e ON e.nome = l.nome
+    ON CONFLICT (escola_id) DO UPDATE SET hash = EXCLUDED.hash, atualizado_em = EXCLUDED.atualizado_em
+"""
+
+
+@dataclass
+class ResultadoAnterior:
+    """Resultado de um arquivo idêntico já importado, com o relatório dessa vez."""
+    relatorio: str
+    processadas: int
+    falhadas: int
+    importado_em: datetime
+    repetido = True
+
+
+def hash_arquivo(arquivo):
+    """SHA-256 do conteúdo de ``arquivo``, que volta ao início no fim."""
+    resumo = hashlib.sha256()
+    arquivo.seek(0)
+    for parte in iter(lambda: arquivo.read(1 << 20), b''):
+        resumo.update(parte)
+    arquivo.seek(0)
+    return resumo.hexdigest()
+
+
+def _texto(valor):
+    # 12, 12.0 e '12' são a mesma linha, venha ela de um XLSX ou de um CSV
+    if valor is None or (isinstance(valor, float) and math.isnan(valor)):
+        return ''
+    if isinstance(valor, float) and valor.is_integer():
+        return str(int(valor))
+    return str(valor)
+
+
+def hash_linhas(df):
+    """Hash (hexadecimal, 128 bits) de cada linha de ``df``, com o mesmo índice."""
+    import pandas as pd
+
+    return pd.Series([
+        hashlib.blake2b(
+            SEPARADOR.join(map(_texto, valores)).encode('utf-8', 'surrogatepass'), digest_size=16
+        ).hexdigest()
+        for valores in zip(df['nome'], df['email'], df['numero_salas'], df['provincia'])
+    ], index=df.index, dtype=object)
+
+
+def importar_arquivo(arquivo, formato='xlsx', modo=INSERCAO, apagar_ausentes=False, ao_progredir=None):
+    """Importa ``arquivo`` usando o histórico; ver a documentação do módulo.
+
+    Devolve um ``ResultadoAnterior`` se o mesmo arquivo já tiver sido
+    importado e as escolas não tiverem mudado desde então, senão o
+    ``ResultadoImportacao`` desta importação. Com ``ESCOLAS_IMPORT_PROCESSOS``
+    as importações (modo de inserção) de arquivos com várias partes são
+    repartidas por processos (ver escolas/paralelo.py).
+    """
+    conteudo = hash_arquivo(arquivo)
+    antes = _versao()
+    anterior = ArquivoImportado.objects.filter(
+        hash=conteudo, modo=modo, apagar_ausentes=apagar_ausentes, versao=antes,
+    ).first()
+    if anterior is not None:
+        return ResultadoAnterior(
+            anterior.relatorio, anterior.linhas_processadas, anterior.linhas_falhadas, anterior.importado_em,
+        )
+
+    # A importação não é uma única transação: a versão do fim só fica no
+    # histórico se todas as subidas desde o início forem desta importação;
+    # com outra escrita pelo meio, o mesmo arquivo volta a ser importado
+    resultado = None
+    with alteracoes.contar() as contagem:
+        if modo == INSERCAO and settings.ESCOLAS_IMPORT_PROCESSOS > 1:
+            resultado = paralelo.importar_em_paralelo(arquivo, formato, settings.ESCOLAS_IMPORT_PROCESSOS, ao_progredir)
+        if resultado is None:
+            resultado = ResultadoImportacao()
+            blocos = ler_blocos(arquivo, formato, folhas=resultado.folhas)
+            if modo == INSERCAO:
+                importar_linhas_novas(blocos, resultado, ao_progredir=ao_progredir)
+            else:
+                importar(blocos, modo, apagar_ausentes, ao_progredir=ao_progredir, resultado=resultado)
+
+    depois = _versao()
+    if resultado.subidas is None or depois - antes != contagem.subidas + resultado.subidas:
+        return resultado
+    ArquivoImportado.objects.update_or_create(
+        hash=conteudo, modo=modo, apagar_ausentes=apagar_ausentes,
+        defaults={
+            'versao': depois,
+            'linhas_processadas': resultado.processadas,
+            'linhas_falhadas': resultado.falhadas,
+            'relatorio': resultado.relatorio,
+        },
+    )
+    return resultado
+
+
+def importar_linhas_novas(blocos, resultado=None, ao_progredir=None):
+    """``importar_blocos`` que salta as linhas já importadas e regista as novas."""
+    resultado = resultado or ResultadoImportacao()
+    for df in blocos:
+        hashes = hash_linhas(df)
+        vistas = set(
+            LinhaImportada.objects.filter(hash__in=set(hashes), escola__atualizado_em=F('atualizado_em'))
+            .values_list('hash', flat=True)
+        )
+        novas = ~hashes.isin(vistas)
+        resultado.ja_importadas += int((~novas).sum())
+
+        erros = len(resultado.erros)
+        importar_dataframe(df[novas], resultado=resultado)
+        falhadas = [indice for indice, _ in resultado.erros[erros:]]
+        inseridas = df.index[novas].difference(falhadas)
+        if len(inseridas):
+            # Como no serializer: o nome da escola é o da célula sem espaços nas pontas
+            _registar_linhas(df.loc[inseridas, 'nome'].astype(str).str.strip(), hashes[inseridas])
+        if ao_progredir:
+            ao_progredir(resultado)
+    return resultado
+
+
+def _registar_linhas(nomes, hashes):
+    sql = REGISTAR_LINHAS.format(
+        linhas=connection.ops.quote_name(LinhaImportada._meta.db_table),
+        escolas=connection.ops.quote_name(Escola._meta.db_table),
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [nomes.tolist(), hashes.tolist()])
+
+
+def _versao():
+    return Versao.atual(Escola._meta.db_table).valor
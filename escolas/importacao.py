@@ -0,0 +1,515 @@
+import csv
+import io
+import re
+from dataclasses import dataclass, field
+
+from django.conf import settings
+from django.db import IntegrityError, connection, transaction
+
+from . import alteracoes
+from .lote import EscolaLoteSerializer
+from .models import Escola, Importacao
+from .serializers import EscolaSerializer
+
+# O pandas, o numpy e o openpyxl só são importados nas funções que leem e
+# validam os arquivos: os workers e os comandos que nunca importam um arquivo
+# não pagam o seu tempo de importação nem a sua memória (benchmarks/arranque.py)
+
+COLUNAS = {'nome', 'email', 'numero_salas', 'provincia'}
+
+# Modos de importação: 'insert' só cria escolas (nomes existentes falham);
+# 'upsert' cria as novas, atualiza as alteradas e ignora as inalteradas
+INSERCAO = Importacao.INSERCAO
+UPSERT = Importacao.UPSERT
+MODOS = (INSERCAO, UPSERT)
+
+TAMANHO_MAXIMO = 255
+# As linhas da folha k de um XLSX são numeradas a partir de k * LINHAS_POR_FOLHA
+# (o máximo de linhas de uma folha do Excel), para cada linha do arquivo ter
+# um índice único e a folha e a linha poderem ser recuperadas dele
+LINHAS_POR_FOLHA = 2 ** 20
+SALAS_MAXIMO = 2147483647
+
+# Subconjunto conservador do EmailValidator do Django: o que casar aqui é
+# seguramente válido; o resto é decidido pelo EscolaSerializer linha a linha.
+EMAIL_REGEX = (
+    r"[-!#$%&'*+/=?^_`{}|~0-9A-Za-z]+(?:\.[-!#$%&'*+/=?^_`{}|~0-9A-Za-z]+)*"
+    r"@(?:[A-Za-z0-9](?:[A-Za-z0-9-]{0,61}[A-Za-z0-9])?\.)+[A-Za-z]{2,63}"
+)
+# Caracteres recusados pelos CharFields do DRF
+CARACTERES_INVALIDOS = '[\x00\ud800-\udfff]'
+
+
+class EstruturaInvalida(Exception):
+    pass
+
+
+@dataclass
+class ResultadoImportacao:
+    inseridas: int = 0
+    falhadas: int = 0
+    erros: list = field(default_factory=list)
+    # Só no modo upsert
+    upsert: bool = False
+    atualizadas: int = 0
+    inalteradas: int = 0
+    apagadas: int | None = None
+    pendentes: int = 0  # linhas válidas na tabela de staging, ainda por aplicar
+    # Linhas iguais às de uma importação anterior, saltadas (ver historico.py)
+    ja_importadas: int = 0
+    # Nomes das folhas do XLSX (preenchidos por ler_blocos): com mais de uma,
+    # cada erro do relatório leva o nome da sua folha
+    folhas: list = field(default_factory=list)
+    # Subidas da versão das escolas feitas noutros processos (ver paralelo.py);
+    # None se não se sabe quantas foram
+    subidas: int | None = 0
+
+    def registrar_erro(self, indice, erro):
+        self.falhadas += 1
+        self.erros.append((indice, str(erro)))
+
+    def juntar(self, outro):
+        """Soma ao resultado o de outra parte do mesmo arquivo."""
+        for campo in ('inseridas', 'falhadas', 'atualizadas', 'inalteradas', 'pendentes', 'ja_importadas'):
+            setattr(self, campo, getattr(self, campo) + getattr(outro, campo))
+        self.erros.extend(outro.erros)
+        self.folhas = self.folhas or outro.folhas
+        self.subidas = None if None in (self.subidas, outro.subidas) else self.subidas + outro.subidas
+
+    def _erro(self, indice, erro):
+        if len(self.folhas) > 1:
+            folha, linha = divmod(indice, LINHAS_POR_FOLHA)
+            return f"[{self.folhas[folha]}] Linha {linha+1}: {erro}"
+        return f"Linha {indice+1}: {erro}"
+
+    @property
+    def processadas(self):
+        return (
+            self.inseridas + self.atualizadas + self.inalteradas + self.pendentes + self.falhadas + self.ja_importadas
+        )
+
+    @property
+    def relatorio(self):
+        if self.upsert:
+            resumo = (
+                f"**{self.inseridas} escolas inseridas, {self.atualizadas} atualizadas e "
+                f"{self.inalteradas} inalteradas (ignoradas)"
+                + (f"; {self.apagadas} escolas ausentes do arquivo apagadas" if self.apagadas is not None else '')
+                + ".**"
+            )
+        else:
+            resumo = (
+                f"**{self.inseridas} escolas inseridas com sucesso"
+                + (f"; {self.ja_importadas} linhas já importadas anteriormente (ignoradas)" if self.ja_importadas else '')
+                + ".**"
+            )
+        if not self.erros:
+            return resumo
+        erros = ''.join(self._erro(indice, erro) for indice, erro in sorted(self.erros, key=lambda erro: erro[0]))
+        return f"{resumo}\n**{self.falhadas} escolas falharam:**\n{erros}"
+
+
+def tamanho_lote():
+    return getattr(settings, 'ESCOLAS_IMPORT_BATCH_SIZE', 1000)
+
+
+def importar_dataframe(df, batch_size=None, resultado=None):
+    """Importa as linhas de ``df`` em blocos de ``batch_size``.
+
+    O índice do DataFrame é usado como número da linha no relatório.
+    """
+    batch_size = batch_size or tamanho_lote()
+    resultado = resultado or ResultadoImportacao()
+
+    for inicio in range(0, len(df), batch_size):
+        _importar_bloco(df.iloc[inicio:inicio + batch_size], resultado)
+    return resultado
+
+
+def importar_blocos(blocos, resultado=None, ao_progredir=None):
+    """Importa cada bloco; ``ao_progredir(resultado)`` é chamado no fim de cada um."""
+    resultado = resultado or ResultadoImportacao()
+    for df in blocos:
+        importar_dataframe(df, resultado=resultado)
+        if ao_progredir:
+            ao_progredir(resultado)
+    return resultado
+
+
+def importar(blocos, modo=INSERCAO, apagar_ausentes=False, ao_progredir=None, resultado=None):
+    """Importa ``blocos`` (de ``ler_blocos``) no ``modo`` pedido."""
+    if modo == UPSERT:
+        return importar_upsert(blocos, apagar_ausentes, resultado, ao_progredir=ao_progredir)
+    return importar_blocos(blocos, resultado, ao_progredir=ao_progredir)
+
+
+def ler_blocos(arquivo, formato='xlsx', batch_size=None, folhas=None, folha=None, linhas=None):
+    """Lê ``arquivo`` em DataFrames de no máximo ``batch_size`` linhas.
+
+    Só um bloco fica em memória de cada vez; o índice de cada bloco continua a
+    numeração do anterior, como se o arquivo tivesse sido lido de uma vez.
+    Num XLSX são lidas todas as folhas com dados, pela ordem do arquivo (ver
+    ``LINHAS_POR_FOLHA``), e os seus nomes são postos na lista ``folhas``.
+    ``folha`` (o número da folha, num XLSX) e ``linhas`` (``(primeira,
+    ultima)``, sem o cabeçalho, com ``ultima`` exclusiva ou None, num CSV)
+    limitam a leitura a uma parte do arquivo (ver escolas/paralelo.py).
+    Levanta ``EstruturaInvalida`` ao ler o primeiro bloco se as colunas não
+    forem as esperadas.
+    """
+    batch_size = batch_size or tamanho_lote()
+    if formato == 'csv':
+        return _blocos_csv(arquivo, batch_size, linhas)
+    return _blocos_xlsx(arquivo, batch_size, folhas, folha)
+
+
+def _verificar_colunas(colunas):
+    if not set(colunas) == COLUNAS:
+        raise EstruturaInvalida('Estrutura do Excel incorreta. Colunas esperadas: nome, email, numero_salas, provincia.')
+
+
+def _blocos_csv(arquivo, batch_size, linhas=None):
+    import pandas as pd
+
+    primeira, ultima = linhas or (0, None)
+    leitor = pd.read_csv(
+        arquivo, chunksize=batch_size, skiprows=range(1, primeira + 1),
+        nrows=None if ultima is None else ultima - primeira,
+    )
+    for df in leitor:
+        _verificar_colunas(df.columns)
+        df.index += primeira
+        yield df
+
+
+def colunas_folha(worksheet):
+    """Cabeçalho da folha, sem as células vazias do fim (None se a folha estiver vazia)."""
+    colunas = list(next(worksheet.iter_rows(max_row=1, values_only=True), ()))
+    while colunas and colunas[-1] is None:
+        colunas.pop()
+    return colunas or None
+
+
+def _blocos_xlsx(arquivo, batch_size, folhas=None, folha=None):
+    from openpyxl import load_workbook
+
+    workbook = load_workbook(arquivo, read_only=True, data_only=True)
+    try:
+        if folhas is not None:
+            folhas[:] = workbook.sheetnames
+        lidas = 0
+        for numero, worksheet in enumerate(workbook.worksheets):
+            if folha is not None and numero != folha:
+                continue
+            colunas = colunas_folha(worksheet)
+            # Folhas vazias (a "Folha2" de um livro novo) são ignoradas
+            if colunas is None:
+                continue
+            _verificar_colunas(colunas)
+            lidas += 1
+            yield from _blocos_folha(worksheet, colunas, batch_size, numero * LINHAS_POR_FOLHA)
+        if not lidas:
+            _verificar_colunas([])
+    finally:
+        workbook.close()
+
+
+def _blocos_folha(worksheet, colunas, batch_size, base):
+    bloco, vazias, inicio = [], [], base
+    for linha in worksheet.iter_rows(min_row=2, values_only=True):
+        linha = (tuple(linha) + (None,) * len(colunas))[:len(colunas)]
+        # Como o pd.read_excel, linhas vazias só contam se houver dados depois delas
+        if all(valor is None for valor in linha):
+            vazias.append(linha)
+            continue
+        for pendente in vazias + [linha]:
+            bloco.append(pendente)
+            if len(bloco) >= batch_size:
+                yield _dataframe(bloco, colunas, inicio)
+                inicio += len(bloco)
+                bloco = []
+        vazias = []
+    if bloco:
+        yield _dataframe(bloco, colunas, inicio)
+
+
+def _dataframe(linhas, colunas, inicio):
+    import numpy as np
+    import pandas as pd
+
+    df = pd.DataFrame(linhas, columns=colunas, index=pd.RangeIndex(inicio, inicio + len(linhas)))
+    # Células vazias como NaN, tal como o pd.read_excel as devolve
+    return df.where(df.notna(), np.nan)
+
+
+def _importar_bloco(df, resultado):
+    nomes, emails, salas, validas = _validar_bloco(df)
+
+    # Uma única consulta por bloco para os nomes que já existem na base
+    existentes = set(
+        Escola.objects.filter(nome__in=nomes[validas].tolist()).order_by().values_list('nome', flat=True)
+    )
+    # Só a primeira ocorrência de um nome no bloco vai para o caminho rápido;
+    # as repetições recebem o erro de unicidade do serializer mais abaixo.
+    limpas = validas & ~nomes.duplicated(keep='first') & ~nomes.isin(existentes)
+
+    escolas = [
+        Escola(
+            nome=nome,
+            email=email,
+            numero_salas=int(numero_salas),
+            provincia=[item.strip() for item in provincia.split(',')],
+        )
+        for nome, email, numero_salas, provincia in zip(
+            nomes[limpas], emails[limpas], salas[limpas], df['provincia'][limpas]
+        )
+    ]
+
+    # Ordem fixa de inserção no índice único de ``nome``: importações
+    # concorrentes bloqueiam as mesmas chaves pela mesma ordem, sem deadlocks.
+    escolas.sort(key=lambda escola: escola.nome)
+
+    suspeitas = df[~limpas]
+    try:
+        with transaction.atomic():
+            Escola.objects.bulk_create(escolas)
+        resultado.inseridas += len(escolas)
+        if escolas:
+            # O bulk_create não dispara post_save
+            alteracoes.registrar()
+    except IntegrityError:
+        # Outra escrita concorrente inseriu um dos nomes entre a consulta e o
+        # INSERT e o bulk_create foi desfeito: todas as linhas do bloco passam
+        # pelo serializer, que dá o erro de unicidade só às repetidas.
+        suspeitas = df
+
+    for indice, row in suspeitas.iterrows():
+        _importar_linha(indice, row, resultado)
+
+
+def _importar_linha(indice, row, resultado):
+    try:
+        # Convertendo a string 'provincia' em uma lista de itens
+        provincia = row['provincia'].split(',') if isinstance(row['provincia'], str) else row['provincia']
+
+        data = {
+            'nome': row['nome'],
+            'email': row['email'],
+            'numero_salas': row['numero_salas'],
+            'provincia': provincia,
+        }
+        serializer = EscolaSerializer(data=data)
+        if serializer.is_valid():
+            # Num savepoint: a importação pode correr dentro de uma transação
+            # (as partes de paralelo.py) e um nome ocupado entretanto por outra
+            # escrita não pode deixá-la inutilizável para as linhas seguintes
+            with transaction.atomic():
+                serializer.save()
+            resultado.inseridas += 1
+        else:
+            resultado.registrar_erro(indice, serializer.errors)
+    except Exception as e:
+        resultado.registrar_erro(indice, e)
+
+
+# Upsert: as linhas do arquivo vão para uma tabela temporária e a comparação
+# com escolas_escola (novas, alteradas, inalteradas, ausentes) é feita em SQL.
+
+STAGING = 'escolas_importacao_upsert'
+
+STAGING_CRIAR = f"""
+    CREATE TEMPORARY TABLE {STAGING} (
+        linha integer NOT NULL,
+        nome varchar(255),
+        email varchar(255),
+        numero_salas integer,
+        provincia varchar(255)[],
+        valida boolean NOT NULL
+    ) ON COMMIT DROP
+"""
+
+# Repetições de um nome no arquivo: vale a primeira, como no modo de inserção
+STAGING_REPETIDAS = f"""
+    UPDATE {STAGING} s SET valida = false
+    FROM {STAGING} primeira
+    WHERE s.valida AND primeira.valida AND primeira.nome = s.nome AND primeira.linha < s.linha
+    RETURNING s.linha
+"""
+
+# Só as linhas novas ou alteradas chegam ao INSERT; o ON CONFLICT cobre as
+# escolas criadas ou alteradas por outra escrita entre a comparação e o INSERT.
+# As províncias são comparadas já normalizadas como o trigger as gravaria
+# (ver escolas/provincias.py): ' luanda ' no arquivo não altera 'Luanda'
+APLICAR = f"""
+    INSERT INTO {{tabela}} AS e (nome, email, numero_salas, provincia)
+    SELECT s.nome, s.email, s.numero_salas, escolas_canonizar_provincias(s.provincia)
+    FROM {STAGING} s LEFT JOIN {{tabela}} atual ON atual.nome = s.nome
+    WHERE s.valida AND (
+        atual.id IS NULL
+        OR (atual.email, atual.numero_salas, atual.provincia)
+            IS DISTINCT FROM (s.email, s.numero_salas, escolas_canonizar_provincias(s.provincia))
+    )
+    ORDER BY s.nome
+    ON CONFLICT (nome) DO UPDATE SET
+        email = EXCLUDED.email, numero_salas = EXCLUDED.numero_salas, provincia = EXCLUDED.provincia,
+        atualizado_em = now()
+    WHERE (e.email, e.numero_salas, e.provincia)
+        IS DISTINCT FROM (EXCLUDED.email, EXCLUDED.numero_salas, EXCLUDED.provincia)
+    RETURNING e.id, e.xmax = 0
+"""
+
+# Linhas inválidas também protegem a escola com o mesmo nome de ser apagada
+APAGAR_AUSENTES = f"""
+    DELETE FROM {{tabela}} e
+    WHERE NOT EXISTS (SELECT 1 FROM {STAGING} s WHERE s.nome = e.nome)
+    RETURNING e.id
+"""
+
+
+def importar_upsert(blocos, apagar_ausentes=False, resultado=None, ao_progredir=None):
+    """Cria as escolas novas e atualiza as alteradas, por ``nome``.
+
+    As linhas de cada bloco são validadas como no modo de inserção (sem a
+    unicidade do nome) e copiadas com ``COPY`` para uma tabela temporária.
+    No fim, um único ``INSERT ... ON CONFLICT (nome) DO UPDATE`` aplica só as
+    diferenças; as linhas iguais às escolas existentes são contadas como
+    inalteradas e não são escritas. Com ``apagar_ausentes`` as escolas cujo
+    nome não aparece no arquivo são apagadas. Tudo corre numa transação.
+    """
+    resultado = resultado or ResultadoImportacao()
+    resultado.upsert = True
+    tabela = connection.ops.quote_name(Escola._meta.db_table)
+
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(STAGING_CRIAR)
+        for df in blocos:
+            _preparar_bloco(cursor, df, resultado)
+            if ao_progredir:
+                ao_progredir(resultado)
+
+        cursor.execute(f'CREATE INDEX ON {STAGING} (nome)')
+        cursor.execute(f'ANALYZE {STAGING}')
+        cursor.execute(STAGING_REPETIDAS)
+        for (linha,) in cursor.fetchall():
+            resultado.pendentes -= 1
+            resultado.registrar_erro(linha, {'nome': ['Nome repetido no arquivo.']})
+
+        cursor.execute(APLICAR.format(tabela=tabela))
+        aplicadas = cursor.fetchall()
+        inseridas = sum(1 for _, inserida in aplicadas if inserida)
+        resultado.inseridas += inseridas
+        resultado.atualizadas += len(aplicadas) - inseridas
+        resultado.inalteradas += resultado.pendentes - len(aplicadas)
+        resultado.pendentes = 0
+        alteradas = [pk for pk, inserida in aplicadas if not inserida]
+
+        if apagar_ausentes:
+            cursor.execute(APAGAR_AUSENTES.format(tabela=tabela))
+            apagadas = [pk for (pk,) in cursor.fetchall()]
+            resultado.apagadas = len(apagadas)
+            alteradas += apagadas
+
+        if aplicadas or alteradas:
+            alteracoes.registrar(alteradas)
+        # O ON COMMIT DROP não chega quando a importação corre dentro de outra transação
+        cursor.execute(f'DROP TABLE {STAGING}')
+    return resultado
+
+
+def _preparar_bloco(cursor, df, resultado):
+    nomes, emails, salas, validas = _validar_bloco(df)
+    linhas = [
+        (indice, nome, email, int(numero_salas), [item.strip() for item in provincia.split(',')], True)
+        for indice, nome, email, numero_salas, provincia in zip(
+            df.index[validas], nomes[validas], emails[validas], salas[validas], df['provincia'][validas]
+        )
+    ]
+
+    # As restantes passam pelo serializer, como no modo de inserção
+    for indice, row in df[~validas].iterrows():
+        provincia = row['provincia'].split(',') if isinstance(row['provincia'], str) else row['provincia']
+        serializer = EscolaLoteSerializer(data={
+            'nome': row['nome'], 'email': row['email'], 'numero_salas': row['numero_salas'], 'provincia': provincia,
+        })
+        try:
+            valida = serializer.is_valid()
+        except Exception as e:
+            valida, erros = False, e
+        else:
+            erros = serializer.errors
+        if valida:
+            dados = serializer.validated_data
+            linhas.append((indice, dados['nome'], dados['email'], dados['numero_salas'], dados['provincia'], True))
+        else:
+            resultado.registrar_erro(indice, erros)
+            nome = nomes[indice]
+            # Nomes que nem cabem na coluna não correspondem a nenhuma escola
+            if len(nome) > TAMANHO_MAXIMO or re.search(CARACTERES_INVALIDOS, nome):
+                nome = None
+            linhas.append((indice, nome, None, None, None, False))
+
+    saida = io.StringIO()
+    csv.writer(saida).writerows(
+        (indice, nome, email, numero_salas, None if provincia is None else _array(provincia), valida)
+        for indice, nome, email, numero_salas, provincia, valida in linhas
+    )
+    saida.seek(0)
+    cursor.copy_expert(f'COPY {STAGING} FROM STDIN WITH (FORMAT csv)', saida)
+    resultado.pendentes += sum(1 for linha in linhas if linha[-1])
+
+
+def _array(itens):
+    # Literal de array do PostgreSQL (o csv.writer trata das aspas do próprio campo)
+    return '{' + ','.join('"' + item.replace('\\', '\\\\').replace('"', '\\"') + '"' for item in itens) + '}'
+
+
+def _validar_bloco(df):
+    """Reproduz, de forma vetorizada, as regras do EscolaSerializer.
+
+    Devolve os nomes e e-mails já normalizados, o número de salas numérico e a
+    máscara das linhas que com certeza passam na validação.
+    """
+    import pandas as pd
+
+    texto_nome = _e_texto(df['nome'])
+    # A chave de unicidade segue a conversão do CharField (str + strip)
+    nomes = df['nome'].astype(str).str.strip()
+    validas = texto_nome & _texto_valido(nomes)
+
+    texto_email = _e_texto(df['email'])
+    emails = df['email'].where(texto_email, '').astype(str).str.strip()
+    validas &= texto_email & (emails.str.len() <= TAMANHO_MAXIMO) & emails.str.fullmatch(EMAIL_REGEX)
+
+    numerico = _e_numero(df['numero_salas'])
+    salas = pd.to_numeric(df['numero_salas'].where(numerico), errors='coerce')
+    validas &= numerico & salas.between(0, SALAS_MAXIMO) & (salas % 1 == 0)
+
+    texto_provincia = _e_texto(df['provincia'])
+    itens = df['provincia'].where(texto_provincia, '').astype(str).str.split(',').explode().str.strip()
+    validas &= texto_provincia & _texto_valido(itens).groupby(level=0).all()
+
+    return nomes, emails, salas, validas.fillna(False).astype(bool)
+
+
+def _texto_valido(serie):
+    return serie.str.len().between(1, TAMANHO_MAXIMO) & ~serie.str.contains(CARACTERES_INVALIDOS, regex=True)
+
+
+def _e_texto(serie):
+    import pandas as pd
+
+    if pd.api.types.infer_dtype(serie, skipna=False) == 'string':
+        return pd.Series(True, index=serie.index)
+    return serie.map(lambda valor: isinstance(valor, str)).astype(bool)
+
+
+def _e_numero(serie):
+    import numpy as np
+    import pandas as pd
+
+    if pd.api.types.is_bool_dtype(serie):
+        return pd.Series(False, index=serie.index)
+    if pd.api.types.is_numeric_dtype(serie):
+        return pd.Series(True, index=serie.index)
+    return serie.map(
+        lambda valor: isinstance(valor, (int, float, np.integer, np.floating)) and not isinstance(valor, (bool, np.bool_))
+    ).astype(bool)
@@ -0,0 +1,246 @@
+"""Limites de pedidos por cliente e de concorrência nas rotas caras.
+
+Cada rota cara pertence a um orçamento (``ESCOPOS``): importação (upload),
+bulk e leituras pesadas (listagem, pesquisa, filtro por província,
+exportação e estatísticas). O ``LimitesMiddleware`` aplica a cada pedido
+dessas rotas, antes de o corpo ser lido:
+
+* um balde de fichas por cliente e orçamento (``ESCOLAS_LIMITE_<ESCOPO>``,
+  ``'N/periodo'``): o balde leva até N fichas, repostas ao ritmo de N por
+  período, e cada pedido gasta uma; sem fichas a resposta é 429. O estado
+  fica na cache do Django (``ESCOLAS_LIMITES_CACHE_ALIAS``), partilhada
+  pelos workers do gunicorn (ver gunicorn.conf.py): os limites são da
+  máquina, não de cada processo;
+* um limite de pedidos em curso por orçamento e processo
+  (``ESCOLAS_CONCORRENCIA_<ESCOPO>``, 0 sem limite): acima dele a resposta
+  é 503, sem esperar, e as importações lentas não ocupam todas as threads.
+  Nas rotas com cache (``COM_CACHE``) só ocupam lugar os pedidos que têm
+  de calcular a resposta (``ocupar``): os 304 e as respostas em cache
+  passam sempre.
+
+As respostas recusadas levam ``Retry-After`` (segundos). O cliente é o
+``REMOTE_ADDR``; atrás de um proxy configure ``NUM_PROXIES`` e passa a ser
+o endereço certo do ``X-Forwarded-For`` (como no DRF). Sem ``NUM_PROXIES``
+o ``X-Forwarded-For`` é ignorado: qualquer cliente o pode inventar.
+"""
+import math
+import threading
+import time
+from contextlib import contextmanager
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.cache import caches
+from django.http import JsonResponse
+from django.urls import Resolver404, resolve
+from rest_framework.settings import api_settings
+from rest_framework.throttling import BaseThrottle
+
+IMPORTACAO = 'importacao'
+BULK = 'bulk'
+LEITURA = 'leitura'
+
+# (nome da rota, método) -> orçamento
+ESCOPOS = {
+    ('upload_excel', 'POST'): IMPORTACAO,
+    ('escola-bulk', 'POST'): BULK,
+    ('escola-list', 'GET'): LEITURA,
+    ('escola-search', 'GET'): LEITURA,
+    ('escola-filter-by-provincia', 'POST'): LEITURA,
+    ('escola-export', 'GET'): LEITURA,
+    ('escola-stats', 'GET'): LEITURA,
+}
+
+# Rotas cujas respostas ficam em cache: o compartimento é ocupado pela vista
+COM_CACHE = {'escola-list', 'escola-search', 'escola-filter-by-provincia', 'escola-stats'}
+
+PERIODOS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+
+
+def taxa(texto):
+    """``'N/periodo'`` -> ``(N, segundos)``; None se vazio."""
+    if not texto:
+        return None
+    numero, periodo = texto.split('/')
+    return int(numero), PERIODOS[periodo.strip()[0]]
+
+
+class BaldeDeFichas:
+    """Balde de fichas de um orçamento, com o estado de cada cliente na cache."""
+
+    def __init__(self, escopo, capacidade, periodo):
+        self.escopo = escopo
+        self.capacidade = capacidade
+        self.reposicao = capacidade / periodo  # fichas por segundo
+        self.periodo = periodo
+        # get + set na cache não são atómicos: as threads do processo passam
+        # uma de cada vez; entre processos a corrida pode deixar passar uma
+        # ficha a mais, o que não altera o limite de forma visível
+        self._lock = threading.Lock()
+
+    def consumir(self, cliente, agora=None):
+        """Gasta uma ficha; devolve 0 ou os segundos até haver uma."""
+        agora = time.time() if agora is None else agora
+        cache = caches[settings.ESCOLAS_LIMITES_CACHE_ALIAS]
+        chave = f'escolas:limite:{self.escopo}:{cliente}'
+        with self._lock:
+            fichas, instante = cache.get(chave) or (self.capacidade, agora)
+            fichas = min(self.capacidade, fichas + (agora - instante) * self.reposicao)
+            if fichas < 1:
+                return (1 - fichas) / self.reposicao
+            # Sem pedidos durante um período o balde já estaria cheio: a entrada expira
+            cache.set(chave, (fichas - 1, agora), self.periodo)
+        return 0
+
+
+class Compartimento:
+    """Número máximo de pedidos em curso de um orçamento neste processo."""
+
+    def __init__(self, limite):
+        self.limite = limite
+        self.em_curso = 0
+        self._lock = threading.Lock()
+
+    def entrar(self):
+        with self._lock:
+            if self.em_curso >= self.limite:
+                return False
+            self.em_curso += 1
+            return True
+
+    def sair(self):
+        with self._lock:
+            self.em_curso -= 1
+
+
+class Ocupado(Exception):
+    """Compartimento cheio ao calcular uma resposta que não estava em cache."""
+
+
+@contextmanager
+def ocupar(request):
+    """Ocupa o compartimento do pedido enquanto a vista calcula a resposta."""
+    compartimento = getattr(request, 'escolas_compartimento', None)
+    if compartimento is None:
+        yield
+        return
+    if not compartimento.entrar():
+        raise Ocupado
+    try:
+        yield
+    finally:
+        compartimento.sair()
+
+
+def _ident(request):
+    if api_settings.NUM_PROXIES is None:
+        return request.META.get('REMOTE_ADDR')
+    return BaseThrottle().get_ident(request)
+
+
+def _recusar(status, mensagem, segundos):
+    response = JsonResponse({'error': mensagem}, status=status)
+    response['Retry-After'] = str(max(1, math.ceil(segundos)))
+    return response
+
+
+def _ocupado():
+    return _recusar(503, 'Servidor ocupado. Tente novamente mais tarde.', 1)
+
+
+class LimitesMiddleware:
+    """Aplica os limites de cada orçamento; ver a documentação do módulo."""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.assincrono = iscoroutinefunction(get_response)
+        if self.assincrono:
+            markcoroutinefunction(self)
+        self.baldes = {}
+        self.compartimentos = {}
+        for escopo in (IMPORTACAO, BULK, LEITURA):
+            limite = taxa(getattr(settings, f'ESCOLAS_LIMITE_{escopo.upper()}'))
+            if limite:
+                self.baldes[escopo] = BaldeDeFichas(escopo, *limite)
+            concorrencia = getattr(settings, f'ESCOLAS_CONCORRENCIA_{escopo.upper()}')
+            if concorrencia:
+                self.compartimentos[escopo] = Compartimento(concorrencia)
+
+    def _escopo(self, request):
+        if not settings.ESCOLAS_LIMITES:
+            return None
+        try:
+            rota = resolve(request.path_info).url_name
+        except Resolver404:
+            return None
+        escopo = ESCOPOS.get((rota, request.method))
+        if escopo is not None and rota in COM_CACHE:
+            # A vista ocupa-o só se não houver 304 nem resposta em cache
+            request.escolas_compartimento = self.compartimentos.get(escopo)
+        return escopo
+
+    def _compartimento(self, request, escopo):
+        if getattr(request, 'escolas_compartimento', None) is not None:
+            return None
+        return self.compartimentos.get(escopo)
+
+    def _admitir(self, request, escopo):
+        """None se o pedido pode seguir, senão a resposta 429/503."""
+        compartimento = self._compartimento(request, escopo)
+        if compartimento is not None and not compartimento.entrar():
+            return _ocupado()
+        balde = self.baldes.get(escopo)
+        espera = balde.consumir(_ident(request)) if balde is not None else 0
+        if espera:
+            if compartimento is not None:
+                compartimento.sair()
+            return _recusar(429, 'Demasiados pedidos. Tente novamente mais tarde.', espera)
+        return None
+
+    def _libertar(self, request, escopo, response):
+        compartimento = self._compartimento(request, escopo)
+        if compartimento is None:
+            return
+        if response is not None and response.streaming:
+            # A exportação ocupa a thread até ao fim da transmissão
+            response._resource_closers.append(compartimento.sair)
+        else:
+            compartimento.sair()
+
+    def __call__(self, request):
+        if self.assincrono:
+            return self.__acall__(request)
+        escopo = self._escopo(request)
+        if escopo is None:
+            return self.get_response(request)
+        recusa = self._admitir(request, escopo)
+        if recusa is not None:
+            return recusa
+        response = None
+        try:
+            response = self.get_response(request)
+            return response
+        finally:
+            self._libertar(request, escopo, response)
+
+    async def __acall__(self, request):
+        escopo = self._escopo(request)
+        if escopo is None:
+            return await self.get_response(request)
+        recusa = self._admitir(request, escopo)
+        if recusa is not None:
+            return recusa
+        response = None
+        try:
+            response = await self.get_response(request)
+            return response
+        finally:
+            self._libertar(request, escopo, response)
+
+    def process_exception(self, request, exception):
+        if isinstance(exception, Ocupado):
+            return _ocupado()
+        return None
@@ -0,0 +1,164 @@
+"""Operações em lote sobre escolas (POST /escolas/bulk/).
+
+Cada operação é um objeto ``{"op": ..., "id": ..., "data": {...}}``:
+
+- ``create``: cria uma escola nova (o nome não pode existir);
+- ``upsert``: cria ou substitui a escola com o mesmo ``nome``;
+- ``patch``: atualiza parcialmente a escola ``id``;
+- ``delete``: elimina a escola ``id``.
+
+Todas as operações são validadas de uma vez (serializer sem consultas por
+item, unicidade e existência verificadas com uma consulta para o lote
+inteiro). Se alguma falhar nada é aplicado; senão são aplicadas numa única
+transação com ``delete``, ``bulk_update`` e ``bulk_create``.
+"""
+from django.db import transaction
+from django.utils import timezone
+from rest_framework.serializers import ValidationError, as_serializer_error
+
+from . import alteracoes
+from .models import Escola
+from .serializers import EscolaSerializer
+
+OPERACOES = ('create', 'upsert', 'patch', 'delete')
+CAMPOS = ['nome', 'email', 'numero_salas', 'provincia']
+
+
+class EscolaLoteSerializer(EscolaSerializer):
+    class Meta(EscolaSerializer.Meta):
+        # A unicidade de nome é verificada para o lote inteiro
+        extra_kwargs = {'nome': {'validators': []}}
+
+
+class Operacao:
+    def __init__(self, indice, item):
+        self.indice = indice
+        self.item = item if isinstance(item, dict) else {}
+        self.op = self.item.get('op')
+        self.id = self.item.get('id')
+        self.data = self.item.get('data')
+        self.validated_data = None
+        self.erros = {}
+        self.resultado = None
+        self.escola = None
+        self.existe = False
+        if not isinstance(item, dict):
+            self.erros['non_field_errors'] = ['Cada operação deve ser um objeto.']
+        elif self.op not in OPERACOES:
+            self.erros['op'] = [f'Operação inválida. Operações aceites: {", ".join(OPERACOES)}.']
+        elif self.op in ('patch', 'delete') and (isinstance(self.id, bool) or not isinstance(self.id, int)):
+            self.erros['id'] = ['Este campo é obrigatório e deve ser um inteiro.']
+        elif self.op != 'delete' and not isinstance(self.data, dict):
+            self.erros['data'] = ['Este campo é obrigatório e deve ser um objeto.']
+
+    @property
+    def nome(self):
+        if self.validated_data is not None:
+            return self.validated_data.get('nome')
+
+    def resposta(self):
+        if self.erros:
+            return {'indice': self.indice, 'op': self.op, 'status': 'erro', 'erros': self.erros}
+        if self.resultado is None:
+            return {'indice': self.indice, 'op': self.op, 'status': 'nao_aplicada'}
+        return {'indice': self.indice, 'op': self.op, 'status': self.resultado, 'id': self.escola.pk if self.escola else self.id}
+
+
+def aplicar(itens):
+    """Valida e aplica ``itens``; devolve ``(aplicado, resultados por item)``."""
+    operacoes = [Operacao(indice, item) for indice, item in enumerate(itens)]
+    _validar(operacoes)
+    if any(operacao.erros for operacao in operacoes):
+        return False, [operacao.resposta() for operacao in operacoes]
+
+    # O registrar do em_lote corre depois da transação: se esta falhar (um
+    # nome ocupado entretanto), já foi desfeita e a ligação continua utilizável
+    with alteracoes.em_lote(), transaction.atomic():
+        _aplicar(operacoes)
+    return True, [operacao.resposta() for operacao in operacoes]
+
+
+def _validar(operacoes):
+    validas = [operacao for operacao in operacoes if not operacao.erros]
+
+    ids = {operacao.id for operacao in validas if operacao.op in ('patch', 'delete')}
+    instancias = Escola.objects.in_bulk(ids)
+    for operacao in validas:
+        if operacao.op in ('patch', 'delete') and operacao.id not in instancias:
+            operacao.erros['id'] = ['Escola não encontrada.']
+
+    eliminadas = {operacao.id for operacao in validas if operacao.op == 'delete' and not operacao.erros}
+    # Um serializer por tipo de operação, reutilizado para todos os itens:
+    # construir os campos de um ModelSerializer custa mais do que validá-los.
+    serializers = {partial: EscolaLoteSerializer(partial=partial) for partial in (False, True)}
+    for operacao in validas:
+        if operacao.erros or operacao.op == 'delete':
+            continue
+        if operacao.op == 'patch' and operacao.id in eliminadas:
+            operacao.erros['id'] = ['A escola é eliminada noutra operação do lote.']
+            continue
+        try:
+            operacao.validated_data = serializers[operacao.op == 'patch'].run_validation(operacao.data)
+        except ValidationError as exc:
+            operacao.erros.update(as_serializer_error(exc))
+        else:
+            operacao.escola = instancias.get(operacao.id) if operacao.op == 'patch' else None
+
+    # Unicidade de nome: dentro do lote e contra a base de dados (uma consulta)
+    com_nome = [operacao for operacao in validas if not operacao.erros and operacao.nome is not None]
+    existentes = dict(
+        Escola.objects.filter(nome__in=[operacao.nome for operacao in com_nome]).order_by().values_list('nome', 'id')
+    )
+    vistos = set()
+    for operacao in com_nome:
+        if operacao.nome in vistos:
+            operacao.erros['nome'] = ['Nome repetido noutra operação do lote.']
+            continue
+        vistos.add(operacao.nome)
+        dono = existentes.get(operacao.nome)
+        operacao.existe = dono is not None and dono not in eliminadas
+        if dono is None or dono in eliminadas or operacao.op == 'upsert':
+            continue
+        if operacao.op == 'create' or dono != operacao.id:
+            operacao.erros['nome'] = ['escola with this Nome da Escola already exists.']
+
+
+def _aplicar(operacoes):
+    agora = timezone.now()
+
+    eliminar = [operacao for operacao in operacoes if operacao.op == 'delete']
+    if eliminar:
+        Escola.objects.filter(id__in=[operacao.id for operacao in eliminar]).delete()
+        for operacao in eliminar:
+            operacao.resultado = 'eliminada'
+
+    atualizar = [operacao for operacao in operacoes if operacao.op == 'patch']
+    if atualizar:
+        campos = {'atualizado_em'}
+        for operacao in atualizar:
+            for campo, valor in operacao.validated_data.items():
+                setattr(operacao.escola, campo, valor)
+                campos.add(campo)
+            operacao.escola.atualizado_em = agora
+            operacao.resultado = 'atualizada'
+        Escola.objects.bulk_update([operacao.escola for operacao in atualizar], sorted(campos))
+
+    criar = [operacao for operacao in operacoes if operacao.op == 'create']
+    for operacao in criar:
+        operacao.escola = Escola(**operacao.validated_data)
+        operacao.resultado = 'criada'
+    if criar:
+        # Ordenadas por nome, como na importação, para não haver deadlocks no índice único
+        Escola.objects.bulk_create(sorted((operacao.escola for operacao in criar), key=lambda escola: escola.nome))
+
+    substituir = [operacao for operacao in operacoes if operacao.op == 'upsert']
+    for operacao in substituir:
+        operacao.escola = Escola(**operacao.validated_data, atualizado_em=agora)
+        operacao.resultado = 'atualizada' if operacao.existe else 'criada'
+    if substituir:
+        Escola.objects.bulk_create(
+            sorted((operacao.escola for operacao in substituir), key=lambda escola: escola.nome),
+            update_conflicts=True, unique_fields=['nome'], update_fields=CAMPOS[1:] + ['atualizado_em'],
+        )
+
+    alteracoes.registrar([operacao.escola.pk if operacao.escola else operacao.id for operacao in operacoes])
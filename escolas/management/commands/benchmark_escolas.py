@@ -0,0 +1,177 @@
+import json
+import os
+import platform
+import time
+import tracemalloc
+
+import django
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client
+from django.utils import timezone
+
+from benchmarks import percentil, preparar_settings, semear, transacao_descartavel
+from benchmarks.importacao import gerar_arquivo
+
+# Métricas comparadas com a referência e o seu sentido: 1 se maior é pior,
+# -1 se menor é pior. O p95 fica nos resultados mas varia demais para decidir.
+METRICAS = {'p50_ms': 1, 'linhas_por_segundo': -1, 'memoria_pico_mb': 1}
+
+PROVINCIAS = ['Huíla', 'Namibe']
+
+
+class Command(BaseCommand):
+    help = (
+        "Mede listagem, detalhe, filtro por província, importação e exportação de escolas com N escolas "
+        "semeadas, grava os resultados em JSON e falha se houver regressões face a uma execução anterior."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--linhas', type=int, nargs='+', default=[1000, 10000],
+                            help="Tamanhos da tabela a medir (por exemplo 1000 100000 1000000).")
+        parser.add_argument('--repeticoes', type=int, default=20, help="Pedidos medidos por cenário.")
+        parser.add_argument('--linhas-importacao', type=int, default=10000, help="Linhas do arquivo importado.")
+        parser.add_argument('--formato-importacao', choices=['xlsx', 'csv'], default='xlsx')
+        parser.add_argument('--saida', help="Arquivo JSON onde gravar os resultados.")
+        parser.add_argument('--comparar', help="Resultados JSON de referência (de uma execução anterior com --saida).")
+        parser.add_argument('--limite', type=float, default=0.25,
+                            help="Piora relativa tolerada face à referência antes de falhar (0.25 = 25%%).")
+        parser.add_argument('--base-descartavel', action='store_true',
+                            help="Corre numa base de dados de teste criada e apagada pelo comando.")
+
+    def handle(self, *args, **options):
+        preparar_settings()
+        nome_original = connection.settings_dict['NAME']
+        if options['base_descartavel']:
+            connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        try:
+            resultados = self._executar(options)
+        finally:
+            if options['base_descartavel']:
+                connection.creation.destroy_test_db(nome_original, verbosity=0)
+
+        execucao = {'ambiente': self._ambiente(), 'resultados': resultados}
+        if options['saida']:
+            with open(options['saida'], 'w', encoding='utf-8') as saida:
+                json.dump(execucao, saida, indent=2, ensure_ascii=False)
+        else:
+            self.stdout.write(json.dumps(execucao, indent=2, ensure_ascii=False))
+
+        if options['comparar']:
+            with open(options['comparar'], encoding='utf-8') as entrada:
+                referencia = json.load(entrada)['resultados']
+            regressoes = comparar(referencia, resultados, options['limite'])
+            for regressao in regressoes:
+                self.stderr.write(
+                    '{linhas} linhas, {cenario}: {metrica} {antes} -> {depois} ({variacao:+.0%})'.format(**regressao)
+                )
+            if regressoes:
+                raise CommandError(f'{len(regressoes)} regressões acima de {options["limite"]:.0%}.')
+            self.stderr.write(self.style.SUCCESS('Sem regressões face à referência.'))
+
+    def _ambiente(self):
+        with connection.cursor() as cursor:
+            cursor.execute('SHOW server_version')
+            (postgresql,) = cursor.fetchone()
+        return {
+            'data': timezone.now().isoformat(),
+            'python': platform.python_version(),
+            'django': django.get_version(),
+            'postgresql': postgresql,
+            'cpus': os.cpu_count(),
+        }
+
+    def _executar(self, options):
+        resultados = []
+        for n in options['linhas']:
+            with transacao_descartavel():
+                inicio = time.perf_counter()
+                semear(n)
+                self.stderr.write(f'{n} escolas semeadas em {time.perf_counter() - inicio:.1f} s')
+                for cenario, funcao in self._cenarios(options).items():
+                    resultados.append({'linhas': n, 'cenario': cenario, **funcao()})
+        return resultados
+
+    def _cenarios(self, options):
+        from escolas.importacao import importar_blocos, ler_blocos
+        from escolas.models import Escola
+
+        client = Client()
+        ids = list(Escola.objects.filter(nome__startswith='Escola Benchmark ').values_list('id', flat=True)[:100])
+        repeticoes = options['repeticoes']
+
+        def importar(caminho, formato):
+            with transacao_descartavel(), open(caminho, 'rb') as arquivo:
+                importar_blocos(ler_blocos(arquivo, formato))
+
+        def importacao():
+            formato = options['formato_importacao']
+            with gerar_arquivo(options['linhas_importacao'], formato, prefixo='Escola Importada') as caminho:
+                inicio = time.perf_counter()
+                importar(caminho, formato)
+                duracao = time.perf_counter() - inicio
+                # Segunda importação só para a memória: o tracemalloc abranda-a
+                tracemalloc.start()
+                importar(caminho, formato)
+                _, pico = tracemalloc.get_traced_memory()
+                tracemalloc.stop()
+            return {
+                'formato': formato,
+                'linhas_importadas': options['linhas_importacao'],
+                'linhas_por_segundo': round(options['linhas_importacao'] / duracao),
+                'memoria_pico_mb': round(pico / 2**20, 1),
+            }
+
+        def exportacao():
+            total = Escola.objects.count()
+            inicio = time.perf_counter()
+            response = client.get('/escolas/export/?formato=csv')
+            tamanho = sum(len(bloco) for bloco in response.streaming_content)
+            duracao = time.perf_counter() - inicio
+            return {'bytes': tamanho, 'linhas_por_segundo': round(total / duracao)}
+
+        # Pelo Client do Django: URLs, middleware, vista, renderização (cache das leituras desligada)
+        return {
+            'lista': lambda: latencias(lambda i: client.get('/escolas/?page_size=100'), repeticoes),
+            'detalhe': lambda: latencias(lambda i: client.get(f'/escolas/{ids[i % len(ids)]}/'), repeticoes),
+            'filtro_provincia': lambda: latencias(lambda i: client.post(
+                '/escolas/filter_by_provincia/?page_size=100', {'provincias': PROVINCIAS},
+                content_type='application/json',
+            ), repeticoes),
+            'importacao': importacao,
+            'exportacao': exportacao,
+        }
+
+
+def latencias(pedido, repeticoes):
+    """p50/p95 de ``repeticoes`` chamadas a ``pedido(i)``, depois de um aquecimento."""
+    pedido(0)
+    amostras = []
+    for i in range(repeticoes):
+        inicio = time.perf_counter()
+        response = pedido(i)
+        amostras.append((time.perf_counter() - inicio) * 1000)
+        if response.status_code != 200:
+            raise CommandError(f'{response.request["PATH_INFO"]}: {response.status_code}')
+    return {'p50_ms': round(percentil(amostras, 50), 2), 'p95_ms': round(percentil(amostras, 95), 2)}
+
+
+def comparar(referencia, resultados, limite):
+    """Métricas de ``resultados`` piores que as de ``referencia`` em mais de ``limite``."""
+    anteriores = {(r['linhas'], r['cenario']): r for r in referencia}
+    regressoes = []
+    for resultado in resultados:
+        anterior = anteriores.get((resultado['linhas'], resultado['cenario']))
+        if anterior is None:
+            continue
+        for metrica, sentido in METRICAS.items():
+            antes, depois = anterior.get(metrica), resultado.get(metrica)
+            if not antes or depois is None:
+                continue
+            variacao = (depois - antes) / antes
+            if variacao * sentido > limite:
+                regressoes.append({
+                    'linhas': resultado['linhas'], 'cenario': resultado['cenario'], 'metrica': metrica,
+                    'antes': antes, 'depois': depois, 'variacao': variacao,
+                })
+    return regressoes
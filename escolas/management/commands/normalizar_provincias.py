@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+
+from escolas import provincias
+
+
+class Command(BaseCommand):
+    help = (
+        "Liga os triggers que mantêm as tabelas de províncias normalizadas e acerta-as com as escolas "
+        "existentes (necessário para ESCOLAS_PROVINCIAS_NORMALIZADAS=1), ou desliga-os com --desligar."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--desligar', action='store_true',
+                            help="Retira os triggers (com ESCOLAS_PROVINCIAS_NORMALIZADAS=0).")
+
+    def handle(self, *args, **options):
+        if options['desligar']:
+            provincias.desligar()
+            self.stdout.write(self.style.SUCCESS("Triggers das províncias normalizadas desligados."))
+            return
+        provincias.ligar()
+        self.stdout.write(self.style.SUCCESS("Triggers das províncias normalizadas ligados e tabelas sincronizadas."))
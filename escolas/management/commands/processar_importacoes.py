@@ -0,0 +1,55 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from escolas.tarefas import processar, recuperar, reservar
+
+
+class Command(BaseCommand):
+    help = "Processa as importações pendentes da fila (ESCOLAS_IMPORT_WORKER = 'comando')."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=1, help="Importações processadas em simultâneo.")
+        parser.add_argument('--intervalo', type=float, default=2.0, help="Segundos de espera com a fila vazia.")
+        parser.add_argument('--uma-vez', action='store_true', help="Esvazia a fila e termina.")
+
+    def handle(self, *args, **options):
+        threads = options['threads']
+        executor = ThreadPoolExecutor(max_workers=threads) if threads > 1 else None
+        try:
+            while True:
+                # Primeiro as importações que um processo terminado deixou a meio
+                recuperar()
+                if executor:
+                    processou = any(executor.map(self._processar_em_thread, range(threads)))
+                else:
+                    processou = self._processar_proxima()
+                if processou:
+                    continue
+                if options['uma_vez']:
+                    break
+                # Fila vazia: larga a conexão se expirou ou deixou de responder
+                close_old_connections()
+                time.sleep(options['intervalo'])
+        finally:
+            if executor:
+                executor.shutdown()
+
+    def _processar_em_thread(self, _):
+        # Cada importação é tratada como um pedido: a conexão desta thread só
+        # é reutilizada se o CONN_MAX_AGE e o health check o permitirem
+        close_old_connections()
+        try:
+            return self._processar_proxima()
+        finally:
+            close_old_connections()
+
+    def _processar_proxima(self):
+        importacao = reservar()
+        if importacao is None:
+            return False
+        processar(importacao)
+        self.stdout.write(f"{importacao}: {importacao.linhas_processadas} linhas processadas")
+        return True
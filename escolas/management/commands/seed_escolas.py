@@ -0,0 +1,192 @@
+import csv
+import io
+import random
+import time
+from itertools import accumulate
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from escolas import alteracoes, exportacao
+from escolas.models import Escola
+
+# Peso de cada província por omissão: população aproximada, em milhões
+PESOS_PROVINCIAS = {
+    'Bengo': 0.4, 'Benguela': 2.6, 'Bié': 1.7, 'Cabinda': 0.8, 'Cuando Cubango': 0.6, 'Cuanza Norte': 0.5,
+    'Cuanza Sul': 2.3, 'Cunene': 1.2, 'Huambo': 2.6, 'Huíla': 2.9, 'Luanda': 8.3, 'Lunda Norte': 1.0,
+    'Lunda Sul': 0.6, 'Malanje': 1.1, 'Moxico': 0.9, 'Namibe': 0.6, 'Uíge': 1.8, 'Zaire': 0.7,
+}
+
+TIPOS = [
+    ('Escola Primária', 'primaria'), ('Escola Secundária', 'secundaria'), ('Complexo Escolar', 'complexo'),
+    ('Colégio', 'colegio'), ('Liceu', 'liceu'), ('Instituto Médio', 'instituto'),
+]
+
+COPY = 'COPY {tabela} (nome, email, numero_salas, provincia) FROM STDIN WITH (FORMAT csv)'
+
+# Índices que não suportam restrições (os GIN e o de LIKE do nome): com
+# cargas grandes é mais rápido apagá-los e reconstruí-los no fim
+INDICES_SECUNDARIOS = '''
+    SELECT c.relname, pg_get_indexdef(i.indexrelid), c.reltuples
+    FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid
+    WHERE i.indrelid = %s::regclass AND NOT EXISTS (SELECT 1 FROM pg_constraint WHERE conindid = i.indexrelid)
+'''
+
+
+def gerar(linhas, seed=0, inicio=1, pesos=None, quantidades=(70, 25, 5), salas=(1, 40), bloco=10000):
+    """Gera blocos de tuplos (nome, email, numero_salas, [províncias]).
+
+    Os mesmos argumentos geram sempre as mesmas escolas. Nomes e e-mails são
+    únicos por número (``inicio`` ... ``inicio + linhas - 1``); o número de
+    províncias de cada escola segue os pesos de ``quantidades`` (1, 2, 3, ...)
+    e as províncias os de ``pesos``. Os sorteios são feitos por bloco, com um
+    ``choices(k=...)`` por coluna, e não linha a linha.
+    """
+    rng = random.Random(seed)
+    pesos = pesos or PESOS_PROVINCIAS
+    provincias = list(pesos)
+    acumulados = list(accumulate(pesos.values()))
+    n_provincias = range(1, len(quantidades) + 1)
+    acumulados_n = list(accumulate(quantidades))
+    numeros_salas = range(salas[0], salas[1] + 1)
+
+    for primeiro in range(inicio, inicio + linhas, bloco):
+        numeros = range(primeiro, min(primeiro + bloco, inicio + linhas))
+        tipos = rng.choices(TIPOS, k=len(numeros))
+        ks = rng.choices(n_provincias, cum_weights=acumulados_n, k=len(numeros))
+        sorteadas = iter(rng.choices(provincias, cum_weights=acumulados, k=sum(ks)))
+        yield [
+            # Sorteio com reposição: repetidas contam uma vez
+            (f'{tipo} N.º {i}', f'{prefixo}{i}@escolas.ao', n_salas,
+             list(dict.fromkeys(next(sorteadas) for _ in range(k))) if k > 1 else [next(sorteadas)])
+            for i, (tipo, prefixo), k, n_salas in zip(
+                numeros, tipos, ks, rng.choices(numeros_salas, k=len(numeros))
+            )
+        ]
+
+
+def _csv_copy(escolas, campos_array):
+    """Bloco no CSV do COPY. Nomes e e-mails gerados não têm vírgulas nem aspas."""
+    return io.StringIO(''.join(
+        f'{nome},{email},{n_salas},"{{{",".join([campos_array[p] for p in provincias])}}}"\n'
+        for nome, email, n_salas, provincias in escolas
+    ))
+
+
+def _campo_array(provincia):
+    # Elemento de um literal de array do PostgreSQL, já escapado para o CSV
+    return ('"' + provincia.replace('\\', '\\\\').replace('"', '\\"') + '"').replace('"', '""')
+
+
+def _pesos(texto):
+    pesos = {}
+    for par in texto.split(','):
+        provincia, _, peso = par.partition('=')
+        try:
+            pesos[provincia.strip()] = float(peso)
+        except ValueError:
+            raise CommandError(f'Peso inválido: "{par}" (use Província=peso).')
+    return pesos
+
+
+class Command(BaseCommand):
+    help = (
+        "Gera escolas sintéticas (determinísticas por --seed) e insere-as com COPY na base de dados, "
+        "ou grava-as num arquivo CSV/XLSX para o /escolas/upload-excel/."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('linhas', type=int, help="Número de escolas a gerar.")
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--inicio', type=int, default=1,
+                            help="Número da primeira escola; use outro intervalo para juntar escolas a uma tabela já semeada.")
+        parser.add_argument('--arquivo', help="Grava num arquivo .csv ou .xlsx em vez de inserir na base de dados.")
+        parser.add_argument('--pesos', type=_pesos,
+                            help="Pesos das províncias, por exemplo 'Luanda=5,Huíla=2,Bengo=1' (omissão: população).")
+        parser.add_argument('--uniforme', action='store_true', help="Todas as províncias com o mesmo peso.")
+        parser.add_argument('--provincias-por-escola', default='70,25,5',
+                            help="Pesos de 1, 2, 3, ... províncias por escola.")
+        parser.add_argument('--salas', default='1-40', help="Intervalo do número de salas, MIN-MAX.")
+        parser.add_argument('--bloco', type=int, default=10000, help="Escolas geradas e enviadas por COPY de cada vez.")
+        parser.add_argument('--indices', choices=['auto', 'recriar', 'manter'], default='auto',
+                            help="Apagar os índices secundários durante o COPY e recriá-los no fim "
+                                 "(auto: quando as escolas novas são pelo menos tantas como as existentes).")
+        parser.add_argument('--sem-vacuum', action='store_true', help="Não corre VACUUM ANALYZE no fim.")
+
+    def handle(self, *args, **options):
+        try:
+            quantidades = [float(peso) for peso in options['provincias_por_escola'].split(',')]
+            salas = tuple(int(valor) for valor in options['salas'].split('-'))
+        except ValueError:
+            raise CommandError('--provincias-por-escola e --salas devem ser números (70,25,5 e 1-40).')
+        if len(salas) != 2 or salas[0] > salas[1]:
+            raise CommandError('--salas deve ser MIN-MAX.')
+        pesos = options['pesos'] or PESOS_PROVINCIAS
+        if options['uniforme']:
+            pesos = dict.fromkeys(pesos, 1)
+
+        escolas = gerar(options['linhas'], options['seed'], options['inicio'], pesos, quantidades, salas, options['bloco'])
+        inicio = time.perf_counter()
+        fases = {}
+        if options['arquivo']:
+            self._arquivo(escolas, options['arquivo'])
+        else:
+            self._copy(escolas, pesos, options['indices'], options['linhas'], fases)
+            # O VACUUM não corre dentro de transações (por exemplo nos testes)
+            if not options['sem_vacuum'] and not connection.in_atomic_block:
+                # Esvazia a lista pendente dos índices GIN e atualiza as estatísticas
+                antes = time.perf_counter()
+                with connection.cursor() as cursor:
+                    cursor.execute(f'VACUUM ANALYZE {Escola._meta.db_table}')
+                fases['VACUUM'] = time.perf_counter() - antes
+        duracao = time.perf_counter() - inicio
+        detalhe = ''.join(f', {fase} {segundos:.1f} s' for fase, segundos in fases.items())
+        self.stdout.write(self.style.SUCCESS(
+            f"{options['linhas']} escolas geradas em {duracao:.1f} s ({options['linhas'] / duracao:.0f} linhas/s{detalhe})."
+        ))
+
+    def _copy(self, escolas, pesos, indices, linhas, fases):
+        tabela = Escola._meta.db_table
+        sql = COPY.format(tabela=connection.ops.quote_name(tabela))
+        campos_array = {provincia: _campo_array(provincia) for provincia in pesos}
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute(INDICES_SECUNDARIOS, [tabela])
+            secundarios = cursor.fetchall()
+            # reltuples do próprio índice: estimativa das linhas já existentes, sem COUNT(*)
+            existentes = max((reltuples for _, _, reltuples in secundarios), default=0)
+            recriar = indices == 'recriar' or (indices == 'auto' and linhas >= existentes)
+            if recriar:
+                for nome, _, _ in secundarios:
+                    cursor.execute(f'DROP INDEX {connection.ops.quote_name(nome)}')
+
+            antes = time.perf_counter()
+            for bloco in escolas:
+                cursor.copy_expert(sql, _csv_copy(bloco, campos_array))
+            fases['COPY'] = time.perf_counter() - antes
+
+            if recriar:
+                antes = time.perf_counter()
+                cursor.execute("SET LOCAL maintenance_work_mem = '256MB'")
+                for _, definicao, _ in secundarios:
+                    cursor.execute(definicao)
+                fases['índices'] = time.perf_counter() - antes
+            alteracoes.registrar()
+
+    def _arquivo(self, escolas, caminho):
+        # provincia como no Excel de importação: "Luanda,Bengo"
+        linhas = (
+            (nome, email, n_salas, ','.join(provincias))
+            for bloco in escolas for nome, email, n_salas, provincias in bloco
+        )
+        if caminho.lower().endswith('.xlsx'):
+            # Mesmo escritor e colunas da exportação, que o upload aceita de volta
+            with open(caminho, 'wb') as saida:
+                for parte in exportacao.xlsx(linhas):
+                    saida.write(parte)
+        elif caminho.lower().endswith('.csv'):
+            with open(caminho, 'w', encoding='utf-8', newline='') as saida:
+                escritor = csv.writer(saida)
+                escritor.writerow(exportacao.COLUNAS)
+                escritor.writerows(linhas)
+        else:
+            raise CommandError('O arquivo deve terminar em .csv ou .xlsx.')
@@ -0,0 +1,234 @@
+"""Instrumentação dos pedidos: tempos, consultas SQL e bytes da resposta.
+
+O ``MetricasMiddleware`` mede, para uma fração dos pedidos
+(``ESCOLAS_METRICS_SAMPLE_RATE``), o tempo total, o número e o tempo das
+consultas SQL, o tempo de serialização e os bytes da resposta. A resposta
+leva-os no cabeçalho ``Server-Timing`` e os valores acumulam-se em
+histogramas servidos em /metrics no formato de texto do Prometheus.
+
+As consultas são contadas por um ``execute_wrapper`` instalado em cada
+conexão quando é aberta (ver signals.py), incluindo as das threads de
+``sync_to_async`` e do pool de uploads, que herdam o contexto do pedido.
+Outras fases medem-se com ``medir``::
+
+    with metricas.medir('serializacao'):
+        data = escola_leitura.data(linhas)
+
+Sem pedido amostrado em curso, ``medir`` e o wrapper não fazem nada.
+Os histogramas são por processo: com vários workers cada um tem os seus.
+"""
+import random
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.http import HttpResponse
+
+# Medição do pedido em curso (None fora de pedidos amostrados)
+_atual = ContextVar('escolas_medicao', default=None)
+
+SEGUNDOS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+CONSULTAS = (0, 1, 2, 3, 5, 10, 20, 50, 100, 500, 1000)
+BYTES = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216)
+
+
+class Medicao:
+    __slots__ = ('inicio', 'consultas', 'bd', 'fases')
+
+    def __init__(self):
+        self.inicio = time.perf_counter()
+        self.consultas = 0
+        self.bd = 0.0
+        self.fases = {}
+
+    def adicionar(self, fase, segundos):
+        self.fases[fase] = self.fases.get(fase, 0.0) + segundos
+
+
+def execute_wrapper(execute, sql, params, many, context):
+    medicao = _atual.get()
+    if medicao is None:
+        return execute(sql, params, many, context)
+    inicio = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        medicao.bd += time.perf_counter() - inicio
+        medicao.consultas += 1
+
+
+@contextmanager
+def medir(fase):
+    """Soma o tempo do bloco à ``fase`` do pedido em curso."""
+    medicao = _atual.get()
+    if medicao is None:
+        yield
+        return
+    inicio = time.perf_counter()
+    try:
+        yield
+    finally:
+        medicao.adicionar(fase, time.perf_counter() - inicio)
+
+
+def _escapar(valor):
+    return str(valor).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _rotulos(nomes, valores, **extra):
+    pares = [*zip(nomes, valores), *extra.items()]
+    return '{' + ','.join(f'{nome}="{_escapar(valor)}"' for nome, valor in pares) + '}'
+
+
+class Histograma:
+    def __init__(self, nome, ajuda, limites, rotulos=('vista', 'metodo')):
+        self.nome = nome
+        self.ajuda = ajuda
+        self.limites = limites
+        self.rotulos = rotulos
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observar(self, valor, *rotulos):
+        # Contagens por intervalo; acumuladas só na exportação
+        indice = bisect_left(self.limites, valor)
+        with self._lock:
+            serie = self._series.get(rotulos)
+            if serie is None:
+                serie = self._series[rotulos] = [[0] * (len(self.limites) + 1), 0.0]
+            serie[0][indice] += 1
+            serie[1] += valor
+
+    def exportar(self):
+        linhas = [f'# HELP {self.nome} {self.ajuda}', f'# TYPE {self.nome} histogram']
+        with self._lock:
+            series = [(rotulos, list(contagens), soma) for rotulos, (contagens, soma) in self._series.items()]
+        for rotulos, contagens, soma in sorted(series):
+            acumulado = 0
+            for limite, contagem in zip((*self.limites, '+Inf'), contagens):
+                acumulado += contagem
+                linhas.append(f'{self.nome}_bucket{_rotulos(self.rotulos, rotulos, le=limite)} {acumulado}')
+            linhas.append(f'{self.nome}_sum{_rotulos(self.rotulos, rotulos)} {soma}')
+            linhas.append(f'{self.nome}_count{_rotulos(self.rotulos, rotulos)} {acumulado}')
+        return linhas
+
+
+class Contador:
+    def __init__(self, nome, ajuda, rotulos):
+        self.nome = nome
+        self.ajuda = ajuda
+        self.rotulos = rotulos
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def incrementar(self, *rotulos):
+        with self._lock:
+            self._series[rotulos] = self._series.get(rotulos, 0) + 1
+
+    def exportar(self):
+        linhas = [f'# HELP {self.nome} {self.ajuda}', f'# TYPE {self.nome} counter']
+        with self._lock:
+            series = sorted(self._series.items())
+        linhas.extend(f'{self.nome}{_rotulos(self.rotulos, rotulos)} {valor}' for rotulos, valor in series)
+        return linhas
+
+
+pedidos = Contador('escolas_pedidos_total', 'Pedidos amostrados.', ('vista', 'metodo', 'estado'))
+duracao = Histograma('escolas_pedido_duracao_segundos', 'Tempo total do pedido.', SEGUNDOS)
+consultas = Histograma('escolas_pedido_consultas', 'Consultas SQL por pedido.', CONSULTAS)
+bd = Histograma('escolas_pedido_bd_segundos', 'Tempo gasto nas consultas SQL por pedido.', SEGUNDOS)
+serializacao = Histograma('escolas_pedido_serializacao_segundos', 'Tempo de serialização por pedido.', SEGUNDOS)
+resposta_bytes = Histograma('escolas_resposta_bytes', 'Tamanho do corpo da resposta.', BYTES)
+METRICAS = (pedidos, duracao, consultas, bd, serializacao, resposta_bytes)
+
+
+def _vista(request):
+    # O nome da rota (escola-list, escola-detail, ...) e não o caminho, para
+    # o número de séries não crescer com os ids
+    match = getattr(request, 'resolver_match', None)
+    return (match.view_name or match.route) if match else 'sem_rota'
+
+
+def _registar(medicao, request, response):
+    total = time.perf_counter() - medicao.inicio
+    tempo_serializacao = medicao.fases.get('serializacao', 0.0)
+    rotulos = (_vista(request), request.method)
+
+    pedidos.incrementar(*rotulos, response.status_code)
+    duracao.observar(total, *rotulos)
+    consultas.observar(medicao.consultas, *rotulos)
+    bd.observar(medicao.bd, *rotulos)
+    serializacao.observar(tempo_serializacao, *rotulos)
+
+    cabecalho = [
+        f'total;dur={total * 1000:.2f}',
+        f'db;dur={medicao.bd * 1000:.2f};desc="consultas: {medicao.consultas}"',
+        *(f'{fase};dur={segundos * 1000:.2f}' for fase, segundos in medicao.fases.items()),
+    ]
+    # Nas respostas em streaming o tamanho só se conhece no fim da transmissão
+    if not response.streaming:
+        resposta_bytes.observar(len(response.content), *rotulos)
+        cabecalho.append(f'resposta;desc="{len(response.content)} bytes"')
+    response['Server-Timing'] = ', '.join(cabecalho)
+    return response
+
+
+class MetricasMiddleware:
+    """Mede os pedidos amostrados; ver a documentação do módulo."""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.assincrono = iscoroutinefunction(get_response)
+        if self.assincrono:
+            markcoroutinefunction(self)
+
+    def _amostrado(self):
+        taxa = settings.ESCOLAS_METRICS_SAMPLE_RATE
+        return taxa >= 1 or (taxa > 0 and random.random() < taxa)
+
+    def __call__(self, request):
+        if self.assincrono:
+            return self.__acall__(request)
+        if not self._amostrado():
+            return self.get_response(request)
+        medicao = Medicao()
+        token = _atual.set(medicao)
+        try:
+            response = self.get_response(request)
+        finally:
+            _atual.reset(token)
+        return _registar(medicao, request, response)
+
+    async def __acall__(self, request):
+        if not self._amostrado():
+            return await self.get_response(request)
+        medicao = Medicao()
+        token = _atual.set(medicao)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _atual.reset(token)
+        return _registar(medicao, request, response)
+
+    def process_template_response(self, request, response):
+        # As respostas do DRF são renderizadas logo a seguir a este método
+        medicao = _atual.get()
+        if medicao is not None:
+            inicio = time.perf_counter()
+            response.add_post_render_callback(
+                lambda response: medicao.adicionar('serializacao', time.perf_counter() - inicio)
+            )
+        return response
+
+
+def exportar(request):
+    """GET /metrics: os histogramas no formato de texto do Prometheus."""
+    linhas = [linha for metrica in METRICAS for linha in metrica.exportar()]
+    return HttpResponse('\n'.join(linhas) + '\n', content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -0,0 +1,33 @@
+# Generated by Django 5.0.4 on 2026-10-18 17:24
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('escolas', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Importacao',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('arquivo', models.FileField(upload_to='importacoes/', verbose_name='Arquivo')),
+                ('formato', models.CharField(default='xlsx', max_length=4, verbose_name='Formato')),
+                ('estado', models.CharField(choices=[('pendente', 'Pendente'), ('em_curso', 'Em curso'), ('concluida', 'Concluída'), ('falhada', 'Falhada')], default='pendente', max_length=10, verbose_name='Estado')),
+                ('linhas_processadas', models.PositiveIntegerField(default=0, verbose_name='Linhas processadas')),
+                ('linhas_falhadas', models.PositiveIntegerField(default=0, verbose_name='Linhas falhadas')),
+                ('relatorio', models.TextField(blank=True, verbose_name='Relatório')),
+                ('erro', models.TextField(blank=True, verbose_name='Erro')),
+                ('criada_em', models.DateTimeField(auto_now_add=True, verbose_name='Criada em')),
+                ('iniciada_em', models.DateTimeField(blank=True, null=True, verbose_name='Iniciada em')),
+                ('concluida_em', models.DateTimeField(blank=True, null=True, verbose_name='Concluída em')),
+            ],
+            options={
+                'ordering': ['criada_em'],
+                'indexes': [models.Index(fields=['estado', 'criada_em'], name='escolas_imp_estado_b6aa02_idx')],
+            },
+        ),
+    ]
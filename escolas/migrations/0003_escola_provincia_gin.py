@@ -0,0 +1,18 @@
+# Generated by Django 5.0.4 on 2026-10-18 17:25
+
+import django.contrib.postgres.indexes
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('escolas', '0002_importacao'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='escola',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['provincia'], name='escola_provincia_gin'),
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 5.0.4 on 2026-10-18 17:31
+
+import django.db.models.functions.datetime
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('escolas', '0003_escola_provincia_gin'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Versao',
+            fields=[
+                ('tabela', models.CharField(max_length=63, primary_key=True, serialize=False, verbose_name='Tabela')),
+                ('valor', models.BigIntegerField(default=1, verbose_name='Versão')),
+                ('atualizado_em', models.DateTimeField(db_default=django.db.models.functions.datetime.Now(), verbose_name='Atualizado em')),
+            ],
+        ),
+        migrations.AddField(
+            model_name='escola',
+            name='atualizado_em',
+            field=models.DateTimeField(auto_now=True, db_default=django.db.models.functions.datetime.Now(), verbose_name='Atualizado em'),
+        ),
+    ]
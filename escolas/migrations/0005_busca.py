@@ -0,0 +1,41 @@
+# Generated by Django 5.0.4 on 2026-10-18 17:38
+
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+from django.db import migrations, models
+
+# Índice de trigramas para a pesquisa aproximada por nome. O pg_trgm é uma
+# extensão contrib: só é criado se estiver disponível no servidor e o
+# utilizador tiver permissão; senão a pesquisa fica só com o tsvector.
+TRIGRAMAS = '''
+DO $$
+BEGIN
+    IF EXISTS (SELECT 1 FROM pg_available_extensions WHERE name = 'pg_trgm') THEN
+        CREATE EXTENSION IF NOT EXISTS pg_trgm;
+        CREATE INDEX IF NOT EXISTS escola_nome_trgm ON escolas_escola USING gin (nome gin_trgm_ops);
+    END IF;
+EXCEPTION WHEN insufficient_privilege THEN
+    RAISE NOTICE 'pg_trgm indisponível: pesquisa aproximada desativada.';
+END
+$$;
+'''
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('escolas', '0004_versoes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='escola',
+            name='busca',
+            field=models.GeneratedField(db_persist=True, expression=django.contrib.postgres.search.CombinedSearchVector(django.contrib.postgres.search.SearchVector('nome', config='simple', weight='A'), '||', django.contrib.postgres.search.SearchVector('email', config='simple', weight='B'), django.contrib.postgres.search.SearchConfig('simple')), output_field=django.contrib.postgres.search.SearchVectorField()),
+        ),
+        migrations.AddIndex(
+            model_name='escola',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['busca'], name='escola_busca_gin'),
+        ),
+        migrations.RunSQL(TRIGRAMAS, 'DROP INDEX IF EXISTS escola_nome_trgm;'),
+    ]
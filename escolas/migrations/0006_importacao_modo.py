@@ -0,0 +1,23 @@
+# Generated by Django 5.0.4 on 2026-10-18 18:16
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('escolas', '0005_busca'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='importacao',
+            name='apagar_ausentes',
+            field=models.BooleanField(default=False, verbose_name='Apagar escolas ausentes do arquivo'),
+        ),
+        migrations.AddField(
+            model_name='importacao',
+            name='modo',
+            field=models.CharField(choices=[('insert', 'Inserção'), ('upsert', 'Inserção ou atualização por nome')], default='insert', max_length=6, verbose_name='Modo'),
+        ),
+    ]
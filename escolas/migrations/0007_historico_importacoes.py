@@ -0,0 +1,44 @@
+# Generated by Django 5.0.4 on 2026-10-18 18:20
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('escolas', '0006_importacao_modo'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArquivoImportado',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('hash', models.CharField(max_length=64, verbose_name='SHA-256 do arquivo')),
+                ('modo', models.CharField(choices=[('insert', 'Inserção'), ('upsert', 'Inserção ou atualização por nome')], max_length=6, verbose_name='Modo')),
+                ('apagar_ausentes', models.BooleanField(default=False, verbose_name='Apagar escolas ausentes do arquivo')),
+                ('versao', models.BigIntegerField(verbose_name='Versão das escolas')),
+                ('linhas_processadas', models.PositiveIntegerField(default=0, verbose_name='Linhas processadas')),
+                ('linhas_falhadas', models.PositiveIntegerField(default=0, verbose_name='Linhas falhadas')),
+                ('relatorio', models.TextField(blank=True, verbose_name='Relatório')),
+                ('importado_em', models.DateTimeField(auto_now=True, verbose_name='Importado em')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='LinhaImportada',
+            fields=[
+                ('escola', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='+', serialize=False, to='escolas.escola')),
+                ('hash', models.CharField(max_length=32, verbose_name='Hash da linha')),
+                ('atualizado_em', models.DateTimeField(verbose_name='Escola atualizada em')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='arquivoimportado',
+            constraint=models.UniqueConstraint(fields=('hash', 'modo', 'apagar_ausentes'), name='arquivo_importado_unico'),
+        ),
+        migrations.AddIndex(
+            model_name='linhaimportada',
+            index=models.Index(fields=['hash'], name='linha_importada_hash'),
+        ),
+    ]
@@ -0,0 +1,32 @@
+from django.db import migrations
+
+# Os DELETE em SQL (o delete_missing do upsert, por exemplo) não passam pelo
+# CASCADE do Django: a chave estrangeira do histórico apaga-se na própria
+# base de dados, com o mesmo nome e DEFERRABLE como as criadas pelo Django.
+CHAVE = '''
+DO $$
+DECLARE
+    restricao text;
+BEGIN
+    SELECT conname INTO restricao FROM pg_constraint
+    WHERE conrelid = 'escolas_linhaimportada'::regclass AND contype = 'f';
+    EXECUTE format('ALTER TABLE escolas_linhaimportada DROP CONSTRAINT %%I', restricao);
+    EXECUTE format(
+        'ALTER TABLE escolas_linhaimportada ADD CONSTRAINT %%I FOREIGN KEY (escola_id) '
+        'REFERENCES escolas_escola (id) %s DEFERRABLE INITIALLY DEFERRED',
+        restricao
+    );
+END
+$$;
+'''
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('escolas', '0007_historico_importacoes'),
+    ]
+
+    operations = [
+        migrations.RunSQL(CHAVE % 'ON DELETE CASCADE', CHAVE % ''),
+    ]
@@ -0,0 +1,163 @@
+# Generated by Django 5.0.4 on 2026-10-18 18:29
+
+import django.db.models.deletion
+import django.db.models.functions.text
+from django.db import migrations, models
+
+# Ver escolas/provincias.py. Um trigger BEFORE por linha normaliza o array
+# provincia (espaços, repetições e a grafia já registada em escolas_provincia)
+# e triggers por instrução, com as tabelas de transição, mantêm
+# escolas_provincia e escolas_escolaprovincia numa única passagem por INSERT
+# ou UPDATE, seja ele do ORM, de um bulk_create, de um COPY ou de SQL.
+FUNCOES = r"""
+CREATE FUNCTION escolas_canonizar_provincias(provincias varchar[]) RETURNS varchar[]
+LANGUAGE sql STABLE AS $$
+    SELECT coalesce(array_agg(coalesce(p.nome, u.nome) ORDER BY u.ordem), '{}')
+    FROM (
+        SELECT DISTINCT ON (lower(nome)) nome, ordem
+        FROM (
+            SELECT btrim(regexp_replace(valor, '\s+', ' ', 'g')) AS nome, ordem
+            FROM unnest(provincias) WITH ORDINALITY AS v(valor, ordem)
+        ) limpas
+        WHERE nome <> ''
+        ORDER BY lower(nome), ordem
+    ) u
+    LEFT JOIN escolas_provincia p ON lower(p.nome) = lower(u.nome)
+$$;
+
+CREATE FUNCTION escolas_escola_canonizar_provincias() RETURNS trigger
+LANGUAGE plpgsql AS $$
+BEGIN
+    NEW.provincia := escolas_canonizar_provincias(NEW.provincia);
+    RETURN NEW;
+END
+$$;
+
+CREATE FUNCTION escolas_escola_provincias_inseridas() RETURNS trigger
+LANGUAGE plpgsql AS $$
+BEGIN
+    INSERT INTO escolas_provincia (nome)
+    SELECT DISTINCT ON (lower(v)) v FROM novas n, unnest(n.provincia) v ORDER BY lower(v)
+    ON CONFLICT DO NOTHING;
+    INSERT INTO escolas_escolaprovincia (escola_id, provincia_id)
+    SELECT n.id, p.id FROM novas n, unnest(n.provincia) v JOIN escolas_provincia p ON lower(p.nome) = lower(v)
+    ON CONFLICT DO NOTHING;
+    RETURN NULL;
+END
+$$;
+
+CREATE FUNCTION escolas_escola_provincias_atualizadas() RETURNS trigger
+LANGUAGE plpgsql AS $$
+BEGIN
+    -- Só as escolas cujo array mudou
+    DELETE FROM escolas_escolaprovincia ep
+    USING novas n, antigas a, escolas_provincia p
+    WHERE a.id = n.id AND a.provincia IS DISTINCT FROM n.provincia
+      AND ep.escola_id = n.id AND p.id = ep.provincia_id
+      AND lower(p.nome) <> ALL (SELECT lower(v) FROM unnest(n.provincia) v);
+    INSERT INTO escolas_provincia (nome)
+    SELECT DISTINCT ON (lower(v)) v
+    FROM novas n JOIN antigas a ON a.id = n.id, unnest(n.provincia) v
+    WHERE a.provincia IS DISTINCT FROM n.provincia
+    ORDER BY lower(v)
+    ON CONFLICT DO NOTHING;
+    INSERT INTO escolas_escolaprovincia (escola_id, provincia_id)
+    SELECT n.id, p.id
+    FROM novas n JOIN antigas a ON a.id = n.id, unnest(n.provincia) v
+    JOIN escolas_provincia p ON lower(p.nome) = lower(v)
+    WHERE a.provincia IS DISTINCT FROM n.provincia
+    ON CONFLICT DO NOTHING;
+    RETURN NULL;
+END
+$$;
+
+CREATE TRIGGER escola_canonizar_provincias BEFORE INSERT OR UPDATE OF provincia ON escolas_escola
+    FOR EACH ROW EXECUTE FUNCTION escolas_escola_canonizar_provincias();
+CREATE TRIGGER escola_provincias_inseridas AFTER INSERT ON escolas_escola
+    REFERENCING NEW TABLE AS novas
+    FOR EACH STATEMENT EXECUTE FUNCTION escolas_escola_provincias_inseridas();
+CREATE TRIGGER escola_provincias_atualizadas AFTER UPDATE ON escolas_escola
+    REFERENCING OLD TABLE AS antigas NEW TABLE AS novas
+    FOR EACH STATEMENT EXECUTE FUNCTION escolas_escola_provincias_atualizadas();
+"""
+
+REMOVER_FUNCOES = """
+DROP TRIGGER IF EXISTS escola_provincias_atualizadas ON escolas_escola;
+DROP TRIGGER IF EXISTS escola_provincias_inseridas ON escolas_escola;
+DROP TRIGGER IF EXISTS escola_canonizar_provincias ON escolas_escola;
+DROP FUNCTION IF EXISTS escolas_escola_provincias_atualizadas();
+DROP FUNCTION IF EXISTS escolas_escola_provincias_inseridas();
+DROP FUNCTION IF EXISTS escolas_escola_canonizar_provincias();
+DROP FUNCTION IF EXISTS escolas_canonizar_provincias(varchar[]);
+"""
+
+# Dados existentes: cada província fica com a grafia mais usada, os arrays
+# são normalizados (com atualizado_em novo, para os ETags mudarem) e a tabela
+# de ligação é preenchida para todas as escolas
+NORMALIZAR = r"""
+INSERT INTO escolas_provincia (nome)
+SELECT DISTINCT ON (lower(nome)) nome
+FROM (
+    SELECT btrim(regexp_replace(v, '\s+', ' ', 'g')) AS nome, count(*) AS escolas
+    FROM escolas_escola e, unnest(e.provincia) v
+    GROUP BY 1
+) contagem
+WHERE nome <> ''
+ORDER BY lower(nome), escolas DESC, nome
+ON CONFLICT DO NOTHING;
+
+UPDATE escolas_escola SET provincia = escolas_canonizar_provincias(provincia), atualizado_em = now()
+WHERE provincia IS DISTINCT FROM escolas_canonizar_provincias(provincia);
+
+INSERT INTO escolas_escolaprovincia (escola_id, provincia_id)
+SELECT e.id, p.id FROM escolas_escola e, unnest(e.provincia) v JOIN escolas_provincia p ON lower(p.nome) = lower(v)
+ON CONFLICT DO NOTHING;
+
+UPDATE escolas_versao SET valor = valor + 1, atualizado_em = now() WHERE tabela = 'escolas_escola';
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('escolas', '0008_linhaimportada_cascade'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Provincia',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('nome', models.CharField(max_length=255, verbose_name='Nome')),
+            ],
+            options={
+                'ordering': ['nome'],
+            },
+        ),
+        migrations.CreateModel(
+            name='EscolaProvincia',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('escola', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='escolas.escola')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='provincia',
+            constraint=models.UniqueConstraint(django.db.models.functions.text.Lower('nome'), name='provincia_nome_unico'),
+        ),
+        migrations.AddField(
+            model_name='escolaprovincia',
+            name='provincia',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.PROTECT, related_name='+', to='escolas.provincia'),
+        ),
+        migrations.AddIndex(
+            model_name='escolaprovincia',
+            index=models.Index(fields=['provincia', 'escola'], name='escola_provincia_provincia'),
+        ),
+        migrations.AddConstraint(
+            model_name='escolaprovincia',
+            constraint=models.UniqueConstraint(fields=('escola', 'provincia'), name='escola_provincia_unica'),
+        ),
+        migrations.RunSQL(FUNCOES, REMOVER_FUNCOES),
+        migrations.RunSQL(NORMALIZAR, migrations.RunSQL.noop),
+    ]
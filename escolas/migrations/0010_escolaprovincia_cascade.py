@@ -0,0 +1,33 @@
+from django.db import migrations
+
+# Como em 0008: os DELETE de escolas em SQL apagam as suas linhas da tabela
+# de ligação. A chave estrangeira só existe depois de 0009 (o Django cria-a
+# no fim da migração), por isso a alteração fica nesta.
+CHAVE = '''
+DO $$
+DECLARE
+    restricao text;
+BEGIN
+    SELECT conname INTO restricao FROM pg_constraint
+    WHERE conrelid = 'escolas_escolaprovincia'::regclass AND contype = 'f'
+      AND confrelid = 'escolas_escola'::regclass;
+    EXECUTE format('ALTER TABLE escolas_escolaprovincia DROP CONSTRAINT %%I', restricao);
+    EXECUTE format(
+        'ALTER TABLE escolas_escolaprovincia ADD CONSTRAINT %%I FOREIGN KEY (escola_id) '
+        'REFERENCES escolas_escola (id) %s DEFERRABLE INITIALLY DEFERRED',
+        restricao
+    );
+END
+$$;
+'''
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('escolas', '0009_provincias_normalizadas'),
+    ]
+
+    operations = [
+        migrations.RunSQL(CHAVE % 'ON DELETE CASCADE', CHAVE % ''),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.0.4 on 2026-10-18 19:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('escolas', '0010_escolaprovincia_cascade'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='importacao',
+            name='batida_em',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='Último sinal de vida'),
+        ),
+        migrations.AddField(
+            model_name='importacao',
+            name='tentativas',
+            field=models.PositiveSmallIntegerField(default=0, verbose_name='Tentativas'),
+        ),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 5.0.4 on 2026-10-18 20:10
+
+from django.db import migrations
+
+# Os triggers de 0009 custam em todas as escritas e reescrevem a grafia das
+# províncias enviada pelos clientes: passam a ser instalados só por
+# "manage.py normalizar_provincias" (ver escolas/provincias.py). As tabelas e
+# as funções ficam.
+TRIGGERS = """
+CREATE TRIGGER escola_canonizar_provincias BEFORE INSERT OR UPDATE OF provincia ON escolas_escola
+    FOR EACH ROW EXECUTE FUNCTION escolas_escola_canonizar_provincias();
+CREATE TRIGGER escola_provincias_inseridas AFTER INSERT ON escolas_escola
+    REFERENCING NEW TABLE AS novas
+    FOR EACH STATEMENT EXECUTE FUNCTION escolas_escola_provincias_inseridas();
+CREATE TRIGGER escola_provincias_atualizadas AFTER UPDATE ON escolas_escola
+    REFERENCING OLD TABLE AS antigas NEW TABLE AS novas
+    FOR EACH STATEMENT EXECUTE FUNCTION escolas_escola_provincias_atualizadas();
+"""
+
+REMOVER_TRIGGERS = """
+DROP TRIGGER IF EXISTS escola_provincias_atualizadas ON escolas_escola;
+DROP TRIGGER IF EXISTS escola_provincias_inseridas ON escolas_escola;
+DROP TRIGGER IF EXISTS escola_canonizar_provincias ON escolas_escola;
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('escolas', '0011_importacao_batida'),
+    ]
+
+    operations = [
+        migrations.RunSQL(REMOVER_TRIGGERS, TRIGGERS),
+    ]
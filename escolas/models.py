@@ -1,6 +1,10 @@
 from django.db import models
 from django.contrib.postgres.fields import ArrayField
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVector, SearchVectorField
 from django.core.validators import EmailValidator
+from django.db.models import F
+from django.db.models.functions import Lower, Now
 
 
 class Escola(models.Model):
@@ -8,9 +12,158 @@ class Escola(models.Model):
     email = models.EmailField(max_length=255, verbose_name="E-mail da Escola", validators=[EmailValidator()])
     numero_salas = models.PositiveIntegerField(verbose_name="Número de Salas")
     provincia = ArrayField(models.CharField(max_length=255), verbose_name="Província")
+    atualizado_em = models.DateTimeField(auto_now=True, db_default=Now(), verbose_name="Atualizado em")
+    # Mantido pela própria base de dados em cada INSERT/UPDATE (ver escolas/busca.py)
+    busca = models.GeneratedField(
+        expression=SearchVector('nome', weight='A', config='simple') + SearchVector('email', weight='B', config='simple'),
+        output_field=SearchVectorField(),
+        db_persist=True,
+    )
 
     def __str__(self):
         return self.nome
 
     class Meta:
         ordering = ['nome']  # Por padrão, ordenar por nome
+        indexes = [
+            # Serve os filtros por província (provincia && ARRAY[...])
+            GinIndex(fields=['provincia'], name='escola_provincia_gin'),
+            # Serve a pesquisa por texto (busca @@ to_tsquery(...))
+            GinIndex(fields=['busca'], name='escola_busca_gin'),
+        ]
+
+
+class Provincia(models.Model):
+    """Província normalizada; a tabela é mantida pela base de dados (ver escolas/provincias.py)."""
+    nome = models.CharField(max_length=255, verbose_name="Nome")
+
+    def __str__(self):
+        return self.nome
+
+    class Meta:
+        ordering = ['nome']
+        constraints = [
+            # "Luanda" e "luanda" são a mesma província
+            models.UniqueConstraint(Lower('nome'), name='provincia_nome_unico'),
+        ]
+
+
+class EscolaProvincia(models.Model):
+    """Uma linha por escola e província de ``Escola.provincia``, mantida por triggers."""
+    # Os DELETE de escolas (também em SQL) apagam estas linhas na própria base de dados
+    escola = models.ForeignKey(Escola, on_delete=models.DO_NOTHING, db_index=False, related_name='+')
+    provincia = models.ForeignKey(Provincia, on_delete=models.PROTECT, db_index=False, related_name='+')
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['escola', 'provincia'], name='escola_provincia_unica'),
+        ]
+        indexes = [
+            # Serve os filtros por província: província -> escolas, só pelo índice
+            models.Index(fields=['provincia', 'escola'], name='escola_provincia_provincia'),
+        ]
+
+
+class Versao(models.Model):
+    """Contador de alterações de uma tabela, usado nos ETags das listagens."""
+    tabela = models.CharField(max_length=63, primary_key=True, verbose_name="Tabela")
+    valor = models.BigIntegerField(default=1, verbose_name="Versão")
+    atualizado_em = models.DateTimeField(db_default=Now(), verbose_name="Atualizado em")
+
+    def __str__(self):
+        return f"{self.tabela} v{self.valor}"
+
+    @classmethod
+    def atual(cls, tabela):
+        versao, criada = cls.objects.get_or_create(tabela=tabela)
+        if criada:
+            versao.refresh_from_db()
+        return versao
+
+    @classmethod
+    async def aatual(cls, tabela):
+        versao, criada = await cls.objects.aget_or_create(tabela=tabela)
+        if criada:
+            await versao.arefresh_from_db()
+        return versao
+
+    @classmethod
+    def incrementar(cls, tabela):
+        if not cls.objects.filter(tabela=tabela).update(valor=F('valor') + 1, atualizado_em=Now()):
+            cls.objects.get_or_create(tabela=tabela)
+
+
+class Importacao(models.Model):
+    PENDENTE = 'pendente'
+    EM_CURSO = 'em_curso'
+    CONCLUIDA = 'concluida'
+    FALHADA = 'falhada'
+    ESTADOS = [
+        (PENDENTE, 'Pendente'),
+        (EM_CURSO, 'Em curso'),
+        (CONCLUIDA, 'Concluída'),
+        (FALHADA, 'Falhada'),
+    ]
+    INSERCAO = 'insert'
+    UPSERT = 'upsert'
+    MODOS = [
+        (INSERCAO, 'Inserção'),
+        (UPSERT, 'Inserção ou atualização por nome'),
+    ]
+
+    arquivo = models.FileField(upload_to='importacoes/', verbose_name="Arquivo")
+    formato = models.CharField(max_length=4, default='xlsx', verbose_name="Formato")
+    modo = models.CharField(max_length=6, choices=MODOS, default=INSERCAO, verbose_name="Modo")
+    apagar_ausentes = models.BooleanField(default=False, verbose_name="Apagar escolas ausentes do arquivo")
+    estado = models.CharField(max_length=10, choices=ESTADOS, default=PENDENTE, verbose_name="Estado")
+    linhas_processadas = models.PositiveIntegerField(default=0, verbose_name="Linhas processadas")
+    linhas_falhadas = models.PositiveIntegerField(default=0, verbose_name="Linhas falhadas")
+    relatorio = models.TextField(blank=True, verbose_name="Relatório")
+    erro = models.TextField(blank=True, verbose_name="Erro")
+    criada_em = models.DateTimeField(auto_now_add=True, verbose_name="Criada em")
+    iniciada_em = models.DateTimeField(null=True, blank=True, verbose_name="Iniciada em")
+    concluida_em = models.DateTimeField(null=True, blank=True, verbose_name="Concluída em")
+    # Atualizado a cada bloco processado: uma importação em curso sem sinal de
+    # vida há ESCOLAS_IMPORT_TIMEOUT segundos perdeu o seu processo
+    batida_em = models.DateTimeField(null=True, blank=True, verbose_name="Último sinal de vida")
+    tentativas = models.PositiveSmallIntegerField(default=0, verbose_name="Tentativas")
+
+    def __str__(self):
+        return f"Importação {self.pk} ({self.estado})"
+
+    class Meta:
+        ordering = ['criada_em']
+        indexes = [models.Index(fields=['estado', 'criada_em'])]
+
+
+class ArquivoImportado(models.Model):
+    """Arquivo já importado, pelo hash do conteúdo (ver escolas/historico.py)."""
+    hash = models.CharField(max_length=64, verbose_name="SHA-256 do arquivo")
+    modo = models.CharField(max_length=6, choices=Importacao.MODOS, verbose_name="Modo")
+    apagar_ausentes = models.BooleanField(default=False, verbose_name="Apagar escolas ausentes do arquivo")
+    # Versão da tabela de escolas no fim da importação: enquanto for a atual,
+    # importar o mesmo arquivo outra vez não muda nada
+    versao = models.BigIntegerField(verbose_name="Versão das escolas")
+    linhas_processadas = models.PositiveIntegerField(default=0, verbose_name="Linhas processadas")
+    linhas_falhadas = models.PositiveIntegerField(default=0, verbose_name="Linhas falhadas")
+    relatorio = models.TextField(blank=True, verbose_name="Relatório")
+    importado_em = models.DateTimeField(auto_now=True, verbose_name="Importado em")
+
+    def __str__(self):
+        return f"{self.hash[:12]} ({self.modo})"
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['hash', 'modo', 'apagar_ausentes'], name='arquivo_importado_unico'),
+        ]
+
+
+class LinhaImportada(models.Model):
+    """Hash da última linha de arquivo que criou cada escola."""
+    escola = models.OneToOneField(Escola, on_delete=models.CASCADE, primary_key=True, related_name='+')
+    hash = models.CharField(max_length=32, verbose_name="Hash da linha")
+    # A linha só conta como já importada enquanto a escola não mudar
+    atualizado_em = models.DateTimeField(verbose_name="Escola atualizada em")
+
+    class Meta:
+        indexes = [models.Index(fields=['hash'], name='linha_importada_hash')]
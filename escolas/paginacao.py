@@ -0,0 +1,73 @@
+from django.conf import settings
+from rest_framework.pagination import CursorPagination, LimitOffsetPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+class EscolaCursorPagination(CursorPagination):
+    """Paginação por cursor (keyset) sobre ``(nome, id)``.
+
+    Cada página é um ``WHERE nome > <cursor> ORDER BY nome, id LIMIT n``
+    servido pelo índice único de ``nome``, por isso a página 1000 custa o
+    mesmo que a primeira. Sem ``cursor``/``page_size`` na query string e com
+    ``ESCOLAS_PAGE_SIZE`` vazio, a resposta continua a ser a lista completa.
+    """
+    ordering = ('nome', 'id')
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'page_size'
+
+    @property
+    def max_page_size(self):
+        return settings.ESCOLAS_MAX_PAGE_SIZE
+
+    def get_page_size(self, request):
+        pedida = self.page_size_query_param in request.query_params or self.cursor_query_param in request.query_params
+        self.page_size = settings.ESCOLAS_PAGE_SIZE or (self.max_page_size if pedida else None)
+        if self.page_size is None:
+            return None
+        return super().get_page_size(request)
+
+
+class BuscaPagination(LimitOffsetPagination):
+    """Paginação por ``page_size``/``offset`` para resultados ordenados por relevância.
+
+    A relevância não serve de cursor, por isso pagina-se por offset; não há
+    ``COUNT(*)``: pede-se uma linha a mais para saber se existe página seguinte.
+    """
+    limit_query_param = 'page_size'
+    offset_query_param = 'offset'
+
+    @property
+    def default_limit(self):
+        return settings.ESCOLAS_SEARCH_PAGE_SIZE
+
+    @property
+    def max_limit(self):
+        return settings.ESCOLAS_MAX_PAGE_SIZE
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self._preparar(request)
+        return self._pagina(list(queryset[self.offset:self.offset + self.limit + 1]))
+
+    async def apaginate_queryset(self, queryset, request, view=None):
+        self._preparar(request)
+        return self._pagina([linha async for linha in queryset[self.offset:self.offset + self.limit + 1]])
+
+    def _preparar(self, request):
+        self.request = request
+        self.limit = self.get_limit(request)
+        self.offset = self.get_offset(request)
+
+    def _pagina(self, linhas):
+        self.tem_seguinte = len(linhas) > self.limit
+        return linhas[:self.limit]
+
+    def get_next_link(self):
+        if not self.tem_seguinte:
+            return None
+        url = self.request.build_absolute_uri()
+        url = replace_query_param(url, self.limit_query_param, self.limit)
+        return replace_query_param(url, self.offset_query_param, self.offset + self.limit)
+
+    def get_paginated_response(self, data):
+        return Response({'next': self.get_next_link(), 'previous': self.get_previous_link(), 'results': data})
@@ -0,0 +1,195 @@
+"""Importação de um arquivo repartida por vários processos.
+
+Um livro com uma folha por província, ou um CSV muito grande, é dividido em
+partes: cada folha do XLSX, e cada intervalo de
+``ESCOLAS_IMPORT_LINHAS_POR_PARTE`` linhas do CSV. Com
+``ESCOLAS_IMPORT_PROCESSOS`` maior do que 1 e pelo menos
+``ESCOLAS_IMPORT_LINHAS_POR_PARTE`` linhas no arquivo, as partes são lidas,
+validadas e inseridas num ``ProcessPoolExecutor``, cada uma na sua
+transação, e os resultados parciais são juntados num único relatório, com
+os erros pela ordem do arquivo e o nome da folha em cada linha. Abaixo
+disso o arranque dos processos (o interpretador e o ``django.setup()``)
+custa mais do que a importação, que fica no próprio processo.
+
+Uma folha do XLSX não é dividida: o openpyxl não salta para o meio de uma
+folha e cada intervalo obrigaria a percorrer o XML das linhas anteriores
+(K partes leriam O(K·N) linhas). Os processos são criados com ``spawn``:
+não herdam as conexões à base de dados nem as threads do servidor.
+
+Este módulo é importado pelos processos do pool antes do ``django.setup()``:
+os módulos que dependem dos modelos só são importados dentro das funções,
+tal como o openpyxl, que as views não precisam de carregar no arranque.
+"""
+import csv
+import logging
+import multiprocessing
+import shutil
+import tempfile
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+
+def dividir(caminho, formato, linhas_por_parte):
+    """Partes ``(folha, primeira, ultima)`` do arquivo, os nomes das folhas e o total de linhas.
+
+    Num XLSX há uma parte por folha com dados (``(folha, 0, None)``); num CSV
+    uma por intervalo de ``linhas_por_parte`` linhas, que contam sem o
+    cabeçalho (``ultima`` exclusiva, None na última), como em ``ler_blocos``.
+    Levanta ``EstruturaInvalida`` se alguma folha tiver outras colunas.
+    """
+    from .importacao import _verificar_colunas
+
+    if formato == 'csv':
+        with open(caminho, encoding='utf-8', newline='') as arquivo:
+            leitor = csv.reader(arquivo)
+            colunas = next(leitor, [])
+            total = sum(1 for _ in leitor)
+        _verificar_colunas(colunas)
+        return _intervalos(total, linhas_por_parte), [], total
+
+    # Pelo objeto do arquivo: o openpyxl recusa caminhos sem extensão .xlsx
+    with open(caminho, 'rb') as arquivo:
+        return _dividir_xlsx(arquivo)
+
+
+def _dividir_xlsx(arquivo):
+    from openpyxl import load_workbook
+
+    from .importacao import EstruturaInvalida, _verificar_colunas, colunas_folha
+
+    workbook = load_workbook(arquivo, read_only=True, data_only=True)
+    try:
+        partes, total = [], 0
+        for numero, worksheet in enumerate(workbook.worksheets):
+            colunas = colunas_folha(worksheet)
+            if colunas is None:
+                continue
+            _verificar_colunas(colunas)
+            partes.append((numero, 0, None))
+            # max_row vem da dimensão guardada no arquivo, sem ler a folha;
+            # as folhas de escritores que não a gravam não contam
+            total += worksheet.max_row - 1 if worksheet.max_row else 0
+        if not partes:
+            raise EstruturaInvalida(
+                'Estrutura do Excel incorreta. Colunas esperadas: nome, email, numero_salas, provincia.'
+            )
+        return partes, workbook.sheetnames, total
+    finally:
+        workbook.close()
+
+
+def _intervalos(total, linhas_por_parte):
+    if total <= linhas_por_parte:
+        return [(0, 0, None)]
+    inicios = range(0, total, linhas_por_parte)
+    return [(0, inicio, inicio + linhas_por_parte) for inicio in inicios[:-1]] + [(0, inicios[-1], None)]
+
+
+@contextmanager
+def _em_disco(arquivo):
+    # Os processos abrem o arquivo pelo caminho; os uploads pequenos do
+    # Django ficam só em memória e são copiados para um temporário
+    if hasattr(arquivo, 'temporary_file_path'):
+        yield arquivo.temporary_file_path()
+        return
+    with tempfile.NamedTemporaryFile(prefix='importacao-') as copia:
+        arquivo.seek(0)
+        shutil.copyfileobj(arquivo, copia)
+        copia.flush()
+        arquivo.seek(0)
+        yield copia.name
+
+
+def _iniciar_processo(base_de_dados):
+    import django
+
+    # O DJANGO_SETTINGS_MODULE vem do ambiente do processo principal
+    django.setup()
+    from django.db import connections
+
+    # A mesma base de dados do processo principal (nos testes, a de teste)
+    connections['default'].settings_dict['NAME'] = base_de_dados
+
+
+def importar_parte(caminho, formato, parte, folhas, batch_size):
+    """Importa uma parte do arquivo numa transação e devolve o seu resultado."""
+    from django.db import transaction
+
+    from . import alteracoes
+    from .historico import importar_linhas_novas
+    from .importacao import ResultadoImportacao, ler_blocos
+
+    folha, primeira, ultima = parte
+    resultado = ResultadoImportacao(folhas=list(folhas))
+    # Uma única subida da versão da tabela, depois do commit: a linha de
+    # Versao não fica bloqueada durante a transação e as partes não se esperam
+    with alteracoes.em_lote(), transaction.atomic(), open(caminho, 'rb') as arquivo:
+        importar_linhas_novas(
+            ler_blocos(arquivo, formato, batch_size, folha=folha, linhas=(primeira, ultima)), resultado,
+        )
+    return resultado
+
+
+def _importar_parte_contada(*args):
+    # No processo do pool: quem importa não vê estas subidas da versão
+    from . import alteracoes
+
+    with alteracoes.contar() as contagem:
+        resultado = importar_parte(*args)
+    resultado.subidas = contagem.subidas
+    return resultado
+
+
+def importar_em_paralelo(arquivo, formato, processos, ao_progredir=None):
+    """Importa ``arquivo`` (modo de inserção) com um processo por parte.
+
+    Devolve None, sem importar nada, se o arquivo tiver uma só parte ou
+    menos de ``ESCOLAS_IMPORT_LINHAS_POR_PARTE`` linhas.
+    """
+    from django.conf import settings
+    from django.db import connection
+
+    from . import alteracoes
+    from .importacao import ResultadoImportacao, tamanho_lote
+
+    with _em_disco(arquivo) as caminho:
+        partes, folhas, total = dividir(caminho, formato, settings.ESCOLAS_IMPORT_LINHAS_POR_PARTE)
+        if len(partes) < 2 or total < settings.ESCOLAS_IMPORT_LINHAS_POR_PARTE:
+            return None
+
+        resultado = ResultadoImportacao(folhas=folhas)
+        repetir = []
+        pool = ProcessPoolExecutor(
+            max_workers=min(processos, len(partes)),
+            mp_context=multiprocessing.get_context('spawn'),
+            initializer=_iniciar_processo,
+            initargs=(connection.settings_dict['NAME'],),
+        )
+        with pool:
+            futuros = {
+                pool.submit(_importar_parte_contada, caminho, formato, parte, folhas, tamanho_lote()): parte
+                for parte in partes
+            }
+            for futuro in as_completed(futuros):
+                try:
+                    resultado.juntar(futuro.result())
+                except Exception:
+                    # Por exemplo um deadlock com outra parte que tem os mesmos
+                    # nomes: a transação da parte foi desfeita e é refeita aqui
+                    logger.warning("Falha ao importar a parte %s; repetida no processo principal",
+                                   futuros[futuro], exc_info=True)
+                    repetir.append(futuros[futuro])
+                    # A parte pode ter subido a versão antes de falhar
+                    resultado.subidas = None
+                    continue
+                if ao_progredir:
+                    ao_progredir(resultado)
+        for parte in repetir:
+            resultado.juntar(importar_parte(caminho, formato, parte, folhas, tamanho_lote()))
+
+    # A cache das leituras é a deste processo, não a dos processos do pool
+    if resultado.inseridas:
+        alteracoes.registrar()
+    return resultado
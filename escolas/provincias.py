@@ -0,0 +1,149 @@
+"""Províncias normalizadas: a tabela ``Provincia`` e a ligação ``EscolaProvincia``.
+
+``Escola.provincia`` continua a ser um array (é o que a API recebe e devolve).
+Com os triggers ligados (``python manage.py normalizar_provincias``, ver
+``ligar``) a base de dados mantém uma tabela com uma linha por província e
+outra com uma linha por escola e província:
+
+* antes de cada INSERT/UPDATE o array é normalizado: espaços a mais e
+  elementos vazios ou repetidos (sem distinguir maiúsculas) são retirados e
+  cada província fica com a grafia já registada (``' luanda '`` → ``'Luanda'``);
+* depois de cada instrução, as províncias novas e as linhas de ligação das
+  escolas inseridas ou cujo array mudou são escritas numa só passagem;
+* apagar uma escola apaga as suas linhas de ligação (ON DELETE CASCADE).
+
+Os triggers custam em todas as escritas (com 20 000 escolas, o COPY do
+``seed_escolas`` passa de ~18 000 para ~8 300 linhas/s e a importação de um
+CSV de ~4 500 para ~3 400; ver ``python -m benchmarks.provincias
+--escrita``) e mudam a grafia enviada pelos clientes, por isso vêm
+desligados (migração 0012). Com ``ESCOLAS_PROVINCIAS_NORMALIZADAS`` os
+filtros e as estatísticas por província são junções indexadas sobre estas
+tabelas (o filtro passa também a ignorar maiúsculas e espaços) e os
+triggers têm de estar ligados; sem ela usam o array e o índice GIN.
+"""
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import BooleanField, CharField, F, Func
+from django.db.models.expressions import RawSQL
+
+from .models import EscolaProvincia, Provincia
+
+# Os ids das províncias pedidas, pelo índice único em lower(nome)
+PROVINCIAS_PEDIDAS = "SELECT lower(btrim(regexp_replace(v, '\\s+', ' ', 'g'))) FROM unnest(%s::text[]) v"
+
+
+TRIGGERS = ('escola_canonizar_provincias', 'escola_provincias_inseridas', 'escola_provincias_atualizadas')
+
+# As funções são as da migração 0009
+LIGAR = """
+CREATE TRIGGER escola_canonizar_provincias BEFORE INSERT OR UPDATE OF provincia ON escolas_escola
+    FOR EACH ROW EXECUTE FUNCTION escolas_escola_canonizar_provincias();
+CREATE TRIGGER escola_provincias_inseridas AFTER INSERT ON escolas_escola
+    REFERENCING NEW TABLE AS novas
+    FOR EACH STATEMENT EXECUTE FUNCTION escolas_escola_provincias_inseridas();
+CREATE TRIGGER escola_provincias_atualizadas AFTER UPDATE ON escolas_escola
+    REFERENCING OLD TABLE AS antigas NEW TABLE AS novas
+    FOR EACH STATEMENT EXECUTE FUNCTION escolas_escola_provincias_atualizadas();
+"""
+
+DESLIGAR = """
+DROP TRIGGER IF EXISTS escola_provincias_atualizadas ON escolas_escola;
+DROP TRIGGER IF EXISTS escola_provincias_inseridas ON escolas_escola;
+DROP TRIGGER IF EXISTS escola_canonizar_provincias ON escolas_escola;
+"""
+
+# Escolas escritas com os triggers desligados: cada província nova fica com a
+# grafia mais usada, os arrays são normalizados (com atualizado_em novo, para
+# os ETags mudarem) e a tabela de ligação é acertada para todas as escolas
+SINCRONIZAR = r"""
+INSERT INTO escolas_provincia (nome)
+SELECT DISTINCT ON (lower(nome)) nome
+FROM (
+    SELECT btrim(regexp_replace(v, '\s+', ' ', 'g')) AS nome, count(*) AS escolas
+    FROM escolas_escola e, unnest(e.provincia) v
+    GROUP BY 1
+) contagem
+WHERE nome <> ''
+ORDER BY lower(nome), escolas DESC, nome
+ON CONFLICT DO NOTHING;
+
+UPDATE escolas_escola SET provincia = escolas_canonizar_provincias(provincia), atualizado_em = now()
+WHERE provincia IS DISTINCT FROM escolas_canonizar_provincias(provincia);
+
+DELETE FROM escolas_escolaprovincia ep
+USING escolas_escola e, escolas_provincia p
+WHERE e.id = ep.escola_id AND p.id = ep.provincia_id
+  AND lower(p.nome) <> ALL (SELECT lower(v) FROM unnest(e.provincia) v);
+
+INSERT INTO escolas_escolaprovincia (escola_id, provincia_id)
+SELECT e.id, p.id FROM escolas_escola e, unnest(e.provincia) v JOIN escolas_provincia p ON lower(p.nome) = lower(v)
+ON CONFLICT DO NOTHING;
+"""
+
+
+def normalizadas():
+    return settings.ESCOLAS_PROVINCIAS_NORMALIZADAS
+
+
+def ligadas():
+    """Se os triggers que mantêm as tabelas normalizadas estão instalados."""
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT count(*) FROM pg_trigger WHERE tgrelid = 'escolas_escola'::regclass AND tgname = ANY(%s)",
+            [list(TRIGGERS)],
+        )
+        return cursor.fetchone()[0] == len(TRIGGERS)
+
+
+def ligar():
+    """Instala os triggers e acerta as tabelas com as escritas feitas sem eles.
+
+    As escritas em escolas_escola esperam pelo fim (LOCK): nenhuma fica entre
+    a sincronização e os triggers.
+    """
+    from . import alteracoes
+
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute('LOCK TABLE escolas_escola IN SHARE ROW EXCLUSIVE MODE')
+        cursor.execute(DESLIGAR)
+        cursor.execute(LIGAR)
+        cursor.execute(SINCRONIZAR)
+        # Os arrays normalizados mudam as respostas
+        alteracoes.registrar()
+
+
+def desligar():
+    """Retira os triggers; as tabelas normalizadas deixam de ser mantidas."""
+    with connection.cursor() as cursor:
+        cursor.execute(DESLIGAR)
+
+
+def filtrar_por_provincias(queryset, provincias):
+    """As escolas de ``queryset`` que estão em alguma das ``provincias``."""
+    if not normalizadas():
+        # Uma única consulta de sobreposição (provincia && ARRAY[...]), servida pelo índice GIN
+        return queryset.filter(provincia__overlap=provincias)
+    ids = Provincia.objects.filter(
+        RawSQL(f'lower(nome) = ANY(ARRAY({PROVINCIAS_PEDIDAS}))', [list(provincias)], output_field=BooleanField())
+    ).values('id')
+    escolas = EscolaProvincia.objects.filter(provincia_id__in=ids).values('escola_id')
+    return queryset.filter(id__in=escolas)
+
+
+def provincias_distintas(queryset):
+    """As províncias das escolas de ``queryset``, sem repetições e ordenadas."""
+    if not normalizadas():
+        return (
+            queryset.annotate(provincia_unica=Func(F('provincia'), function='unnest', output_field=CharField()))
+            .values_list('provincia_unica', flat=True)
+            .distinct()
+            .order_by('provincia_unica')
+        )
+    # Um DISTINCT sobre a junção: um semi-join por província percorreria a
+    # tabela de ligação uma vez por província
+    return (
+        EscolaProvincia.objects.filter(escola_id__in=queryset.values('id'))
+        .values_list('provincia__nome', flat=True)
+        .distinct()
+        .order_by('provincia__nome')
+    )
@@ -0,0 +1,82 @@
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+try:
+    import orjson
+except ImportError:  # orjson é opcional
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:  # msgpack é opcional
+    msgpack = None
+
+
+class EscolaJSONRenderer(JSONRenderer):
+    """``JSONRenderer`` que usa o orjson quando está instalado.
+
+    A saída é igual, byte a byte, à do ``JSONRenderer`` do DRF (compacta,
+    UTF-8, \\u2028/\\u2029 escapados, datas no formato do encoder do DRF).
+    Pedidos com ``indent`` e dados que o orjson não aceita seguem o caminho
+    da biblioteca padrão.
+    """
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if (
+            orjson is None or data is None or self.ensure_ascii or not self.compact
+            or self.get_indent(accepted_media_type, renderer_context or {}) is not None
+        ):
+            return super().render(data, accepted_media_type, renderer_context)
+
+        try:
+            ret = orjson.dumps(
+                data, default=self.encoder_class().default,
+                option=orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_PASSTHROUGH_DATACLASS,
+            )
+        except (orjson.JSONEncodeError, TypeError):
+            return super().render(data, accepted_media_type, renderer_context)
+        return ret.replace('\u2028'.encode(), b'\\u2028').replace('\u2029'.encode(), b'\\u2029')
+
+
+def colunar(data):
+    """Cada lista de objetos de ``data`` passa a um objeto com uma lista por campo.
+
+    ``[{'nome': 'A', 'numero_salas': 1}, {'nome': 'B', 'numero_salas': 2}]``
+    fica ``{'nome': ['A', 'B'], 'numero_salas': [1, 2]}``, no topo ou nos
+    valores de um objeto (``results`` das páginas, ``escolas`` do filtro por
+    província). As outras listas, e as listas vazias, ficam como estão.
+    """
+    if isinstance(data, list):
+        if not data or not isinstance(data[0], dict):
+            return data
+        return {campo: [linha[campo] for linha in data] for campo in data[0]}
+    if isinstance(data, dict):
+        return {chave: colunar(valor) if isinstance(valor, list) else valor for chave, valor in data.items()}
+    return data
+
+
+class EscolaColunarRenderer(EscolaJSONRenderer):
+    """JSON colunar (``?format=colunar``): os nomes dos campos uma vez só; ver ``colunar``."""
+    media_type = 'application/vnd.escolas.colunar+json'
+    format = 'colunar'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        return super().render(colunar(data), accepted_media_type, renderer_context)
+
+
+class EscolaMessagePackRenderer(BaseRenderer):
+    """MessagePack (``?format=msgpack``) para clientes máquina; só com o msgpack instalado."""
+    media_type = 'application/x-msgpack'
+    format = 'msgpack'
+    charset = None
+    render_style = 'binary'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        # Datas, decimais, etc. como no JSON
+        return msgpack.packb(data, default=JSONEncoder().default, use_bin_type=True)
+
+
+# Formatos das respostas do EscolaViewSet, além da API navegável
+RENDERERS = [EscolaJSONRenderer, EscolaColunarRenderer, *([EscolaMessagePackRenderer] if msgpack else [])]
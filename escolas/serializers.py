@@ -1,8 +1,86 @@
+from django.utils import timezone
+from django.utils.functional import cached_property
 from rest_framework import serializers
-from .models import Escola
+from . import metricas
+from .models import Escola, Importacao
 
 
 class EscolaSerializer(serializers.ModelSerializer):
     class Meta:
         model = Escola
-        fields = '__all__'
+        # atualizado_em vai nos cabeçalhos ETag/Last-Modified; busca é interno
+        exclude = ['atualizado_em', 'busca']
+
+    def save(self, **kwargs):
+        escola = super().save(**kwargs)
+        # A resposta mostra o array como a base de dados o normalizou (ver escolas/provincias.py)
+        escola.refresh_from_db(fields=['provincia'])
+        return escola
+
+
+# Campos cujo to_representation devolve o próprio valor vindo da base de dados
+CAMPOS_DIRETOS = (serializers.IntegerField, serializers.CharField, serializers.BooleanField)
+
+
+class LeituraRapida:
+    """Caminho de leitura para listagens grandes.
+
+    As linhas vêm de ``queryset.values()`` e só os campos que precisam de
+    conversão (datas, etc.) passam pelo ``to_representation`` do campo; não
+    há instâncias do modelo nem serializer por linha. O resultado é igual ao
+    de ``serializer_class(queryset, many=True).data``.
+    """
+
+    def __init__(self, serializer_class):
+        self.serializer_class = serializer_class
+
+    @cached_property
+    def _campos(self):
+        campos = []
+        for nome, campo in self.serializer_class().fields.items():
+            if campo.write_only:
+                continue
+            if isinstance(campo, serializers.ListField):
+                direto = isinstance(campo.child, CAMPOS_DIRETOS)
+            else:
+                direto = isinstance(campo, CAMPOS_DIRETOS)
+            campos.append((nome, campo.source, None if direto else campo.to_representation))
+        return campos
+
+    def valores(self, queryset):
+        return queryset.values(*(fonte for _, fonte, _ in self._campos))
+
+    def data(self, linhas):
+        campos = self._campos
+        # O queryset é avaliado fora da medição: as consultas contam no tempo de base de dados
+        linhas = list(linhas)
+        if all(nome == fonte and converter is None for nome, fonte, converter in campos):
+            return linhas
+        with metricas.medir('serializacao'):
+            return [
+                {
+                    nome: linha[fonte] if converter is None or linha[fonte] is None else converter(linha[fonte])
+                    for nome, fonte, converter in campos
+                }
+                for linha in linhas
+            ]
+
+
+escola_leitura = LeituraRapida(EscolaSerializer)
+
+
+class ImportacaoSerializer(serializers.ModelSerializer):
+    linhas_por_segundo = serializers.SerializerMethodField()
+
+    class Meta:
+        model = Importacao
+        fields = [
+            'id', 'estado', 'formato', 'modo', 'apagar_ausentes', 'linhas_processadas', 'linhas_falhadas', 'linhas_por_segundo',
+            'relatorio', 'erro', 'criada_em', 'iniciada_em', 'concluida_em', 'tentativas',
+        ]
+
+    def get_linhas_por_segundo(self, obj):
+        if obj.iniciada_em is None:
+            return None
+        segundos = ((obj.concluida_em or timezone.now()) - obj.iniciada_em).total_seconds()
+        return round(obj.linhas_processadas / segundos, 1) if segundos > 0 else None
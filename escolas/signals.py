@@ -0,0 +1,19 @@
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from . import alteracoes, metricas
+from .models import Escola
+
+
+@receiver(post_save, sender=Escola)
+@receiver(post_delete, sender=Escola)
+def registrar_alteracao_escola(sender, instance, **kwargs):
+    alteracoes.registrar([instance.pk])
+
+
+@receiver(connection_created)
+def instrumentar_conexao(sender, connection, **kwargs):
+    # O wrapper fica no DatabaseWrapper, que sobrevive às reconexões
+    if metricas.execute_wrapper not in connection.execute_wrappers:
+        connection.execute_wrappers.append(metricas.execute_wrapper)
@@ -0,0 +1,190 @@
+import contextvars
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .historico import importar_arquivo
+from .importacao import EstruturaInvalida
+from .models import Importacao
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _obter_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=settings.ESCOLAS_IMPORT_THREADS, thread_name_prefix='importacao'
+            )
+        return _executor
+
+
+_uploads = None
+
+
+def executar_upload(funcao, *args):
+    """Corre ``funcao(*args)`` no pool de uploads e espera pelo resultado.
+
+    O pool (``ESCOLAS_UPLOAD_THREADS``) limita quantos uploads fazem trabalho
+    de CPU com pandas ao mesmo tempo, seja qual for o número de pedidos que
+    o servidor aceita em paralelo (por ASGI, cada vista síncrona tem a sua
+    thread). Com 0 a função corre na thread do pedido.
+    """
+    global _uploads
+    if not settings.ESCOLAS_UPLOAD_THREADS:
+        return funcao(*args)
+    with _executor_lock:
+        if _uploads is None:
+            _uploads = ThreadPoolExecutor(max_workers=settings.ESCOLAS_UPLOAD_THREADS, thread_name_prefix='upload')
+    # Com o contexto do pedido, para as consultas contarem nas métricas dele
+    contexto = contextvars.copy_context()
+    return _uploads.submit(contexto.run, _com_conexao_propria, funcao, *args).result()
+
+
+def _com_conexao_propria(funcao, *args):
+    # Como no ciclo de um pedido: a conexão da thread é reutilizada enquanto
+    # o CONN_MAX_AGE e o health check deixarem
+    close_old_connections()
+    try:
+        return funcao(*args)
+    finally:
+        close_old_connections()
+
+
+def enfileirar(importacao):
+    """Agenda a importação depois do commit da transação que a criou.
+
+    Com ``ESCOLAS_IMPORT_WORKER = 'thread'`` corre num pool de threads do
+    próprio processo; com ``'comando'`` fica na fila da base de dados até ser
+    reservada pelo ``manage.py processar_importacoes``.
+    """
+    if settings.ESCOLAS_IMPORT_WORKER == 'thread':
+        transaction.on_commit(lambda: _obter_executor().submit(_executar_em_thread, importacao.pk))
+        # As de um processo que terminou entretanto são retomadas por este
+        transaction.on_commit(recuperar)
+
+
+def _executar_em_thread(pk):
+    try:
+        _com_conexao_propria(_reservar_e_processar, pk)
+    except Exception:
+        logger.exception("Falha ao processar a importação %s", pk)
+
+
+def _reservar_e_processar(pk):
+    importacao = reservar(pk)
+    if importacao is not None:
+        processar(importacao)
+
+
+def reservar(pk=None):
+    """Marca como em curso a importação ``pk`` (ou a pendente mais antiga).
+
+    ``SELECT ... FOR UPDATE SKIP LOCKED`` garante que cada importação é
+    reservada por um único worker, mesmo com vários a ler a mesma fila.
+    """
+    with transaction.atomic():
+        pendentes = Importacao.objects.select_for_update(skip_locked=True).filter(estado=Importacao.PENDENTE)
+        if pk is not None:
+            pendentes = pendentes.filter(pk=pk)
+        importacao = pendentes.order_by('criada_em').first()
+        if importacao is None:
+            return None
+        importacao.estado = Importacao.EM_CURSO
+        importacao.iniciada_em = importacao.batida_em = timezone.now()
+        importacao.tentativas += 1
+        importacao.save(update_fields=['estado', 'iniciada_em', 'batida_em', 'tentativas'])
+    return importacao
+
+
+def _limite():
+    return timezone.now() - timedelta(seconds=settings.ESCOLAS_IMPORT_TIMEOUT)
+
+
+def abandonada(importacao):
+    """Se ``importacao`` está por acabar e sem sinal de vida há ``ESCOLAS_IMPORT_TIMEOUT`` s."""
+    if importacao.estado == Importacao.EM_CURSO:
+        return (importacao.batida_em or importacao.iniciada_em) < _limite()
+    return importacao.estado == Importacao.PENDENTE and importacao.criada_em < _limite()
+
+
+def recuperar():
+    """Retoma as importações perdidas por um processo que terminou.
+
+    As threads do modo ``'thread'`` morrem com o processo (um reinício, ou
+    um worker reciclado pelo ``max_requests`` do gunicorn) e deixam as suas
+    importações em curso ou pendentes. As em curso sem sinal de vida voltam
+    à fila, ou ficam falhadas depois de ``ESCOLAS_IMPORT_TENTATIVAS``
+    tentativas; no modo ``'thread'`` as pendentes antigas são agendadas
+    neste processo (o ``reservar`` garante que só uma thread as processa).
+    Repetir uma importação não duplica escolas: as linhas já importadas são
+    saltadas (ver escolas/historico.py). Devolve as importações devolvidas à
+    fila.
+    """
+    limite = _limite()
+    with transaction.atomic():
+        abandonadas = list(
+            Importacao.objects.select_for_update(skip_locked=True)
+            .filter(Q(batida_em__lt=limite) | Q(batida_em__isnull=True, iniciada_em__lt=limite),
+                    estado=Importacao.EM_CURSO)
+            .values_list('pk', flat=True)
+        )
+        abandonadas = Importacao.objects.filter(pk__in=abandonadas)
+        esgotadas = abandonadas.filter(tentativas__gte=settings.ESCOLAS_IMPORT_TENTATIVAS)
+        falhadas = esgotadas.update(
+            estado=Importacao.FALHADA, concluida_em=timezone.now(),
+            erro=f'Interrompida {settings.ESCOLAS_IMPORT_TENTATIVAS} vezes sem terminar.',
+        )
+        devolvidas = abandonadas.exclude(estado=Importacao.FALHADA).update(estado=Importacao.PENDENTE)
+    if devolvidas or falhadas:
+        logger.warning("Importações abandonadas: %s devolvidas à fila, %s falhadas", devolvidas, falhadas)
+
+    if settings.ESCOLAS_IMPORT_WORKER == 'thread':
+        pendentes = Importacao.objects.filter(estado=Importacao.PENDENTE, criada_em__lt=limite)
+        for pk in pendentes.values_list('pk', flat=True):
+            _obter_executor().submit(_executar_em_thread, pk)
+    return devolvidas
+
+
+def processar(importacao):
+    def ao_progredir(resultado):
+        Importacao.objects.filter(pk=importacao.pk).update(
+            linhas_processadas=resultado.processadas,
+            linhas_falhadas=resultado.falhadas,
+            batida_em=timezone.now(),
+        )
+
+    try:
+        with importacao.arquivo.open('rb') as arquivo:
+            resultado = importar_arquivo(
+                arquivo, importacao.formato, importacao.modo, importacao.apagar_ausentes, ao_progredir=ao_progredir,
+            )
+    except EstruturaInvalida as e:
+        importacao.estado = Importacao.FALHADA
+        importacao.erro = str(e)
+    except Exception as e:
+        logger.exception("Falha ao processar a importação %s", importacao.pk)
+        importacao.estado = Importacao.FALHADA
+        importacao.erro = str(e)
+    else:
+        importacao.estado = Importacao.CONCLUIDA
+        importacao.linhas_processadas = resultado.processadas
+        importacao.linhas_falhadas = resultado.falhadas
+        importacao.relatorio = resultado.relatorio
+
+    importacao.concluida_em = timezone.now()
+    importacao.arquivo.delete(save=False)
+    importacao.save(update_fields=[
+        'arquivo', 'estado', 'erro', 'linhas_processadas', 'linhas_falhadas', 'relatorio', 'concluida_em'
+    ])
+    return importacao
@@ -6,7 +6,14 @@ from .views import EscolaViewSet, UploadExcelView
 # from .serializers import EscolaSerializer
 # from .views import escola_upload_view
 import pandas as pd
-from io import BytesIO
+from io import BytesIO, StringIO
+
+
+@pytest.fixture(autouse=True)
+def limpar_cache():
+    from django.core.cache import cache
+    cache.clear()
+
 
 @pytest.mark.django_db
 def test_list_escolas():
@@ -179,3 +186,1456 @@ def test_upload_excel_estrutura_invalida():
 
 
 
+
+
+def _excel(data):
+    df = pd.DataFrame(data)
+    excel_file = BytesIO()
+    df.to_excel(excel_file, index=False)
+    excel_file.seek(0)
+    return excel_file
+
+
+def _upload(excel_file, **extra):
+    factory = APIRequestFactory()
+    request = factory.post('/escolas/upload-excel/', {'file': excel_file, **extra}, format='multipart')
+    return UploadExcelView.as_view()(request)
+
+
+@pytest.mark.django_db
+def test_upload_excel_em_lotes_relatorio_por_linha(settings):
+    settings.ESCOLAS_IMPORT_BATCH_SIZE = 2
+    Escola.objects.create(nome="Escola Existente", email="e@email.com", numero_salas=5, provincia=["Luanda"])
+    data = {'nome': ['Escola A', 'Escola B', 'Escola A', 'Escola Existente', 'Escola C', ' Escola D '],
+            'email': ['a@email.com', 'invalido', 'a2@email.com', 'x@email.com', 'c@email.com', 'd@email.com'],
+            'numero_salas': [10, 15, 3, 4, -1, 7],
+            'provincia': ['Luanda', 'Huíla', 'Luanda', 'Namibe', 'Benguela', 'Luanda, Huíla']}
+
+    response = _upload(_excel(data))
+
+    assert response.status_code == status.HTTP_200_OK
+    relatorio = response.data['relatorio']
+    assert relatorio.startswith("**2 escolas inseridas com sucesso.**\n**4 escolas falharam:**\nLinha 2: {'email'")
+    assert "Linha 3: {'nome': [ErrorDetail(string='escola with this Nome da Escola already exists.', code='unique')]}" in relatorio
+    assert "Linha 4: {'nome'" in relatorio
+    assert "Linha 5: {'numero_salas'" in relatorio
+    assert relatorio.index("Linha 2") < relatorio.index("Linha 3") < relatorio.index("Linha 5")
+    assert Escola.objects.get(nome="Escola A").email == "a@email.com"
+    assert Escola.objects.get(nome="Escola D").provincia == ["Luanda", "Huíla"]
+
+
+@pytest.mark.django_db
+def test_upload_excel_em_lotes_consultas_por_bloco(settings, django_assert_max_num_queries):
+    settings.ESCOLAS_IMPORT_BATCH_SIZE = 50
+    n = 200
+    data = {'nome': [f'Escola {i}' for i in range(n)], 'email': [f'escola{i}@email.com' for i in range(n)],
+            'numero_salas': [i % 30 for i in range(n)], 'provincia': ['Luanda,Bengo'] * n}
+
+    # Por bloco: linhas já importadas, nomes existentes, INSERT (com savepoint),
+    # versão da tabela e registo das linhas; por arquivo, o histórico de arquivos
+    with django_assert_max_num_queries(8 * (n // 50) + 10):
+        response = _upload(_excel(data))
+
+    assert response.data['relatorio'] == f"**{n} escolas inseridas com sucesso.**"
+    assert Escola.objects.count() == n
+
+
+@pytest.mark.django_db
+def test_upload_csv_em_blocos(settings):
+    settings.ESCOLAS_IMPORT_BATCH_SIZE = 2
+    csv_file = BytesIO(
+        "nome,email,numero_salas,provincia\n"
+        "Escola A,a@email.com,10,Luanda\n"
+        "Escola B,b@email.com,12,\"Luanda,Bengo\"\n"
+        "Escola C,c@email.com,8,Huíla\n"
+        "Escola D,invalido,8,Huíla\n".encode()
+    )
+    csv_file.name = 'escolas.csv'
+
+    response = _upload(csv_file)
+
+    assert response.status_code == status.HTTP_200_OK
+    assert response.data['relatorio'].startswith("**3 escolas inseridas com sucesso.**\n**1 escolas falharam:**\nLinha 4: {'email'")
+    assert Escola.objects.get(nome="Escola B").provincia == ["Luanda", "Bengo"]
+
+
+@pytest.mark.django_db
+def test_upload_csv_estrutura_invalida():
+    csv_file = BytesIO(b"nome,numero,provincia\nEscola A,10,Luanda\n")
+    csv_file.name = 'escolas.csv'
+
+    response = _upload(csv_file)
+
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+    assert "Estrutura do Excel incorreta." in response.data['error']
+
+
+def test_ler_blocos_xlsx_numeracao_continua():
+    from .importacao import ler_blocos
+
+    data = {'nome': ['Escola A', None, 'Escola C', 'Escola D', 'Escola E'],
+            'email': ['a@email.com', None, 'c@email.com', 'd@email.com', 'e@email.com'],
+            'numero_salas': [1, None, 3, 4, 5], 'provincia': ['Luanda', None, 'Bengo', 'Uíge', 'Zaire']}
+
+    blocos = list(ler_blocos(_excel(data), batch_size=2))
+
+    assert [list(df.index) for df in blocos] == [[0, 1], [2, 3], [4]]
+    assert pd.isna(blocos[0].loc[1, 'nome'])
+    assert blocos[2].loc[4, 'provincia'] == 'Zaire'
+
+
+# Import jobs tests
+@pytest.mark.django_db
+def test_upload_excel_job(settings, tmp_path):
+    from django.core.management import call_command
+    from .views import ImportJobView
+
+    settings.MEDIA_ROOT = tmp_path
+    settings.ESCOLAS_IMPORT_WORKER = 'comando'
+    data = {'nome': ['Escola A', 'Escola B', 'Escola A'], 'email': ['a@email.com', 'b@email.com', 'c@email.com'],
+            'numero_salas': [10, 15, 5], 'provincia': ['Luanda', 'Huíla', 'Bengo']}
+
+    factory = APIRequestFactory()
+    request = factory.post('/escolas/upload-excel/?job=1', {'file': _excel(data)}, format='multipart')
+    response = UploadExcelView.as_view()(request)
+
+    assert response.status_code == status.HTTP_202_ACCEPTED
+    job_id = response.data['job_id']
+    assert response.data['url'] == f'/escolas/import-jobs/{job_id}/'
+    assert Escola.objects.count() == 0
+
+    call_command('processar_importacoes', '--uma-vez', stdout=StringIO())
+
+    request = factory.get(f'/escolas/import-jobs/{job_id}/')
+    response = ImportJobView.as_view()(request, pk=job_id)
+    assert response.status_code == status.HTTP_200_OK
+    assert response.data['estado'] == 'concluida'
+    assert response.data['linhas_processadas'] == 3
+    assert response.data['linhas_falhadas'] == 1
+    assert response.data['relatorio'].startswith("**2 escolas inseridas com sucesso.**\n**1 escolas falharam:**\nLinha 3:")
+    assert response.data['linhas_por_segundo'] is not None
+    assert Escola.objects.count() == 2
+
+
+@pytest.mark.django_db
+def test_importacao_abandonada_volta_a_fila(settings, tmp_path):
+    from datetime import timedelta
+    from django.core.management import call_command
+    from django.utils import timezone
+    from .models import Importacao
+    from .views import ImportJobView
+
+    settings.MEDIA_ROOT = tmp_path
+    settings.ESCOLAS_IMPORT_WORKER = 'comando'
+    data = {'nome': ['Escola A'], 'email': ['a@email.com'], 'numero_salas': [10], 'provincia': ['Luanda']}
+    factory = APIRequestFactory()
+    job_id = UploadExcelView.as_view()(
+        factory.post('/escolas/upload-excel/?job=1', {'file': _excel(data)}, format='multipart')
+    ).data['job_id']
+    esgotada = Importacao.objects.create(arquivo='x.xlsx', formato='xlsx', modo='insert', tentativas=3)
+
+    # Um worker que terminou a meio: em curso, sem sinal de vida desde então
+    antiga = timezone.now() - timedelta(seconds=settings.ESCOLAS_IMPORT_TIMEOUT + 1)
+    Importacao.objects.filter(pk__in=[job_id, esgotada.pk]).update(
+        estado=Importacao.EM_CURSO, iniciada_em=antiga, batida_em=antiga)
+
+    response = ImportJobView.as_view()(factory.get(f'/escolas/import-jobs/{job_id}/'), pk=job_id)
+    assert response.data['estado'] == 'pendente'
+    esgotada.refresh_from_db()
+    assert esgotada.estado == Importacao.FALHADA
+    assert 'Interrompida 3 vezes' in esgotada.erro
+
+    call_command('processar_importacoes', '--uma-vez', stdout=StringIO())
+    importacao = Importacao.objects.get(pk=job_id)
+    assert importacao.estado == Importacao.CONCLUIDA
+    assert importacao.tentativas == 1
+    assert Escola.objects.count() == 1
+
+
+@pytest.mark.django_db
+def test_importar_linha_conflito_concorrente(monkeypatch):
+    from django.db import transaction
+    from .importacao import ResultadoImportacao, _importar_linha
+    from .serializers import EscolaSerializer
+
+    is_valid = EscolaSerializer.is_valid
+
+    def validar_e_ocupar(self, **kwargs):
+        valido = is_valid(self, **kwargs)
+        if self.initial_data['nome'] == "Escola A":
+            # Outra escrita ocupa o nome entre a validação e o INSERT
+            Escola.objects.create(nome="Escola A", email="outra@email.com", numero_salas=1, provincia=["Luanda"])
+        return valido
+
+    monkeypatch.setattr(EscolaSerializer, 'is_valid', validar_e_ocupar)
+    resultado = ResultadoImportacao()
+    with transaction.atomic():
+        for indice, nome in enumerate(["Escola A", "Escola B"]):
+            row = {'nome': nome, 'email': 'a@email.com', 'numero_salas': 1, 'provincia': 'Bengo'}
+            _importar_linha(indice, row, resultado)
+
+    assert (resultado.inseridas, resultado.falhadas) == (1, 1)
+    assert sorted(Escola.objects.values_list('nome', flat=True)) == ["Escola A", "Escola B"]
+
+
+@pytest.mark.django_db
+def test_import_job_not_found():
+    from .views import ImportJobView
+
+    factory = APIRequestFactory()
+    request = factory.get('/escolas/import-jobs/1000/')
+    response = ImportJobView.as_view()(request, pk=1000)
+
+    assert response.status_code == status.HTTP_404_NOT_FOUND
+
+
+# Filter by provincia tests
+def _filtrar(provincias):
+    import json
+
+    factory = APIRequestFactory()
+    request = factory.post('/escolas/filter_by_provincia/', {'provincias': provincias}, format='json')
+    response = EscolaViewSet.as_view({'post': 'filter_by_provincia'})(request)
+    if hasattr(response, 'render'):
+        response.render()
+    return response, json.loads(response.content)
+
+
+@pytest.mark.django_db
+def test_filter_by_provincia():
+    Escola.objects.create(nome="Escola A", email="a@email.com", numero_salas=10, provincia=["Luanda", "Bengo"])
+    Escola.objects.create(nome="Escola B", email="b@email.com", numero_salas=12, provincia=["Huíla"])
+    Escola.objects.create(nome="Escola C", email="c@email.com", numero_salas=8, provincia=["Namibe", "Huíla"])
+    Escola.objects.create(nome="Escola D", email="d@email.com", numero_salas=8, provincia=["Zaire"])
+
+    response, data = _filtrar(["Luanda", "Huíla"])
+
+    assert response.status_code == status.HTTP_200_OK
+    assert [escola['nome'] for escola in data['escolas']] == ["Escola A", "Escola B", "Escola C"]
+    assert data['provincias_disponiveis'] == ["Bengo", "Huíla", "Luanda", "Namibe"]
+
+
+@pytest.mark.django_db
+def test_filter_by_provincia_vazio():
+    Escola.objects.create(nome="Escola A", email="a@email.com", numero_salas=10, provincia=["Luanda"])
+
+    response, data = _filtrar([])
+
+    assert response.status_code == status.HTTP_200_OK
+    assert data == {'escolas': [], 'provincias_disponiveis': []}
+
+
+@pytest.mark.django_db
+def test_filter_by_provincia_invalido():
+    response, data = _filtrar("Luanda")
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+    response, data = _filtrar([1, 2])
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+
+# Pagination tests
+def _criar_escolas(n, provincia=("Luanda",)):
+    Escola.objects.bulk_create(
+        Escola(nome=f"Escola {i:03d}", email=f"escola{i}@email.com", numero_salas=i, provincia=list(provincia))
+        for i in range(n)
+    )
+
+
+@pytest.mark.django_db
+def test_list_escolas_paginado_por_cursor():
+    from django.db import connection
+    from django.test.utils import CaptureQueriesContext
+
+    _criar_escolas(5)
+    factory = APIRequestFactory()
+    view = EscolaViewSet.as_view({'get': 'list'})
+
+    response = view(factory.get('/escolas/', {'page_size': 2}))
+    assert response.status_code == status.HTTP_200_OK
+    assert [escola['nome'] for escola in response.data['results']] == ["Escola 000", "Escola 001"]
+    assert response.data['previous'] is None
+
+    nomes = []
+    url = response.data['next']
+    with CaptureQueriesContext(connection) as consultas:
+        while url:
+            response = view(factory.get(url))
+            nomes += [escola['nome'] for escola in response.data['results']]
+            url = response.data['next']
+    assert nomes == ["Escola 002", "Escola 003", "Escola 004"]
+    # Keyset: nenhuma página usa OFFSET
+    assert all('OFFSET' not in consulta['sql'] for consulta in consultas.captured_queries)
+
+
+@pytest.mark.django_db
+def test_list_escolas_page_size_maximo(settings):
+    settings.ESCOLAS_MAX_PAGE_SIZE = 3
+    _criar_escolas(5)
+    factory = APIRequestFactory()
+
+    response = EscolaViewSet.as_view({'get': 'list'})(factory.get('/escolas/', {'page_size': 1000}))
+
+    assert len(response.data['results']) == 3
+    assert response.data['next'] is not None
+
+
+@pytest.mark.django_db
+def test_filter_by_provincia_paginado():
+    import json
+
+    _criar_escolas(3, provincia=("Luanda",))
+    Escola.objects.create(nome="Escola Z", email="z@email.com", numero_salas=1, provincia=["Bengo", "Luanda"])
+    factory = APIRequestFactory()
+    view = EscolaViewSet.as_view({'post': 'filter_by_provincia'})
+
+    response = view(factory.post('/escolas/filter_by_provincia/?page_size=3', {'provincias': ["Luanda"]}, format='json'))
+    data = json.loads(response.render().content)
+    assert [escola['nome'] for escola in data['escolas']] == ["Escola 000", "Escola 001", "Escola 002"]
+    # As províncias disponíveis cobrem o filtro inteiro, não só a página
+    assert data['provincias_disponiveis'] == ["Bengo", "Luanda"]
+
+    response = view(factory.post(data['next'], {'provincias': ["Luanda"]}, format='json'))
+    data = json.loads(response.render().content)
+    assert [escola['nome'] for escola in data['escolas']] == ["Escola Z"]
+    assert data['next'] is None
+
+
+# Fast read path tests
+NOMES_DIFICEIS = ['Escola "Aspas"', 'Escola \u2028 Linha \u2029', 'Escola \\ Barra', 'Escola\tTab\x01', 'Escola Ção 学校 🏫']
+
+
+@pytest.mark.django_db
+def test_list_escolas_leitura_rapida_igual_ao_serializer():
+    from rest_framework.renderers import JSONRenderer
+    from .serializers import EscolaSerializer
+
+    for i, nome in enumerate(NOMES_DIFICEIS):
+        Escola.objects.create(nome=nome, email=f"e{i}@email.com", numero_salas=i, provincia=["Luanda", nome])
+    factory = APIRequestFactory()
+
+    response = EscolaViewSet.as_view({'get': 'list'})(factory.get('/escolas/'))
+    response.render()
+
+    esperado = JSONRenderer().render(EscolaSerializer(Escola.objects.all(), many=True).data)
+    assert response.content == esperado
+
+
+def test_escola_json_renderer_igual_ao_drf():
+    import datetime
+    import decimal
+    from rest_framework.renderers import JSONRenderer
+    from .renderers import EscolaJSONRenderer
+
+    data = {
+        'nomes': NOMES_DIFICEIS + [' ', '\x7f', ''],
+        'numeros': [0, -1, 2**40, 1.5, None, True],
+        'data': datetime.datetime(2024, 5, 3, 12, 30, tzinfo=datetime.timezone.utc),
+        'decimal': decimal.Decimal('1.10'),
+        1: 'chave inteira',
+    }
+
+    assert EscolaJSONRenderer().render(data) == JSONRenderer().render(data)
+    assert EscolaJSONRenderer().render(data, 'application/json; indent=4') == JSONRenderer().render(data, 'application/json; indent=4')
+
+
+
+@pytest.mark.django_db
+def test_formato_colunar(client):
+    import json
+
+    _criar_escolas(3, provincia=("Luanda", "Bengo"))
+    linhas = json.loads(client.get('/escolas/').content)
+
+    response = client.get('/escolas/?format=colunar')
+    assert response['Content-Type'] == 'application/vnd.escolas.colunar+json'
+    colunas = json.loads(response.content)
+    assert list(colunas) == list(linhas[0])
+    assert colunas['nome'] == [linha['nome'] for linha in linhas]
+    assert colunas['provincia'] == [["Luanda", "Bengo"]] * 3
+
+    # Pelo Accept, também nas respostas paginadas e no filtro por província
+    pagina = json.loads(client.get('/escolas/?page_size=2', HTTP_ACCEPT='application/vnd.escolas.colunar+json').content)
+    assert pagina['results']['nome'] == [linha['nome'] for linha in linhas[:2]]
+    response = client.post('/escolas/filter_by_provincia/?format=colunar', {'provincias': ["Bengo"]},
+                           content_type='application/json')
+    assert json.loads(response.content)['provincias_disponiveis'] == ["Bengo", "Luanda"]
+    assert json.loads(response.content)['escolas']['email'] == [linha['email'] for linha in linhas]
+
+
+def test_formato_msgpack():
+    msgpack = pytest.importorskip('msgpack')
+    from .renderers import EscolaMessagePackRenderer
+
+    data = [{'nome': "Escola A", 'numero_salas': 10, 'provincia': ["Luanda"]}]
+    assert msgpack.unpackb(EscolaMessagePackRenderer().render(data)) == data
+
+
+@pytest.mark.django_db
+def test_compressao_acima_do_minimo(client, settings):
+    import gzip
+
+    settings.ESCOLAS_COMPRESSAO_MINIMO = 500
+    _criar_escolas(20)
+    normal = client.get('/escolas/')
+    assert 'Content-Encoding' not in normal
+
+    response = client.get('/escolas/', HTTP_ACCEPT_ENCODING='gzip, br;q=0')
+    assert response['Content-Encoding'] == 'gzip'
+    assert 'Accept-Encoding' in response['Vary']
+    assert gzip.decompress(response.content) == normal.content
+    assert int(response['Content-Length']) < len(normal.content) // 3
+    # ETag forte por codificação, que continua a validar o pedido condicional
+    assert response['ETag'] == f'{normal["ETag"][:-1]}-gzip"'
+    nao_modificado = client.get('/escolas/', HTTP_IF_NONE_MATCH=response['ETag'], HTTP_ACCEPT_ENCODING='gzip')
+    assert nao_modificado.status_code == status.HTTP_304_NOT_MODIFIED
+    assert nao_modificado['ETag'] == response['ETag']
+    assert client.get('/escolas/', HTTP_IF_NONE_MATCH=normal['ETag']).status_code == status.HTTP_304_NOT_MODIFIED
+
+    # Abaixo do mínimo, ou sem gzip aceite, vai como está
+    assert 'Content-Encoding' not in client.get(f'/escolas/{Escola.objects.first().pk}/', HTTP_ACCEPT_ENCODING='gzip')
+    assert 'Content-Encoding' not in client.get('/escolas/', HTTP_ACCEPT_ENCODING='gzip;q=0, identity')
+
+    # A exportação é comprimida à medida que é enviada
+    exportacao = client.get('/escolas/export/', HTTP_ACCEPT_ENCODING='gzip')
+    assert exportacao['Content-Encoding'] == 'gzip'
+    assert gzip.decompress(b''.join(exportacao.streaming_content)).count(b'\n') == 21
+
+
+
+@pytest.mark.django_db
+def test_compressao_brotli(client, settings):
+    brotli = pytest.importorskip('brotli')
+
+    settings.ESCOLAS_COMPRESSAO_MINIMO = 500
+    _criar_escolas(20)
+    normal = client.get('/escolas/')
+    response = client.get('/escolas/', HTTP_ACCEPT_ENCODING='gzip, br')
+    assert response['Content-Encoding'] == 'br'
+    assert brotli.decompress(response.content) == normal.content
+    assert response['ETag'] == f'{normal["ETag"][:-1]}-br"'
+    # Um ETag de outra codificação também valida: a representação é a mesma
+    assert client.get('/escolas/', HTTP_IF_NONE_MATCH=f'{normal["ETag"][:-1]}-gzip"').status_code == 304
+
+
+def test_compressao_html_com_protecao_breach(client):
+    import gzip
+
+    # A página de login do admin leva o token CSRF: é comprimida pelo
+    # GZipMiddleware, que põe um nome de arquivo aleatório no cabeçalho gzip
+    # (FNAME), mesmo com brotli aceite
+    response = client.get('/admin/login/', HTTP_ACCEPT_ENCODING='gzip, br')
+    assert response['Content-Encoding'] == 'gzip'
+    assert response.content[3] & gzip.FNAME
+    assert b'csrfmiddlewaretoken' in gzip.decompress(response.content)
+
+
+# Cache tests
+@pytest.mark.parametrize('backend, workers, recusa', [
+    ('locmem', '3', True), ('locmem', '1', False), ('file', '3', False),
+])
+def test_gunicorn_recusa_cache_por_processo(backend, workers, recusa):
+    import os
+    import subprocess
+    import sys
+    from django.conf import settings
+
+    # Com o locmem cada worker teria as suas versões das escolas
+    env = {**os.environ, 'CACHE_BACKEND': backend, 'WEB_WORKERS': workers}
+    saida = subprocess.run([sys.executable, 'gunicorn.conf.py'], cwd=settings.BASE_DIR, env=env,
+                           capture_output=True, text=True)
+    assert (saida.returncode != 0) == recusa
+    assert ('CACHE_BACKEND=locmem' in saida.stderr) == recusa
+
+
+@pytest.mark.django_db
+def test_cache_list_e_invalidacao(django_assert_num_queries):
+    escola = Escola.objects.create(nome="Escola A", email="a@email.com", numero_salas=10, provincia=["Luanda"])
+    factory = APIRequestFactory()
+    view = EscolaViewSet.as_view({'get': 'list'})
+
+    assert len(view(factory.get('/escolas/')).data) == 1
+    with django_assert_num_queries(0):
+        assert len(view(factory.get('/escolas/')).data) == 1
+
+    request = factory.patch(f'/escolas/{escola.pk}/', {"numero_salas": 20}, format='json')
+    EscolaViewSet.as_view({'patch': 'partial_update'})(request, pk=escola.pk)
+    assert view(factory.get('/escolas/')).data[0]['numero_salas'] == 20
+
+    EscolaViewSet.as_view({'delete': 'destroy'})(factory.delete(f'/escolas/{escola.pk}/'), pk=escola.pk)
+    assert view(factory.get('/escolas/')).data == []
+
+
+@pytest.mark.django_db
+def test_cache_retrieve_e_invalidacao(django_assert_num_queries):
+    escola = Escola.objects.create(nome="Escola A", email="a@email.com", numero_salas=10, provincia=["Luanda"])
+    factory = APIRequestFactory()
+    view = EscolaViewSet.as_view({'get': 'retrieve'})
+
+    assert view(factory.get(f'/escolas/{escola.pk}/'), pk=str(escola.pk)).data['nome'] == "Escola A"
+    with django_assert_num_queries(0):
+        assert view(factory.get(f'/escolas/{escola.pk}/'), pk=str(escola.pk)).data['nome'] == "Escola A"
+
+    request = factory.put(f'/escolas/{escola.pk}/', {"nome": "Escola B", "email": "b@email.com",
+                                                    "numero_salas": 1, "provincia": ["Bengo"]}, format='json')
+    EscolaViewSet.as_view({'put': 'update'})(request, pk=escola.pk)
+    assert view(factory.get(f'/escolas/{escola.pk}/'), pk=str(escola.pk)).data['nome'] == "Escola B"
+
+
+@pytest.mark.django_db
+def test_cache_filter_by_provincia_invalidado_pelo_upload(django_assert_num_queries):
+    _filtrar(["Luanda", "Huíla"])
+    with django_assert_num_queries(0):
+        # A ordem e as repetições das províncias não mudam a chave
+        response, data = _filtrar(["Huíla", "Luanda", "Luanda"])
+    assert data['escolas'] == []
+
+    data = {'nome': ['Escola A'], 'email': ['a@email.com'], 'numero_salas': [10], 'provincia': ['Luanda']}
+    _upload(_excel(data))
+
+    response, data = _filtrar(["Luanda", "Huíla"])
+    assert [escola['nome'] for escola in data['escolas']] == ["Escola A"]
+
+
+# Conditional GET tests
+@pytest.mark.django_db
+def test_retrieve_escola_etag(django_assert_num_queries):
+    escola = Escola.objects.create(nome="Escola A", email="a@email.com", numero_salas=10, provincia=["Luanda"])
+    factory = APIRequestFactory()
+    view = EscolaViewSet.as_view({'get': 'retrieve'})
+
+    response = view(factory.get(f'/escolas/{escola.pk}/'), pk=escola.pk)
+    etag = response['ETag']
+    assert etag.startswith(f'"{escola.pk}-')
+    assert 'Last-Modified' in response
+    assert 'atualizado_em' not in response.data
+
+    response = view(factory.get(f'/escolas/{escola.pk}/', HTTP_IF_NONE_MATCH=etag), pk=escola.pk)
+    assert response.status_code == status.HTTP_304_NOT_MODIFIED
+    assert response['ETag'] == etag
+
+    # Sem cache o 304 sai antes de serializar: só a leitura da escola
+    from django.core.cache import cache
+    cache.clear()
+    with django_assert_num_queries(1):
+        response = view(factory.get(f'/escolas/{escola.pk}/', HTTP_IF_NONE_MATCH=etag), pk=escola.pk)
+    assert response.status_code == status.HTTP_304_NOT_MODIFIED
+
+    escola.numero_salas = 11
+    escola.save()
+    response = view(factory.get(f'/escolas/{escola.pk}/', HTTP_IF_NONE_MATCH=etag), pk=escola.pk)
+    assert response.status_code == status.HTTP_200_OK
+    assert response['ETag'] != etag
+
+
+@pytest.mark.django_db
+def test_list_escolas_etag_muda_com_escritas(django_assert_num_queries):
+    from django.core.cache import cache
+
+    escola = Escola.objects.create(nome="Escola A", email="a@email.com", numero_salas=10, provincia=["Luanda"])
+    factory = APIRequestFactory()
+    view = EscolaViewSet.as_view({'get': 'list'})
+
+    etag = view(factory.get('/escolas/'))['ETag']
+    assert view(factory.get('/escolas/', {'page_size': 1}))['ETag'] != etag
+
+    cache.clear()
+    # Só a versão da tabela é lida
+    with django_assert_num_queries(1):
+        response = view(factory.get('/escolas/', HTTP_IF_NONE_MATCH=etag))
+    assert response.status_code == status.HTTP_304_NOT_MODIFIED
+
+    response = view(factory.get('/escolas/', HTTP_IF_MODIFIED_SINCE=response['Last-Modified']))
+    assert response.status_code == status.HTTP_304_NOT_MODIFIED
+
+    escola.delete()
+    response = view(factory.get('/escolas/', HTTP_IF_NONE_MATCH=etag))
+    assert response.status_code == status.HTTP_200_OK
+    assert response.data == []
+
+
+@pytest.mark.django_db
+def test_filter_by_provincia_etag():
+    factory = APIRequestFactory()
+    view = EscolaViewSet.as_view({'post': 'filter_by_provincia'})
+
+    etag = view(factory.post('/escolas/filter_by_provincia/', {'provincias': ["Luanda"]}, format='json'))['ETag']
+    response = view(factory.post('/escolas/filter_by_provincia/', {'provincias': ["Luanda"]}, format='json',
+                                 HTTP_IF_NONE_MATCH=etag))
+    assert response.status_code == status.HTTP_304_NOT_MODIFIED
+
+    response = view(factory.post('/escolas/filter_by_provincia/', {'provincias': ["Bengo"]}, format='json',
+                                 HTTP_IF_NONE_MATCH=etag))
+    assert response.status_code == status.HTTP_200_OK
+
+
+# Export tests
+def _exportar(**params):
+    factory = APIRequestFactory()
+    response = EscolaViewSet.as_view({'get': 'export'})(factory.get('/escolas/export/', params))
+    return response, b''.join(response.streaming_content)
+
+
+@pytest.mark.django_db
+def test_export_csv_e_ndjson(settings):
+    import json
+
+    settings.ESCOLAS_EXPORT_CHUNK_SIZE = 2
+    _criar_escolas(3, provincia=("Luanda", "Bengo"))
+    Escola.objects.create(nome="Escola, Vírgula", email="v@email.com", numero_salas=1, provincia=["Huíla"])
+
+    response, conteudo = _exportar(formato='csv')
+    assert response['Content-Type'] == 'text/csv; charset=utf-8'
+    assert conteudo.decode().splitlines() == [
+        'nome,email,numero_salas,provincia',
+        'Escola 000,escola0@email.com,0,"Luanda,Bengo"',
+        'Escola 001,escola1@email.com,1,"Luanda,Bengo"',
+        'Escola 002,escola2@email.com,2,"Luanda,Bengo"',
+        '"Escola, Vírgula",v@email.com,1,Huíla',
+    ]
+
+    response, conteudo = _exportar(formato='ndjson', provincias='Huíla')
+    linhas = [json.loads(linha) for linha in conteudo.decode().splitlines()]
+    assert [linha['nome'] for linha in linhas] == ["Escola, Vírgula"]
+    assert set(linhas[0]) == {'id', 'nome', 'email', 'numero_salas', 'provincia'}
+
+
+@pytest.mark.django_db
+def test_export_xlsx_reimportavel(settings):
+    settings.ESCOLAS_EXPORT_CHUNK_SIZE = 2
+    for i, nome in enumerate(NOMES_DIFICEIS):
+        Escola.objects.create(nome=nome.replace('\x01', '').strip(), email=f"e{i}@email.com", numero_salas=i,
+                              provincia=["Luanda", "Cuanza Sul"])
+    originais = list(Escola.objects.values_list('nome', 'email', 'numero_salas', 'provincia'))
+
+    response, conteudo = _exportar(formato='xlsx')
+    assert response['Content-Disposition'] == 'attachment; filename="escolas.xlsx"'
+
+    Escola.objects.all().delete()
+    arquivo = BytesIO(conteudo)
+    arquivo.name = 'escolas.xlsx'
+    response = _upload(arquivo)
+
+    assert response.data['relatorio'] == f"**{len(originais)} escolas inseridas com sucesso.**"
+    assert list(Escola.objects.values_list('nome', 'email', 'numero_salas', 'provincia')) == originais
+    assert pd.read_excel(BytesIO(conteudo))['nome'].tolist() == [nome for nome, *_ in originais]
+
+
+def test_export_formato_invalido():
+    response = EscolaViewSet.as_view({'get': 'export'})(APIRequestFactory().get('/escolas/export/', {'formato': 'pdf'}))
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+
+# Bulk tests
+def _bulk(operacoes):
+    factory = APIRequestFactory()
+    request = factory.post('/escolas/bulk/', operacoes, format='json')
+    return EscolaViewSet.as_view({'post': 'bulk'})(request)
+
+
+@pytest.mark.django_db
+def test_bulk_operacoes(django_assert_max_num_queries):
+    existente = Escola.objects.create(nome="Escola A", email="a@email.com", numero_salas=10, provincia=["Luanda"])
+    apagar = Escola.objects.create(nome="Escola B", email="b@email.com", numero_salas=10, provincia=["Luanda"])
+    alterar = Escola.objects.create(nome="Escola C", email="c@email.com", numero_salas=10, provincia=["Luanda"])
+    operacoes = [
+        {"op": "create", "data": {"nome": "Escola D", "email": "d@email.com", "numero_salas": 1, "provincia": ["Bengo"]}},
+        {"op": "upsert", "data": {"nome": "Escola A", "email": "novo@email.com", "numero_salas": 2, "provincia": ["Huíla"]}},
+        {"op": "upsert", "data": {"nome": "Escola E", "email": "e@email.com", "numero_salas": 3, "provincia": ["Zaire"]}},
+        {"op": "patch", "id": alterar.pk, "data": {"numero_salas": 30}},
+        {"op": "delete", "id": apagar.pk},
+        # O nome da escola eliminada fica livre no mesmo lote
+        {"op": "create", "data": {"nome": "Escola B", "email": "b2@email.com", "numero_salas": 4, "provincia": ["Uíge"]}},
+    ]
+
+    with django_assert_max_num_queries(15):
+        response = _bulk(operacoes)
+
+    assert response.status_code == status.HTTP_200_OK
+    resultados = response.data['resultados']
+    assert [resultado['status'] for resultado in resultados] == ['criada', 'atualizada', 'criada', 'atualizada', 'eliminada', 'criada']
+    assert resultados[1]['id'] == existente.pk
+    assert resultados[4]['id'] == apagar.pk
+
+    existente.refresh_from_db()
+    alterar.refresh_from_db()
+    assert (existente.email, existente.numero_salas, existente.provincia) == ("novo@email.com", 2, ["Huíla"])
+    assert (alterar.nome, alterar.numero_salas) == ("Escola C", 30)
+    assert not Escola.objects.filter(pk=apagar.pk).exists()
+    assert Escola.objects.get(nome="Escola B").email == "b2@email.com"
+    assert Escola.objects.get(pk=resultados[0]['id']).nome == "Escola D"
+    assert Escola.objects.count() == 5
+
+
+@pytest.mark.django_db
+def test_bulk_invalido_nao_aplica_nada():
+    existente = Escola.objects.create(nome="Escola A", email="a@email.com", numero_salas=10, provincia=["Luanda"])
+    operacoes = [
+        {"op": "create", "data": {"nome": "Escola D", "email": "d@email.com", "numero_salas": 1, "provincia": ["Bengo"]}},
+        {"op": "create", "data": {"nome": "Escola A", "email": "x@email.com", "numero_salas": 1, "provincia": ["Bengo"]}},
+        {"op": "create", "data": {"nome": "Escola D", "email": "y@email.com", "numero_salas": 1, "provincia": ["Bengo"]}},
+        {"op": "patch", "id": existente.pk, "data": {"email": "invalido"}},
+        {"op": "delete", "id": 1000},
+        {"op": "rename"},
+    ]
+
+    response = _bulk(operacoes)
+
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+    resultados = response.data['resultados']
+    assert resultados[0]['status'] == 'nao_aplicada'
+    assert [resultado['status'] for resultado in resultados[1:]] == ['erro'] * 5
+    assert [list(resultado.get('erros', {})) for resultado in resultados] == [[], ['nome'], ['nome'], ['email'], ['id'], ['op']]
+    assert list(Escola.objects.values_list('nome', flat=True)) == ["Escola A"]
+
+
+@pytest.mark.django_db
+def test_bulk_conflito_concorrente(monkeypatch):
+    from . import lote
+
+    validar = lote._validar
+
+    def validar_e_ocupar(operacoes):
+        validar(operacoes)
+        # Outro pedido cria a escola entre a validação e a escrita
+        Escola.objects.create(nome="Escola D", email="outra@email.com", numero_salas=1, provincia=["Luanda"])
+
+    monkeypatch.setattr(lote, '_validar', validar_e_ocupar)
+    response = _bulk([
+        {"op": "create", "data": {"nome": "Escola E", "email": "e@email.com", "numero_salas": 1, "provincia": ["Bengo"]}},
+        {"op": "create", "data": {"nome": "Escola D", "email": "d@email.com", "numero_salas": 1, "provincia": ["Bengo"]}},
+    ])
+
+    assert response.status_code == status.HTTP_409_CONFLICT
+    assert list(Escola.objects.values_list('email', flat=True)) == ["outra@email.com"]
+
+
+@pytest.mark.django_db
+def test_bulk_invalida_cache_e_versao():
+    escola = Escola.objects.create(nome="Escola A", email="a@email.com", numero_salas=10, provincia=["Luanda"])
+    factory = APIRequestFactory()
+    view = EscolaViewSet.as_view({'get': 'list'})
+    etag = view(factory.get('/escolas/'))['ETag']
+
+    _bulk([{"op": "patch", "id": escola.pk, "data": {"numero_salas": 11}}])
+
+    response = view(factory.get('/escolas/', HTTP_IF_NONE_MATCH=etag))
+    assert response.status_code == status.HTTP_200_OK
+    assert response.data[0]['numero_salas'] == 11
+
+
+def _pesquisar(**params):
+    factory = APIRequestFactory()
+    return EscolaViewSet.as_view({'get': 'search'})(factory.get('/escolas/search/', params))
+
+
+@pytest.mark.django_db
+def test_search_por_prefixo_e_relevancia():
+    Escola.objects.create(nome="Escola Primária de Luanda", email="primaria@email.com", numero_salas=5, provincia=["Luanda"])
+    Escola.objects.create(nome="Colégio Huíla", email="luanda.sul@email.com", numero_salas=5, provincia=["Huíla"])
+    Escola.objects.create(nome="Liceu do Bengo", email="bengo@email.com", numero_salas=5, provincia=["Bengo"])
+
+    response = _pesquisar(q="escola lua")
+    assert response.status_code == status.HTTP_200_OK
+    assert [escola['nome'] for escola in response.data['results']] == ["Escola Primária de Luanda"]
+    assert set(response.data['results'][0]) == {'id', 'nome', 'email', 'numero_salas', 'provincia'}
+
+    # O nome pesa mais do que o e-mail
+    response = _pesquisar(q="luanda")
+    assert [escola['nome'] for escola in response.data['results']] == ["Escola Primária de Luanda", "Colégio Huíla"]
+
+    # A coluna gerada acompanha as alterações
+    Escola.objects.filter(nome="Liceu do Bengo").update(nome="Liceu de Luanda")
+    assert len(_pesquisar(q="liceu lua").data['results']) == 1
+
+    assert _pesquisar(q=" !? ").status_code == status.HTTP_400_BAD_REQUEST
+
+
+@pytest.mark.django_db
+def test_search_paginada():
+    _criar_escolas(5)
+
+    response = _pesquisar(q="escola", page_size=2)
+    assert [escola['nome'] for escola in response.data['results']] == ["Escola 000", "Escola 001"]
+    assert response.data['previous'] is None
+    assert 'offset=2' in response.data['next']
+
+    response = _pesquisar(q="escola", page_size=2, offset=4)
+    assert [escola['nome'] for escola in response.data['results']] == ["Escola 004"]
+    assert response.data['next'] is None
+    assert response.data['previous'] is not None
+
+
+@pytest.mark.django_db
+def test_stats_por_provincia(django_assert_num_queries):
+    Escola.objects.create(nome="Escola A", email="a@email.com", numero_salas=10, provincia=["Luanda", "Bengo"])
+    Escola.objects.create(nome="Escola B", email="b@email.com", numero_salas=21, provincia=["Luanda", "Luanda"])
+    Escola.objects.create(nome="Escola C", email="c@email.com", numero_salas=4, provincia=["Huíla"])
+    view = EscolaViewSet.as_view({'get': 'stats'})
+    factory = APIRequestFactory()
+
+    # Versão da tabela + a consulta agregada
+    with django_assert_num_queries(2):
+        response = view(factory.get('/escolas/stats/'))
+    assert response.status_code == status.HTTP_200_OK
+    assert response.data['provincias_disponiveis'] == ["Bengo", "Huíla", "Luanda"]
+    assert response.data['provincias'][2] == {
+        'provincia': "Luanda", 'escolas': 2, 'salas_total': 31, 'salas_media': 15.5, 'salas_minimo': 10, 'salas_maximo': 21,
+    }
+
+    # Servido da cache até à próxima escrita
+    with django_assert_num_queries(0):
+        assert view(factory.get('/escolas/stats/')).data == response.data
+
+    Escola.objects.filter(nome="Escola C").delete()
+    Escola.objects.create(nome="Escola D", email="d@email.com", numero_salas=8, provincia=["Bengo"])
+    response = view(factory.get('/escolas/stats/'))
+    assert response.data['provincias_disponiveis'] == ["Bengo", "Luanda"]
+    assert response.data['provincias'][0]['escolas'] == 2
+
+
+@pytest.mark.django_db
+def test_provincias_normalizadas(settings):
+    from django.core.management import call_command
+    from django.db import connection
+    from .models import EscolaProvincia, Provincia
+
+    def ligacoes():
+        return sorted(EscolaProvincia.objects.values_list('escola__nome', 'provincia__nome'))
+
+    call_command('normalizar_provincias', stdout=StringIO())
+    settings.ESCOLAS_PROVINCIAS_NORMALIZADAS = True
+    factory = APIRequestFactory()
+    response = EscolaViewSet.as_view({'post': 'create'})(factory.post('/escolas/', {
+        'nome': "Escola A", 'email': "a@email.com", 'numero_salas': 10, 'provincia': ["Luanda", "Bengo"],
+    }, format='json'))
+    # Espaços, maiúsculas e repetições: a grafia registada é a primeira
+    response = EscolaViewSet.as_view({'post': 'create'})(factory.post('/escolas/', {
+        'nome': "Escola B", 'email': "b@email.com", 'numero_salas': 21, 'provincia': [" luanda ", "LUANDA", "Cuando  Cubango"],
+    }, format='json'))
+    assert response.data['provincia'] == ["Luanda", "Cuando Cubango"]
+    Escola.objects.bulk_create([Escola(nome="Escola C", email="c@email.com", numero_salas=4, provincia=["Huíla"])])
+
+    assert list(Provincia.objects.values_list('nome', flat=True)) == ["Bengo", "Cuando Cubango", "Huíla", "Luanda"]
+    assert ligacoes() == [
+        ("Escola A", "Bengo"), ("Escola A", "Luanda"),
+        ("Escola B", "Cuando Cubango"), ("Escola B", "Luanda"), ("Escola C", "Huíla"),
+    ]
+
+    # Filtro e estatísticas pelas junções; o formato da API não muda
+    response, data = _filtrar(["luanda"])
+    assert [escola['nome'] for escola in data['escolas']] == ["Escola A", "Escola B"]
+    assert data['escolas'][1]['provincia'] == ["Luanda", "Cuando Cubango"]
+    assert data['provincias_disponiveis'] == ["Bengo", "Cuando Cubango", "Luanda"]
+    response = EscolaViewSet.as_view({'get': 'stats'})(factory.get('/escolas/stats/'))
+    assert response.data['provincias'][3] == {
+        'provincia': "Luanda", 'escolas': 2, 'salas_total': 31, 'salas_media': 15.5, 'salas_minimo': 10, 'salas_maximo': 21,
+    }
+
+    # UPDATE pelo ORM e DELETE em SQL mantêm a tabela de ligação
+    Escola.objects.filter(nome="Escola A").update(provincia=["Bengo", "Zaire"])
+    with connection.cursor() as cursor:
+        cursor.execute("DELETE FROM escolas_escola WHERE nome = 'Escola C'")
+    assert ligacoes() == [
+        ("Escola A", "Bengo"), ("Escola A", "Zaire"), ("Escola B", "Cuando Cubango"), ("Escola B", "Luanda"),
+    ]
+
+
+@pytest.mark.django_db
+def test_provincias_normalizadas_desligadas_por_omissao():
+    from django.core.management import call_command
+    from .models import EscolaProvincia, Provincia
+    from .provincias import ligadas
+
+    # Sem os triggers a grafia do cliente fica como veio e as tabelas não mudam
+    assert not ligadas()
+    escola = Escola.objects.create(nome="Escola A", email="a@email.com", numero_salas=1, provincia=[" luanda ", "Bengo"])
+    Escola.objects.create(nome="Escola B", email="b@email.com", numero_salas=1, provincia=["Luanda"])
+    Escola.objects.create(nome="Escola C", email="c@email.com", numero_salas=1, provincia=["Luanda"])
+    escola.refresh_from_db()
+    assert escola.provincia == [" luanda ", "Bengo"]
+    assert not EscolaProvincia.objects.exists()
+
+    # Ligar acerta as escolas escritas sem eles, com a grafia mais usada
+    call_command('normalizar_provincias', stdout=StringIO())
+    assert ligadas()
+    escola.refresh_from_db()
+    assert escola.provincia == ["Luanda", "Bengo"]
+    assert list(Provincia.objects.values_list('nome', flat=True)) == ["Bengo", "Luanda"]
+    assert EscolaProvincia.objects.count() == 4
+
+    call_command('normalizar_provincias', desligar=True, stdout=StringIO())
+    assert not ligadas()
+
+
+def _sincrona_e_assincrona(metodo, url, acoes, detalhe=False, **kwargs):
+    """A mesma chamada pelo EscolaViewSet e pela vista assíncrona equivalente."""
+    from asgiref.sync import async_to_sync
+    from django.core.cache import cache
+    from django.test import AsyncRequestFactory, RequestFactory
+    from . import assincrono
+
+    caminho = url.split('?')[0].lstrip('/')
+    rota = next(rota for rota in assincrono.urlpatterns if rota.resolve(caminho))
+    sincrona = EscolaViewSet.as_view(acoes, basename='escola', detail=detalhe)
+    kwargs_url = rota.resolve(caminho).kwargs
+
+    respostas = []
+    for fabrica, chamar in ((RequestFactory(), sincrona), (AsyncRequestFactory(), async_to_sync(rota.callback))):
+        cache.clear()
+        response = chamar(getattr(fabrica, metodo)(url, **kwargs), **kwargs_url)
+        if hasattr(response, 'render'):
+            response.render()
+        respostas.append(response)
+    return respostas
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize('metodo, url, acoes, detalhe, kwargs', [
+    ('get', '/escolas/', {'get': 'list', 'post': 'create'}, False, {}),
+    ('get', '/escolas/search/?q=escola', {'get': 'search'}, False, {}),
+    ('post', '/escolas/filter_by_provincia/', {'post': 'filter_by_provincia'}, False,
+     {'data': '{"provincias": ["Bengo"]}', 'content_type': 'application/json'}),
+])
+def test_vistas_assincronas_iguais_as_sincronas(metodo, url, acoes, detalhe, kwargs):
+    _criar_escolas(3)
+    Escola.objects.create(nome="Escola Bengo", email="b@email.com", numero_salas=1, provincia=["Bengo", "Luanda"])
+
+    sincrona, assincrona = _sincrona_e_assincrona(metodo, url, acoes, detalhe, **kwargs)
+    assert sincrona.status_code == assincrona.status_code == status.HTTP_200_OK
+    assert sincrona.content == assincrona.content
+    for cabecalho in ('Content-Type', 'ETag', 'Last-Modified', 'Allow', 'Vary'):
+        assert sincrona[cabecalho] == assincrona[cabecalho]
+
+
+@pytest.mark.django_db
+def test_vista_assincrona_retrieve_e_delegacao():
+    escola = Escola.objects.create(nome="Escola A", email="a@email.com", numero_salas=1, provincia=["Luanda"])
+    acoes = {'get': 'retrieve', 'put': 'update', 'patch': 'partial_update', 'delete': 'destroy'}
+
+    sincrona, assincrona = _sincrona_e_assincrona('get', f'/escolas/{escola.pk}/', acoes, True)
+    assert sincrona.content == assincrona.content
+    assert sincrona['ETag'] == assincrona['ETag']
+
+    # Escola inexistente e paginação por cursor seguem para o EscolaViewSet
+    sincrona, assincrona = _sincrona_e_assincrona('get', '/escolas/999999/', acoes, True)
+    assert sincrona.status_code == assincrona.status_code == status.HTTP_404_NOT_FOUND
+    sincrona, assincrona = _sincrona_e_assincrona('get', '/escolas/?page_size=1', {'get': 'list', 'post': 'create'})
+    assert sincrona.content == assincrona.content
+    assert b'"next"' in assincrona.content
+
+
+@pytest.mark.django_db(transaction=True)
+def test_upload_no_pool_de_threads(settings):
+    settings.ESCOLAS_UPLOAD_THREADS = 1
+    response = _upload(_excel({'nome': ['Escola A'], 'email': ['a@email.com'], 'numero_salas': [10], 'provincia': ['Luanda']}))
+
+    assert response.status_code == status.HTTP_200_OK
+    assert Escola.objects.filter(nome='Escola A').exists()
+
+
+@pytest.mark.django_db
+def test_metricas_server_timing_e_prometheus(client):
+    _criar_escolas(3)
+    response = client.get('/escolas/')
+
+    medidas = dict(medida.split(';', 1) for medida in response['Server-Timing'].split(', '))
+    assert set(medidas) >= {'total', 'db', 'serializacao', 'resposta'}
+    assert 'desc="consultas: ' in medidas['db']
+    assert medidas['resposta'] == f'desc="{len(response.content)} bytes"'
+
+    metricas = client.get('/metrics').content.decode()
+    assert '# TYPE escolas_pedido_duracao_segundos histogram' in metricas
+    assert 'escolas_pedido_consultas_bucket{vista="escola-list",metodo="GET",le="+Inf"}' in metricas
+    assert 'escolas_pedidos_total{vista="escola-list",metodo="GET",estado="200"}' in metricas
+
+
+@pytest.mark.django_db
+def test_metricas_sem_amostragem(client, settings):
+    settings.ESCOLAS_METRICS_SAMPLE_RATE = 0
+    assert 'Server-Timing' not in client.get('/escolas/')
+
+
+
+@pytest.mark.django_db
+def test_limites_balde_de_fichas_por_cliente_e_orcamento(client, settings):
+    settings.ESCOLAS_LIMITE_LEITURA = '2/min'
+    settings.ESCOLAS_LIMITE_BULK = '1/min'
+
+    assert client.get('/escolas/').status_code == status.HTTP_200_OK
+    assert client.get('/escolas/').status_code == status.HTTP_200_OK
+    response = client.get('/escolas/')
+    assert response.status_code == status.HTTP_429_TOO_MANY_REQUESTS
+    assert response['Retry-After'] == '30'
+
+    # Sem NUM_PROXIES o X-Forwarded-For não muda o cliente: qualquer um o inventa
+    assert client.get('/escolas/', HTTP_X_FORWARDED_FOR='10.0.0.2').status_code == 429
+    settings.REST_FRAMEWORK = {'NUM_PROXIES': 1}
+    assert client.get('/escolas/', HTTP_X_FORWARDED_FOR='10.0.0.2').status_code == status.HTTP_200_OK
+
+    # Outros clientes, outros orçamentos e rotas baratas não são afetados
+    assert client.get('/escolas/', REMOTE_ADDR='10.0.0.3').status_code == status.HTTP_200_OK
+    assert client.post('/escolas/bulk/', [], content_type='application/json').status_code == status.HTTP_200_OK
+    assert client.post('/escolas/bulk/', [], content_type='application/json').status_code == 429
+    assert client.get('/metrics').status_code == status.HTTP_200_OK
+
+    settings.ESCOLAS_LIMITES = False
+    assert client.get('/escolas/').status_code == status.HTTP_200_OK
+
+
+def test_limites_compartimento_responde_503():
+    from django.http import HttpResponse
+    from django.test import RequestFactory, override_settings
+    from .limites import LimitesMiddleware
+
+    fabrica = RequestFactory()
+    simultaneas = []
+
+    def vista(request):
+        # Um segundo upload enquanto este está em curso
+        if not simultaneas:
+            simultaneas.append(middleware(fabrica.post('/escolas/upload-excel/', REMOTE_ADDR='10.0.0.2')))
+        return HttpResponse()
+
+    with override_settings(ESCOLAS_CONCORRENCIA_IMPORTACAO=1, ESCOLAS_LIMITE_IMPORTACAO=''):
+        middleware = LimitesMiddleware(vista)
+    assert middleware(fabrica.post('/escolas/upload-excel/')).status_code == status.HTTP_200_OK
+    assert simultaneas[0].status_code == status.HTTP_503_SERVICE_UNAVAILABLE
+    assert simultaneas[0]['Retry-After'] == '1'
+    # O lugar é libertado no fim do pedido
+    assert middleware.compartimentos['importacao'].em_curso == 0
+    assert middleware(fabrica.post('/escolas/upload-excel/')).status_code == status.HTTP_200_OK
+
+
+@pytest.mark.django_db
+def test_limites_compartimento_deixa_passar_cache_e_304(client, settings, monkeypatch):
+    from .limites import Compartimento
+
+    settings.ESCOLAS_LIMITE_LEITURA = ''
+    _criar_escolas(3)
+    etag = client.get('/escolas/')['ETag']
+
+    # O compartimento das leituras cheio com consultas lentas noutras threads
+    monkeypatch.setattr(Compartimento, 'entrar', lambda self: False)
+
+    assert client.get('/escolas/').status_code == status.HTTP_200_OK
+    assert client.get('/escolas/', HTTP_IF_NONE_MATCH=etag).status_code == status.HTTP_304_NOT_MODIFIED
+    # Uma resposta que não está em cache tem de ser calculada: 503
+    response = client.get('/escolas/search/', {'q': 'escola'})
+    assert response.status_code == status.HTTP_503_SERVICE_UNAVAILABLE
+    assert response['Retry-After'] == '1'
+    # A exportação não tem cache: recusada logo pelo middleware
+    assert client.get('/escolas/export/').status_code == status.HTTP_503_SERVICE_UNAVAILABLE
+
+
+def test_benchmark_comparar_regressoes():
+    from .management.commands.benchmark_escolas import comparar
+
+    referencia = [
+        {'linhas': 1000, 'cenario': 'lista', 'p50_ms': 10, 'p95_ms': 20},
+        {'linhas': 1000, 'cenario': 'importacao', 'linhas_por_segundo': 5000, 'memoria_pico_mb': 4},
+    ]
+    resultados = [
+        {'linhas': 1000, 'cenario': 'lista', 'p50_ms': 12, 'p95_ms': 60},
+        {'linhas': 1000, 'cenario': 'importacao', 'linhas_por_segundo': 3000, 'memoria_pico_mb': 4},
+        {'linhas': 10000, 'cenario': 'lista', 'p50_ms': 99},
+    ]
+    regressoes = comparar(referencia, resultados, 0.25)
+    assert [(r['cenario'], r['metrica']) for r in regressoes] == [('importacao', 'linhas_por_segundo')]
+
+
+@pytest.mark.django_db
+def test_seed_escolas_copy_e_arquivo(tmp_path):
+    from django.core.management import call_command
+    from .importacao import importar_blocos, ler_blocos
+    from .management.commands.seed_escolas import gerar
+
+    assert list(gerar(20, seed=3)) == list(gerar(20, seed=3))
+
+    call_command('seed_escolas', 20, seed=3, pesos={'Luanda': 1, 'Cuando "Cubango"': 1}, stdout=StringIO())
+    escolas = Escola.objects.order_by('id')
+    assert escolas.count() == 20
+    assert [e.nome for e in escolas] == [nome for bloco in gerar(20, seed=3) for nome, _, _, _ in bloco]
+    assert {p for e in escolas for p in e.provincia} == {'Luanda', 'Cuando "Cubango"'}
+
+    # O XLSX gerado é aceite pelo upload
+    caminho = tmp_path / 'escolas.xlsx'
+    call_command('seed_escolas', 30, seed=3, inicio=101, arquivo=str(caminho), stdout=StringIO())
+    with open(caminho, 'rb') as arquivo:
+        resultado = importar_blocos(ler_blocos(arquivo, 'xlsx'))
+    assert resultado.inseridas == 30
+
+
+def _upload_modo(excel_file, query):
+    factory = APIRequestFactory()
+    request = factory.post(f'/escolas/upload-excel/?{query}', {'file': excel_file}, format='multipart')
+    return UploadExcelView.as_view()(request)
+
+
+@pytest.mark.django_db
+def test_upload_upsert_com_deteccao_de_alteracoes():
+    igual = Escola.objects.create(nome="Escola A", email="a@email.com", numero_salas=10, provincia=["Luanda"])
+    alterada = Escola.objects.create(nome="Escola B", email="b@email.com", numero_salas=15, provincia=["Huíla"])
+    ausente = Escola.objects.create(nome="Escola C", email="c@email.com", numero_salas=5, provincia=["Bengo"])
+    data = {
+        'nome': ['Escola A', ' Escola B', 'Escola D', 'Escola D', 'Escola E'],
+        'email': ['a@email.com', 'b@email.com', 'd@email.com', 'outro@email.com', 'email-invalido'],
+        'numero_salas': [10, 20, 3, 4, 1],
+        'provincia': ['Luanda', 'Huíla, Namibe', 'Cabinda', 'Zaire', 'Luanda'],
+    }
+
+    response = _upload_modo(_excel(data), 'mode=upsert&delete_missing=1')
+
+    assert response.status_code == status.HTTP_200_OK
+    relatorio = response.data['relatorio']
+    assert relatorio.startswith(
+        "**1 escolas inseridas, 1 atualizadas e 1 inalteradas (ignoradas); 1 escolas ausentes do arquivo apagadas.**\n"
+        "**2 escolas falharam:**\nLinha 4: {'nome': ['Nome repetido no arquivo.']}Linha 5:"
+    )
+    assert sorted(Escola.objects.values_list('nome', flat=True)) == ['Escola A', 'Escola B', 'Escola D']
+    assert Escola.objects.get(pk=igual.pk).atualizado_em == igual.atualizado_em
+    alterada.refresh_from_db()
+    assert (alterada.numero_salas, alterada.provincia) == (20, ['Huíla', 'Namibe'])
+    assert not Escola.objects.filter(pk=ausente.pk).exists()
+    assert Escola.objects.get(nome='Escola D').email == 'd@email.com'
+
+    # O mesmo arquivo outra vez: nada muda
+    response = _upload_modo(_excel(data), 'mode=upsert')
+    assert response.data['relatorio'].startswith("**0 escolas inseridas, 0 atualizadas e 3 inalteradas (ignoradas).**")
+
+    # Uma escola do histórico de importações apagada pelo delete_missing (DELETE em SQL)
+    _upload(_excel({'nome': ['Escola F'], 'email': ['f@email.com'], 'numero_salas': [2], 'provincia': ['Bengo']}))
+    response = _upload_modo(_excel(data), 'mode=upsert&delete_missing=1')
+    assert response.data['relatorio'].startswith("**0 escolas inseridas, 0 atualizadas e 3 inalteradas (ignoradas); 1 escolas")
+    assert not Escola.objects.filter(nome='Escola F').exists()
+
+    assert _upload_modo(_excel(data), 'mode=merge').status_code == status.HTTP_400_BAD_REQUEST
+    assert _upload_modo(_excel(data), 'delete_missing=1').status_code == status.HTTP_400_BAD_REQUEST
+
+
+@pytest.mark.django_db
+def test_upload_repetido_usa_historico(django_assert_max_num_queries):
+    data = {
+        'nome': ['Escola A', 'Escola B', 'Escola C'],
+        'email': ['a@email.com', 'b@email.com', 'invalido'],
+        'numero_salas': [10, 12, 8],
+        'provincia': ['Luanda', 'Luanda,Bengo', 'Huíla'],
+    }
+    # Os mesmos bytes: o XLSX grava a hora de criação e o hash mudaria de um segundo para o outro
+    arquivo = _excel(data).getvalue()
+    primeiro = _upload(BytesIO(arquivo)).data['relatorio']
+    assert primeiro.startswith("**2 escolas inseridas com sucesso.**\n**1 escolas falharam:**\nLinha 3: {'email'")
+
+    # Arquivo idêntico, escolas inalteradas: o relatório guardado, sem ler o arquivo
+    with django_assert_max_num_queries(2):
+        response = _upload(BytesIO(arquivo))
+    assert response.data['relatorio'] == primeiro
+    assert response.data['repetido'] is True
+
+    # Outro arquivo com as mesmas linhas e uma nova: só a nova é importada
+    Escola.objects.create(nome="Escola Z", email="z@email.com", numero_salas=1, provincia=["Bengo"])
+    data_nova = {coluna: valores + [valor] for (coluna, valores), valor in zip(
+        data.items(), ['Escola D', 'd@email.com', 3, 'Zaire']
+    )}
+    response = _upload(_excel(data_nova))
+    assert response.data['relatorio'].startswith(
+        "**1 escolas inseridas com sucesso; 2 linhas já importadas anteriormente (ignoradas).**\n"
+        "**1 escolas falharam:**\nLinha 3:"
+    )
+    assert 'repetido' not in response.data
+    assert Escola.objects.filter(nome='Escola D').exists()
+
+    # Uma escola alterada depois da importação deixa de contar como importada
+    escola = Escola.objects.get(nome='Escola A')
+    escola.numero_salas = 11
+    escola.save()
+    response = _upload(_excel(data_nova))
+    assert response.data['relatorio'].startswith(
+        "**0 escolas inseridas com sucesso; 2 linhas já importadas anteriormente (ignoradas).**\n"
+        "**2 escolas falharam:**\nLinha 1: {'nome'"
+    )
+
+
+
+@pytest.mark.django_db
+def test_historico_ignora_escritas_durante_a_importacao():
+    from .historico import importar_arquivo
+    from .models import ArquivoImportado, Versao
+
+    arquivo = _excel({'nome': ['Escola A'], 'email': ['a@email.com'], 'numero_salas': [1], 'provincia': ['Luanda']}).getvalue()
+    # Outra escrita (noutro processo) durante a importação
+    resultado = importar_arquivo(BytesIO(arquivo), ao_progredir=lambda _: Versao.incrementar(Escola._meta.db_table))
+    assert resultado.inseridas == 1
+    assert not ArquivoImportado.objects.exists()
+    assert not getattr(importar_arquivo(BytesIO(arquivo)), 'repetido', False)
+
+    # Sem escritas pelo meio o arquivo fica no histórico
+    assert getattr(importar_arquivo(BytesIO(arquivo)), 'repetido', False)
+
+
+def _excel_folhas(folhas):
+    excel_file = BytesIO()
+    with pd.ExcelWriter(excel_file) as writer:
+        for nome, data in folhas.items():
+            pd.DataFrame(data).to_excel(writer, sheet_name=nome, index=False)
+        writer.book.create_sheet('Vazia')
+    excel_file.seek(0)
+    return excel_file
+
+
+def _escolas_folha(provincia, n, invalida=None):
+    return {
+        'nome': [f'Escola {provincia} {i}' for i in range(n)],
+        'email': ['invalido' if i == invalida else f'{i}@{provincia.lower()}.ao' for i in range(n)],
+        'numero_salas': [i + 1 for i in range(n)],
+        'provincia': [provincia] * n,
+    }
+
+
+@pytest.mark.django_db
+def test_upload_excel_todas_as_folhas():
+    excel_file = _excel_folhas({
+        'Luanda': _escolas_folha('Luanda', 3),
+        'Bengo': _escolas_folha('Bengo', 4, invalida=2),
+    })
+
+    response = _upload(excel_file)
+
+    assert response.data['relatorio'].startswith(
+        "**6 escolas inseridas com sucesso.**\n**1 escolas falharam:**\n[Bengo] Linha 3: {'email'"
+    )
+    assert Escola.objects.filter(provincia=['Bengo']).count() == 3
+
+
+@pytest.mark.django_db(transaction=True)
+def test_importacao_em_paralelo_por_folhas_e_intervalos(settings, tmp_path):
+    from .historico import importar_arquivo
+    from .paralelo import dividir
+
+    settings.ESCOLAS_IMPORT_PROCESSOS = 2
+    settings.ESCOLAS_IMPORT_LINHAS_POR_PARTE = 4
+    excel_file = _excel_folhas({
+        'Luanda': _escolas_folha('Luanda', 10, invalida=5),
+        'Bengo': _escolas_folha('Bengo', 3, invalida=0),
+    })
+    caminho = tmp_path / 'escolas.xlsx'
+    caminho.write_bytes(excel_file.getvalue())
+    # Uma parte por folha: as folhas não são divididas em intervalos
+    assert dividir(caminho, 'xlsx', 4) == ([(0, 0, None), (1, 0, None)], ['Luanda', 'Bengo', 'Vazia'], 13)
+
+    resultado = importar_arquivo(excel_file)
+
+    assert resultado.relatorio.startswith(
+        "**11 escolas inseridas com sucesso.**\n**2 escolas falharam:**\n[Luanda] Linha 6: {'email'"
+    )
+    assert "[Bengo] Linha 1: {'email'" in resultado.relatorio
+    assert Escola.objects.count() == 11
+    # As subidas da versão feitas nos processos contam como da importação
+    assert importar_arquivo(excel_file).repetido
+
+    # Um CSV é dividido em intervalos de linhas
+    csv_file = BytesIO(pd.DataFrame(_escolas_folha('Huíla', 10, invalida=2)).to_csv(index=False).encode())
+    caminho = tmp_path / 'escolas.csv'
+    caminho.write_bytes(csv_file.getvalue())
+    assert dividir(caminho, 'csv', 4) == ([(0, 0, 4), (0, 4, 8), (0, 8, None)], [], 10)
+
+    resultado = importar_arquivo(csv_file, 'csv')
+
+    assert resultado.relatorio.startswith(
+        "**9 escolas inseridas com sucesso.**\n**1 escolas falharam:**\nLinha 3: {'email'"
+    )
+    assert Escola.objects.count() == 20
+
+
+@pytest.mark.django_db
+def test_importacao_pequena_fica_no_processo(settings, monkeypatch):
+    from . import paralelo
+    from .historico import importar_arquivo
+
+    settings.ESCOLAS_IMPORT_PROCESSOS = 2
+    settings.ESCOLAS_IMPORT_LINHAS_POR_PARTE = 100
+    monkeypatch.setattr(paralelo, 'ProcessPoolExecutor', lambda *args, **kwargs: pytest.fail('Pool criado'))
+    excel_file = _excel_folhas({'Luanda': _escolas_folha('Luanda', 3), 'Bengo': _escolas_folha('Bengo', 3)})
+
+    resultado = importar_arquivo(excel_file)
+
+    assert resultado.relatorio == "**6 escolas inseridas com sucesso.**"
+    assert Escola.objects.count() == 6
+
+
+# Query count and query plan tests
+def _sql_capturado(pedido):
+    from django.db import connection
+    from django.test.utils import CaptureQueriesContext
+
+    with CaptureQueriesContext(connection) as consultas:
+        response = pedido()
+    assert response.status_code < 400, response.content
+    return [consulta['sql'] for consulta in consultas.captured_queries]
+
+
+def _pedidos(client, n, sufixo=''):
+    """Um pedido por endpoint, com ``n`` escolas na resposta ou no corpo."""
+    nomes = [f'Nova {sufixo}{i}' for i in range(n)]
+    operacoes = [
+        {'op': 'create', 'data': {'nome': nome, 'email': f'nova{sufixo}{i}@email.com', 'numero_salas': 1, 'provincia': ['Bengo']}}
+        for i, nome in enumerate(nomes)
+    ]
+    arquivo = {
+        'nome': [f'Importada {sufixo}{i}' for i in range(n)], 'email': [f'importada{sufixo}{i}@email.com' for i in range(n)],
+        'numero_salas': [1] * n, 'provincia': ['Bengo'] * n,
+    }
+    pk = Escola.objects.order_by('nome').values_list('pk', flat=True)[n - 1]
+    return {
+        'list': lambda: client.get('/escolas/'),
+        'list_paginada': lambda: client.get(f'/escolas/?page_size={n}'),
+        'retrieve': lambda: client.get(f'/escolas/{pk}/'),
+        'filter_by_provincia': lambda: client.post(
+            f'/escolas/filter_by_provincia/?page_size={n}', {'provincias': ['Luanda']}, content_type='application/json'
+        ),
+        'search': lambda: client.get(f'/escolas/search/?q=escola&page_size={n}'),
+        'stats': lambda: client.get('/escolas/stats/'),
+        'upload': lambda: client.post('/escolas/upload-excel/', {'file': _excel(arquivo)}),
+        'bulk': lambda: client.post('/escolas/bulk/', operacoes, content_type='application/json'),
+    }
+
+
+# Consultas (incluindo SAVEPOINTs) de cada endpoint, com a cache vazia; não
+# dependem do número de escolas. Uma alteração a estes números deve ser
+# intencional: atualize-os no mesmo commit.
+CONSULTAS_POR_ENDPOINT = {
+    'list': 2,                  # versão da tabela + escolas
+    'list_paginada': 2,
+    'retrieve': 1,
+    'filter_by_provincia': 3,   # versão + escolas + províncias disponíveis
+    'search': 2,
+    'stats': 2,
+    'upload': 16,
+    'bulk': 5,
+}
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize('endpoint', list(CONSULTAS_POR_ENDPOINT))
+def test_consultas_por_endpoint(client, endpoint):
+    from django.core.cache import cache
+    from . import busca
+    from .models import Versao
+
+    _criar_escolas(60)
+    # Consultas feitas uma vez por processo
+    Versao.atual(Escola._meta.db_table)
+    busca.trigramas_disponiveis()
+    for n in (5, 50):
+        cache.clear()
+        consultas = _sql_capturado(_pedidos(client, n, sufixo=f'{n}-')[endpoint])
+        assert len(consultas) == CONSULTAS_POR_ENDPOINT[endpoint], '\n'.join(consultas)
+
+
+def _nos_do_plano(plano):
+    yield plano
+    for filho in plano.get('Plans', []):
+        yield from _nos_do_plano(filho)
+
+
+def _planos(consultas):
+    """(consulta, nós do EXPLAIN) das consultas SELECT, com as leituras sequenciais desligadas.
+
+    Com ``enable_seqscan = off`` o planeador só escolhe uma leitura
+    sequencial se nenhum índice servir a consulta: é o que estes testes
+    detetam, independentemente do tamanho da tabela de teste.
+    """
+    import json
+    from django.db import connection
+
+    planos = []
+    with connection.cursor() as cursor:
+        cursor.execute('SET enable_seqscan = off')
+        try:
+            for sql in consultas:
+                if sql.lstrip().upper().startswith('SELECT'):
+                    cursor.execute(f'EXPLAIN (FORMAT JSON) {sql}')
+                    plano = cursor.fetchone()[0]
+                    plano = json.loads(plano) if isinstance(plano, str) else plano
+                    planos.append((sql, list(_nos_do_plano(plano[0]['Plan']))))
+        finally:
+            cursor.execute('RESET enable_seqscan')
+    return planos
+
+
+# Índices (pelo início do nome: o do nome da escola tem duas variantes, a
+# única e a _like) que cada endpoint tem de usar na tabela semeada
+INDICES_POR_ENDPOINT = {
+    'list_paginada': {'escolas_escola_nome_'},
+    'retrieve': {'escolas_escola_pkey'},
+    'filter_by_provincia': {'escola_provincia_gin'},
+    'search': {'escola_busca_gin'},
+    'upload': {'escolas_escola_nome_', 'linha_importada_hash'},
+    'bulk': {'escolas_escola_nome_'},
+    # A tabela das províncias tem poucas linhas: o planeador lê-a por qualquer
+    # índice, o que conta é a junção pelo índice de EscolaProvincia
+    'filter_by_provincia_normalizada': {'escola_provincia_provincia'},
+}
+
+# Consultas que percorrem a tabela inteira de propósito
+SEQUENCIAIS_PERMITIDAS = {
+    'stats': {'escolas_escola'},
+    'stats_normalizada': {'escolas_escola', 'escolas_escolaprovincia', 'escolas_provincia'},
+}
+
+
+@pytest.mark.django_db
+def test_planos_usam_indices(client, settings):
+    from django.core.cache import cache
+    from django.core.management import call_command
+    from django.db import connection
+
+    call_command('seed_escolas', 20000, seed=1, indices='manter', sem_vacuum=True, stdout=StringIO())
+    with connection.cursor() as cursor:
+        # Um histórico de importações do tamanho da tabela
+        cursor.execute(
+            'INSERT INTO escolas_linhaimportada (escola_id, hash, atualizado_em) '
+            'SELECT id, md5(nome), atualizado_em FROM escolas_escola'
+        )
+        cursor.execute('ANALYZE escolas_escola, escolas_linhaimportada, escolas_escolaprovincia')
+
+    falhas = []
+
+    def verificar(endpoint, pedido):
+        cache.clear()
+        indices = set()
+        for sql, nos in _planos(_sql_capturado(pedido)):
+            indices |= {no['Index Name'] for no in nos if 'Index Name' in no}
+            sequenciais = {no['Relation Name'] for no in nos if no['Node Type'] == 'Seq Scan'}
+            sequenciais -= SEQUENCIAIS_PERMITIDAS.get(endpoint, set())
+            if sequenciais:
+                falhas.append(f'{endpoint}: leitura sequencial de {", ".join(sorted(sequenciais))} em\n    {sql}')
+        em_falta = {
+            esperado for esperado in INDICES_POR_ENDPOINT.get(endpoint, ())
+            if not any(indice.startswith(esperado) for indice in indices)
+        }
+        if em_falta:
+            falhas.append(f'{endpoint}: sem {sorted(em_falta)} (usados: {sorted(indices)})')
+
+    for endpoint, pedido in _pedidos(client, 20).items():
+        verificar(endpoint, pedido)
+    # Com as províncias normalizadas o filtro e as estatísticas são junções
+    call_command('normalizar_provincias', stdout=StringIO())
+    settings.ESCOLAS_PROVINCIAS_NORMALIZADAS = True
+    pedidos = _pedidos(client, 20)
+    verificar('filter_by_provincia_normalizada', pedidos['filter_by_provincia'])
+    verificar('stats_normalizada', pedidos['stats'])
+    assert not falhas, '\n'.join(falhas)
+
+
+def test_arranque_sem_pilha_da_importacao():
+    # Num processo novo: neste os testes já importaram o pandas
+    import subprocess
+    import sys
+
+    programa = (
+        "import django, sys; django.setup(); import labapp.urls, escolas.tarefas, escolas.admin; "
+        "print(','.join(m for m in ('pandas', 'numpy', 'openpyxl') if m in sys.modules))"
+    )
+    saida = subprocess.run([sys.executable, '-c', programa], capture_output=True, text=True, check=True)
+    assert saida.stdout.strip() == ''
@@ -1,26 +1,55 @@
 from django.shortcuts import render, redirect
 from rest_framework import viewsets, status
 from rest_framework.response import Response
+from rest_framework.renderers import BrowsableAPIRenderer
 from rest_framework.parsers import MultiPartParser
-from .models import Escola
-from .serializers import EscolaSerializer
-import pandas as pd
+from .models import Escola, Importacao
+from .serializers import EscolaSerializer, ImportacaoSerializer, escola_leitura
+from .renderers import RENDERERS
+from .historico import importar_arquivo
+from .importacao import MODOS, UPSERT, EstruturaInvalida
+from .provincias import filtrar_por_provincias, provincias_distintas
+from .tarefas import abandonada, enfileirar, executar_upload, recuperar
+from .paginacao import BuscaPagination, EscolaCursorPagination
+from . import busca, cache, condicional, estatisticas, exportacao, limites, lote
 from drf_yasg.utils import swagger_auto_schema
 from drf_yasg import openapi
 from rest_framework.decorators import action
 from rest_framework.views import APIView
-from django.http import JsonResponse
+from django.conf import settings
+from django.db import IntegrityError
+from django.http import JsonResponse, StreamingHttpResponse
+from django.urls import reverse
 
 class EscolaViewSet(viewsets.ModelViewSet):
     queryset = Escola.objects.all()
     serializer_class = EscolaSerializer
+    pagination_class = EscolaCursorPagination
+    renderer_classes = [*RENDERERS, BrowsableAPIRenderer]
 
     @swagger_auto_schema(
         responses={200: 'OK', 404: 'Not Found'},
         operation_description="Recupera uma escola específica pelo seu ID."
     )
     def retrieve(self, request, pk=None):
-        return super().retrieve(request, pk=pk)
+        try:
+            chave = cache.chave_escola(int(pk))
+        except (TypeError, ValueError):
+            return super().retrieve(request, pk=pk)
+
+        entrada = cache.obter(chave)
+        if entrada is None:
+            escola = self.get_object()
+            etag, ultima_modificacao = condicional.validadores_escola(escola)
+            if condicional.nao_modificado(request, etag, ultima_modificacao):
+                return condicional.resposta_304(etag, ultima_modificacao)
+            entrada = (etag, ultima_modificacao, self.get_serializer(escola).data)
+            cache.guardar(chave, entrada)
+
+        etag, ultima_modificacao, data = entrada
+        if condicional.nao_modificado(request, etag, ultima_modificacao):
+            return condicional.resposta_304(etag, ultima_modificacao)
+        return Response(data, headers=condicional.cabecalhos(etag, ultima_modificacao))
 
     @swagger_auto_schema(
         responses={204: 'No Content', 404: 'Not Found'},
@@ -30,11 +59,33 @@ class EscolaViewSet(viewsets.ModelViewSet):
         return super().destroy(request, pk=pk)
     
     @swagger_auto_schema(
+        manual_parameters=[
+            openapi.Parameter('page_size', openapi.IN_QUERY, type=openapi.TYPE_INTEGER,
+                              description='Escolas por página (máximo definido pelo servidor).'),
+            openapi.Parameter('cursor', openapi.IN_QUERY, type=openapi.TYPE_STRING,
+                              description='Cursor devolvido em "next"/"previous" da página anterior.'),
+        ],
         responses={200: 'OK'},
-        operation_description="Lista todas as escolas."
+        operation_description="Lista todas as escolas, ordenadas por nome. Com page_size ou cursor a resposta é paginada."
     )
     def list(self, request):
-        return super().list(request)
+        etag, ultima_modificacao = condicional.validadores_tabela('lista', request)
+        if condicional.nao_modificado(request, etag, ultima_modificacao):
+            return condicional.resposta_304(etag, ultima_modificacao)
+
+        chave = cache.chave_consulta('lista', request)
+        data = cache.obter(chave)
+        if data is None:
+            with limites.ocupar(request):
+                # Leitura por .values(), sem EscolaSerializer por linha
+                queryset = escola_leitura.valores(self.filter_queryset(self.get_queryset()))
+                pagina = self.paginate_queryset(queryset)
+                if pagina is not None:
+                    data = self.get_paginated_response(escola_leitura.data(pagina)).data
+                else:
+                    data = escola_leitura.data(queryset)
+            cache.guardar(chave, data)
+        return Response(data, headers=condicional.cabecalhos(etag, ultima_modificacao))
 
     @swagger_auto_schema(
         responses={200: 'OK', 400: 'Bad Request', 404: 'Not Found'},
@@ -97,8 +148,13 @@ class EscolaViewSet(viewsets.ModelViewSet):
         else:
             return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
-    @classmethod
     @swagger_auto_schema(
+        manual_parameters=[
+            openapi.Parameter('page_size', openapi.IN_QUERY, type=openapi.TYPE_INTEGER,
+                              description='Escolas por página (máximo definido pelo servidor).'),
+            openapi.Parameter('cursor', openapi.IN_QUERY, type=openapi.TYPE_STRING,
+                              description='Cursor devolvido em "next"/"previous"; reenviar com o mesmo corpo.'),
+        ],
         request_body=openapi.Schema(
             type=openapi.TYPE_OBJECT,
             properties={
@@ -110,26 +166,160 @@ class EscolaViewSet(viewsets.ModelViewSet):
         operation_description="Filtra as escolas com base nas províncias fornecidas no JSON no corpo da requisição."
     )
     @action(detail=False, methods=['post'], name='filter_by_provincia', url_path='filter_by_provincia')
-    def filter_by_provincia(cls, request):
+    def filter_by_provincia(self, request):
         data = request.data
         provincias_desejadas = data.get('provincias', [])
 
         if not isinstance(provincias_desejadas, list):
             return JsonResponse({'error': 'O campo "provincias" deve ser uma lista.'}, status=status.HTTP_400_BAD_REQUEST)
         
-        # Inicialização de um Queryset vazio
-        queryset = Escola.objects.none()  
+        if not all(isinstance(provincia, str) for provincia in provincias_desejadas):
+            return JsonResponse({'error': 'O campo "provincias" deve ser uma lista de textos.'}, status=status.HTTP_400_BAD_REQUEST)
+
+        provincias = sorted(set(provincias_desejadas))
+        etag, ultima_modificacao = condicional.validadores_tabela('provincias', request, provincias=provincias)
+        if condicional.nao_modificado(request, etag, ultima_modificacao):
+            return condicional.resposta_304(etag, ultima_modificacao)
+
+        chave = cache.chave_consulta('provincias', request, provincias=provincias)
+        resposta = cache.obter(chave)
+        if resposta is None:
+            with limites.ocupar(request):
+                resposta = self._filtrar_por_provincia(provincias_desejadas)
+            cache.guardar(chave, resposta)
+
+        return Response(resposta, status=status.HTTP_200_OK, headers=condicional.cabecalhos(etag, ultima_modificacao))
+
+    @swagger_auto_schema(
+        manual_parameters=[
+            openapi.Parameter('q', openapi.IN_QUERY, type=openapi.TYPE_STRING, required=True,
+                              description='Palavras (ou início de palavras) do nome ou e-mail da escola.'),
+            openapi.Parameter('page_size', openapi.IN_QUERY, type=openapi.TYPE_INTEGER,
+                              description='Resultados por página (máximo definido pelo servidor).'),
+            openapi.Parameter('offset', openapi.IN_QUERY, type=openapi.TYPE_INTEGER,
+                              description='Posição do primeiro resultado; usar o link "next" da página anterior.'),
+        ],
+        responses={200: 'OK', 400: 'Bad Request'},
+        operation_description="Pesquisa escolas por nome e e-mail, ordenadas por relevância."
+    )
+    @action(detail=False, methods=['get'], name='search', url_path='search')
+    def search(self, request):
+        texto = request.query_params.get('q', '')
+        if not busca.palavras(texto):
+            return Response({'error': 'O parâmetro "q" é obrigatório.'}, status=status.HTTP_400_BAD_REQUEST)
+
+        etag, ultima_modificacao = condicional.validadores_tabela('busca', request)
+        if condicional.nao_modificado(request, etag, ultima_modificacao):
+            return condicional.resposta_304(etag, ultima_modificacao)
+
+        chave = cache.chave_consulta('busca', request)
+        data = cache.obter(chave)
+        if data is None:
+            with limites.ocupar(request):
+                paginator = BuscaPagination()
+                pagina = paginator.paginate_queryset(escola_leitura.valores(busca.pesquisar(texto)), request, view=self)
+                data = paginator.get_paginated_response(escola_leitura.data(pagina)).data
+            cache.guardar(chave, data)
+        return Response(data, headers=condicional.cabecalhos(etag, ultima_modificacao))
+
+    @swagger_auto_schema(
+        responses={200: 'OK'},
+        operation_description="Número de escolas e total/média/mínimo/máximo de salas por província, "
+                              "mais a lista de províncias distintas."
+    )
+    @action(detail=False, methods=['get'], name='stats', url_path='stats')
+    def stats(self, request):
+        etag, ultima_modificacao = condicional.validadores_tabela('stats', request)
+        if condicional.nao_modificado(request, etag, ultima_modificacao):
+            return condicional.resposta_304(etag, ultima_modificacao)
+
+        chave = cache.chave_tabela('stats')
+        data = cache.obter(chave)
+        if data is None:
+            with limites.ocupar(request):
+                por_provincia = estatisticas.por_provincia()
+            data = {
+                'provincias': por_provincia,
+                'provincias_disponiveis': [linha['provincia'] for linha in por_provincia],
+            }
+            cache.guardar(chave, data)
+        return Response(data, headers=condicional.cabecalhos(etag, ultima_modificacao))
+
+    @swagger_auto_schema(
+        manual_parameters=[
+            openapi.Parameter('formato', openapi.IN_QUERY, type=openapi.TYPE_STRING, enum=[*exportacao.TIPOS],
+                              default='csv', description='Formato do arquivo exportado.'),
+            openapi.Parameter('provincias', openapi.IN_QUERY, type=openapi.TYPE_STRING,
+                              description='Exporta só as escolas destas províncias (separadas por vírgula).'),
+        ],
+        responses={200: 'OK', 400: 'Bad Request'},
+        operation_description="Exporta as escolas (todas ou as das províncias indicadas) em CSV, NDJSON ou XLSX. "
+                              "O XLSX pode ser importado de volta pelo /escolas/upload-excel/."
+    )
+    @action(detail=False, methods=['get'], name='export', url_path='export')
+    def export(self, request):
+        formato = request.query_params.get('formato', 'csv')
+        if formato not in exportacao.TIPOS:
+            return Response({'error': f'Formato inválido. Formatos aceites: {", ".join(exportacao.TIPOS)}.'},
+                            status=status.HTTP_400_BAD_REQUEST)
 
-        for provincia in provincias_desejadas:
-            queryset |= Escola.objects.filter(provincia__contains=[provincia])
+        queryset = Escola.objects.all()
+        provincias = [
+            provincia.strip()
+            for valor in request.query_params.getlist('provincias')
+            for provincia in valor.split(',') if provincia.strip()
+        ]
+        if provincias:
+            queryset = filtrar_por_provincias(queryset, provincias)
 
-        serializer = EscolaSerializer(queryset, many=True)
-        escolas = serializer.data
+        response = StreamingHttpResponse(exportacao.exportar(queryset, formato), content_type=exportacao.TIPOS[formato])
+        response['Content-Disposition'] = f'attachment; filename="escolas.{formato}"'
+        return response
 
-        # Obtemos as províncias únicas presentes nas escolas filtradas
-        provincias_disponiveis = list(set(provincia for escola in escolas for provincia in escola['provincia']))
+    @swagger_auto_schema(
+        request_body=openapi.Schema(
+            type=openapi.TYPE_ARRAY,
+            items=openapi.Schema(
+                type=openapi.TYPE_OBJECT,
+                properties={
+                    'op': openapi.Schema(type=openapi.TYPE_STRING, enum=[*lote.OPERACOES]),
+                    'id': openapi.Schema(type=openapi.TYPE_INTEGER, description='Obrigatório em patch e delete.'),
+                    'data': openapi.Schema(type=openapi.TYPE_OBJECT, description='Campos da escola (create, upsert, patch).'),
+                },
+                required=['op']
+            )
+        ),
+        responses={200: 'OK', 400: 'Bad Request', 409: 'Conflict'},
+        operation_description="Aplica uma lista de operações (create, upsert por nome, patch, delete) numa única transação. "
+                              "Se alguma operação for inválida nenhuma é aplicada."
+    )
+    @action(detail=False, methods=['post'], name='bulk', url_path='bulk')
+    def bulk(self, request):
+        if not isinstance(request.data, list):
+            return Response({'error': 'O corpo deve ser uma lista de operações.'}, status=status.HTTP_400_BAD_REQUEST)
+        if len(request.data) > settings.ESCOLAS_BULK_MAX_OPERACOES:
+            return Response({'error': f'No máximo {settings.ESCOLAS_BULK_MAX_OPERACOES} operações por pedido.'},
+                            status=status.HTTP_400_BAD_REQUEST)
 
-        return JsonResponse({'escolas': escolas, 'provincias_disponiveis': provincias_disponiveis}, status=status.HTTP_200_OK)
+        try:
+            aplicado, resultados = lote.aplicar(request.data)
+        except IntegrityError as e:
+            # Outra escrita concorrente ocupou um dos nomes depois da validação
+            return Response({'error': str(e)}, status=status.HTTP_409_CONFLICT)
+        return Response({'resultados': resultados}, status=status.HTTP_200_OK if aplicado else status.HTTP_400_BAD_REQUEST)
+
+    def _filtrar_por_provincia(self, provincias_desejadas):
+        queryset = filtrar_por_provincias(Escola.objects.all(), provincias_desejadas)
+
+        pagina = self.paginate_queryset(escola_leitura.valores(queryset))
+        escolas = escola_leitura.data(escola_leitura.valores(queryset) if pagina is None else pagina)
+
+        provincias_disponiveis = list(provincias_distintas(queryset))
+
+        resposta = {'escolas': escolas, 'provincias_disponiveis': provincias_disponiveis}
+        if pagina is not None:
+            resposta.update(next=self.paginator.get_next_link(), previous=self.paginator.get_previous_link())
+        return resposta
         
 
 class UploadExcelView(APIView):
@@ -141,68 +331,102 @@ class UploadExcelView(APIView):
                 name='file', 
                 in_=openapi.IN_FORM, 
                 type=openapi.TYPE_FILE,
-                description='Escolha um arquivo excel.'
-            )
+                description='Escolha um arquivo Excel (.xlsx) ou CSV (.csv).'
+            ),
+            openapi.Parameter(
+                name='job',
+                in_=openapi.IN_QUERY,
+                type=openapi.TYPE_BOOLEAN,
+                description='Processa o arquivo em segundo plano e devolve o id da importação (202).'
+            ),
+            openapi.Parameter(
+                name='mode',
+                in_=openapi.IN_QUERY,
+                type=openapi.TYPE_STRING,
+                enum=list(MODOS),
+                default='insert',
+                description='insert: só cria escolas novas. upsert: cria as novas e atualiza, por nome, as que mudaram; '
+                            'as iguais são ignoradas.'
+            ),
+            openapi.Parameter(
+                name='delete_missing',
+                in_=openapi.IN_QUERY,
+                type=openapi.TYPE_BOOLEAN,
+                description='Com mode=upsert, apaga as escolas cujo nome não aparece no arquivo.'
+            ),
         ],
-        responses={200: 'OK', 400: 'Bad Request', 500: 'Internal Server Error'},
-        operation_description="Faz o upload de um arquivo Excel contendo dados das escolas para criar novos registros."
+        responses={200: 'OK', 202: 'Accepted', 400: 'Bad Request', 500: 'Internal Server Error'},
+        operation_description="Faz o upload de um arquivo Excel contendo dados das escolas para criar novos registros "
+                              "(ou, com mode=upsert, criar e atualizar). Um arquivo idêntico a um já importado, sem "
+                              "alterações às escolas desde então, devolve o relatório dessa importação com "
+                              "repetido=true; num arquivo em parte repetido as linhas já importadas são ignoradas."
     )
     @action(detail=False, methods=['post'], parser_classes=(MultiPartParser, ), name='upload-excel', url_path='upload-excel')
     def post(self, request, format=None):
         if 'file' not in request.data:
             return Response({'error': 'Nenhum arquivo foi enviado.'}, status=status.HTTP_400_BAD_REQUEST)
 
+        modo = request.query_params.get('mode', 'insert')
+        if modo not in MODOS:
+            return Response({'error': f'Modo inválido. Modos aceites: {", ".join(MODOS)}.'}, status=status.HTTP_400_BAD_REQUEST)
+        apagar_ausentes = request.query_params.get('delete_missing') in ('1', 'true')
+        if apagar_ausentes and modo != UPSERT:
+            return Response({'error': 'delete_missing só é aceite com mode=upsert.'}, status=status.HTTP_400_BAD_REQUEST)
+
         try:
             file_obj = request.data['file']
-            file_content = file_obj.read()
+            formato = 'csv' if (file_obj.name or '').lower().endswith('.csv') else 'xlsx'
 
             # Validação do arquivo Excel
-            if not file_content.startswith(b'\x50\x4b\x03\x04'):
-                return Response({'error': 'Arquivo não é um arquivo Excel (.xlsx).'}, status=status.HTTP_400_BAD_REQUEST)
-
-            # Leitura dos dados do Excel
-            df = pd.read_excel(file_content)
-
-            # Validação da estrutura do Excel
-            if not set(df.columns) == {'nome', 'email', 'numero_salas', 'provincia'}:
-                return Response({'error': 'Estrutura do Excel incorreta. Colunas esperadas: nome, email, numero_salas, provincia.'}, status=status.HTTP_400_BAD_REQUEST)
-
-            # Contadores de inserção dos dados na base de dados
-            escolas_inseridas = 0
-            escolas_falhadas = 0
-            erros = []
-
-            for index, row in df.iterrows():
-                try:
-                    # Convertendo a string 'provincia' em uma lista de itens
-                    # Estamos supondo que cada escola virá somente com uma provincia
-                    # mas o modelo foi desenhado para uma escola estar em varias provincias
-                    provincia = row['provincia'].split(',') if isinstance(row['provincia'], str) else row['provincia']
-                    
-                    data = {
-                        'nome': row['nome'],
-                        'email': row['email'],
-                        'numero_salas': row['numero_salas'],
-                        'provincia': provincia,
-                    }
-                    serializer = EscolaSerializer(data=data)
-                    if serializer.is_valid():
-                        serializer.save()
-                        escolas_inseridas += 1
-                    else:
-                        escolas_falhadas += 1
-                        erros.append(f"Linha {index+1}: {serializer.errors}")
-                except Exception as e:
-                    escolas_falhadas += 1
-                    erros.append(f"Linha {index+1}: {e}")
+            if formato == 'xlsx':
+                assinatura = file_obj.read(4)
+                file_obj.seek(0)
+                if not assinatura.startswith(b'\x50\x4b\x03\x04'):
+                    return Response({'error': 'Arquivo não é um arquivo Excel (.xlsx).'}, status=status.HTTP_400_BAD_REQUEST)
+
+            # Modo job: o arquivo fica guardado e é processado em segundo plano
+            if request.query_params.get('job') in ('1', 'true'):
+                importacao = Importacao.objects.create(
+                    arquivo=file_obj, formato=formato, modo=modo, apagar_ausentes=apagar_ausentes
+                )
+                enfileirar(importacao)
+                return Response({
+                    'job_id': importacao.pk,
+                    'estado': importacao.estado,
+                    'url': reverse('import_job', args=[importacao.pk]),
+                }, status=status.HTTP_202_ACCEPTED)
+
+            # Leitura em blocos a partir do arquivo enviado: validação da
+            # estrutura e inserção bloco a bloco (ver escolas/importacao.py).
+            # Arquivos e linhas já importados não são processados outra vez
+            # (ver escolas/historico.py).
+            try:
+                resultado = executar_upload(importar_arquivo, file_obj, formato, modo, apagar_ausentes)
+            except EstruturaInvalida as e:
+                return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
 
             # Resostas
-            if erros:
-                relatorio = f"**{escolas_inseridas} escolas inseridas com sucesso.**\n**{escolas_falhadas} escolas falharam:**\n{''.join(erros)}"
-                return Response({'relatorio': relatorio}, status=status.HTTP_200_OK)
-            else:
-                relatorio = f"**{escolas_inseridas} escolas inseridas com sucesso.**"
-                return Response({'relatorio': relatorio}, status=status.HTTP_200_OK)
+            resposta = {'relatorio': resultado.relatorio}
+            if getattr(resultado, 'repetido', False):
+                resposta.update(repetido=True, importado_em=resultado.importado_em)
+            return Response(resposta, status=status.HTTP_200_OK)
 
         except Exception as e:
-            return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
\ No newline at end of file
+            return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+class ImportJobView(APIView):
+
+    @swagger_auto_schema(
+        responses={200: 'OK', 404: 'Not Found'},
+        operation_description="Consulta o progresso e o relatório de uma importação em segundo plano."
+    )
+    def get(self, request, pk):
+        try:
+            importacao = Importacao.objects.get(pk=pk)
+        except Importacao.DoesNotExist:
+            return Response({"message": "Importação não encontrada"}, status=status.HTTP_404_NOT_FOUND)
+        if abandonada(importacao):
+            recuperar()
+            importacao.refresh_from_db()
+        return Response(ImportacaoSerializer(importacao).data, status=status.HTTP_200_OK)
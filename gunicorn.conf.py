@@ -0,0 +1,18 @@
+# Configuração do gunicorn usada pelo servidor.sh (SERVIDOR=wsgi|asgi)
+import multiprocessing
+import os
+
+bind = os.getenv('WEB_BIND', '0.0.0.0:8000')
+workers = int(os.getenv('WEB_WORKERS', multiprocessing.cpu_count() * 2 + 1))
+# Só para os workers síncronos (wsgi); os workers uvicorn ignoram-no
+threads = int(os.getenv('WEB_THREADS', 1))
+timeout = int(os.getenv('WEB_TIMEOUT', 120))
+
+# O locmem é um cache por processo: com vários workers cada um teria as suas
+# versões das escolas e devolveria dados e 304 antigos depois das escritas
+# feitas nos outros
+if workers > 1 and os.getenv('CACHE_BACKEND', 'locmem') == 'locmem':
+    raise SystemExit(
+        f'CACHE_BACKEND=locmem com {workers} workers: use CACHE_BACKEND=file (ou dummy) ou WEB_WORKERS=1'
+    )
+accesslog = os.getenv('WEB_ACCESS_LOG', '-') or None
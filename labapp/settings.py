@@ -42,6 +42,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
     # 3rd Apps
     'rest_framework',
     'drf_yasg',
@@ -50,6 +51,9 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'escolas.metricas.MetricasMiddleware',
+    'escolas.limites.LimitesMiddleware',
+    'escolas.compressao.CompressaoMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -91,9 +95,60 @@ DATABASES = {
         'PASSWORD': os.getenv('DB_PASSWORD'),
         'HOST': os.getenv('DB_HOST'),
         'PORT': os.getenv('DB_PORT'),
+        # Segundos que cada conexão é reutilizada entre pedidos (0 fecha-a no
+        # fim de cada pedido). Com o runserver ou SERVIDOR=asgi deixe 0: cada
+        # pedido/consulta corre numa thread nova e as conexões não se reutilizam.
+        'CONN_MAX_AGE': int(os.getenv('DB_CONN_MAX_AGE', 0)),
+        # Testa a conexão reutilizada antes do primeiro uso em cada pedido
+        'CONN_HEALTH_CHECKS': os.getenv('DB_CONN_HEALTH_CHECKS', '1').lower() in ('1', 'true'),
     }
 }
 
+# Pool de conexões nativo (Django >= 5.1 com psycopg 3 e psycopg-pool):
+# DB_POOL=1 liga-o, com DB_POOL_MIN/DB_POOL_MAX conexões por processo. Sem
+# essas dependências fica-se pelas conexões persistentes acima.
+if os.getenv('DB_POOL', '0').lower() in ('1', 'true'):
+    import django
+    from importlib.util import find_spec
+
+    if django.VERSION >= (5, 1) and find_spec('psycopg') and find_spec('psycopg_pool'):
+        DATABASES['default']['CONN_MAX_AGE'] = 0  # incompatível com o pool
+        DATABASES['default']['OPTIONS'] = {
+            'pool': {
+                'min_size': int(os.getenv('DB_POOL_MIN', 2)),
+                'max_size': int(os.getenv('DB_POOL_MAX', 10)),
+                'timeout': int(os.getenv('DB_POOL_TIMEOUT', 10)),
+            },
+        }
+
+
+# Cache
+# https://docs.djangoproject.com/en/5.0/topics/cache/
+# locmem (por processo, LRU) por omissão; CACHE_BACKEND=file partilha o cache
+# entre os workers da mesma máquina (a omissão do servidor.sh com gunicorn:
+# as versões das escolas, os ETags e os limites têm de ser os mesmos em todos
+# os workers); CACHE_BACKEND=dummy desliga-o. A duração das leituras em
+# cache é ESCOLAS_CACHE_TTL.
+
+if os.getenv('CACHE_BACKEND', 'locmem') == 'dummy':
+    # Sem cache (testes de carga das consultas)
+    CACHES = {'default': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}}
+elif os.getenv('CACHE_BACKEND', 'locmem') == 'file':
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': os.getenv('CACHE_LOCATION', BASE_DIR / 'cache'),
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'labapp',
+        }
+    }
+CACHES['default']['OPTIONS'] = {'MAX_ENTRIES': int(os.getenv('CACHE_MAX_ENTRIES', 1000))}
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.0/ref/settings/#auth-password-validators
@@ -131,7 +186,109 @@ USE_TZ = True
 
 STATIC_URL = 'static/'
 
+MEDIA_ROOT = os.getenv('MEDIA_ROOT', BASE_DIR / 'media')
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.0/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
+
+
+# Paginação das listagens de escolas (?page_size=&cursor=)
+# Com ESCOLAS_PAGE_SIZE vazio a paginação só é aplicada quando pedida.
+
+ESCOLAS_PAGE_SIZE = int(os.getenv('ESCOLAS_PAGE_SIZE', 0)) or None
+ESCOLAS_MAX_PAGE_SIZE = int(os.getenv('ESCOLAS_MAX_PAGE_SIZE', 1000))
+# Resultados por página da pesquisa (/escolas/search/?q=), sempre paginada
+ESCOLAS_SEARCH_PAGE_SIZE = int(os.getenv('ESCOLAS_SEARCH_PAGE_SIZE', 20))
+
+
+# Cache das leituras de escolas (0 desativa)
+
+ESCOLAS_CACHE_ALIAS = 'default'
+ESCOLAS_CACHE_TTL = int(os.getenv('ESCOLAS_CACHE_TTL', 60))
+
+
+# Importação de escolas
+# Número de linhas validadas e inseridas (bulk_create) de cada vez
+
+ESCOLAS_IMPORT_BATCH_SIZE = int(os.getenv('ESCOLAS_IMPORT_BATCH_SIZE', 1000))
+
+# Importações repartidas por processos (ver escolas/paralelo.py): cada folha
+# do XLSX, e cada intervalo de ESCOLAS_IMPORT_LINHAS_POR_PARTE linhas de um
+# CSV, é importada por um de ESCOLAS_IMPORT_PROCESSOS processos. Arquivos
+# com menos de ESCOLAS_IMPORT_LINHAS_POR_PARTE linhas, e 0 ou 1 processos,
+# importam tudo no próprio processo.
+ESCOLAS_IMPORT_PROCESSOS = int(os.getenv('ESCOLAS_IMPORT_PROCESSOS', 0))
+ESCOLAS_IMPORT_LINHAS_POR_PARTE = int(os.getenv('ESCOLAS_IMPORT_LINHAS_POR_PARTE', 50000))
+
+# Importações em segundo plano (?job=1): 'thread' processa-as num pool de
+# threads do próprio servidor; 'comando' deixa-as na fila da base de dados
+# para o `python manage.py processar_importacoes`.
+ESCOLAS_IMPORT_WORKER = os.getenv('ESCOLAS_IMPORT_WORKER', 'thread')
+ESCOLAS_IMPORT_THREADS = int(os.getenv('ESCOLAS_IMPORT_THREADS', 2))
+# Uma importação em curso sem progresso durante ESCOLAS_IMPORT_TIMEOUT
+# segundos (o processo morreu ou foi reciclado) volta à fila, até
+# ESCOLAS_IMPORT_TENTATIVAS tentativas; depois fica falhada.
+ESCOLAS_IMPORT_TIMEOUT = int(os.getenv('ESCOLAS_IMPORT_TIMEOUT', 600))
+ESCOLAS_IMPORT_TENTATIVAS = int(os.getenv('ESCOLAS_IMPORT_TENTATIVAS', 3))
+
+# Uploads síncronos (sem ?job=1): a leitura/validação com pandas corre num
+# pool com este número de threads, partilhado por todos os pedidos do
+# processo. 0 corre-a na própria thread do pedido.
+ESCOLAS_UPLOAD_THREADS = int(os.getenv('ESCOLAS_UPLOAD_THREADS', 0))
+
+
+# Servidor (ver servidor.sh)
+# Com ESCOLAS_ASYNC_VIEWS=1 as leituras de /escolas/ são servidas pelas vistas
+# assíncronas de escolas/assincrono.py; faz sentido com SERVIDOR=asgi.
+
+ESCOLAS_ASYNC_VIEWS = os.getenv('ESCOLAS_ASYNC_VIEWS', '0').lower() in ('1', 'true')
+
+
+# Exportação de escolas (/escolas/export/)
+# Linhas lidas do cursor do servidor e enviadas ao cliente de cada vez
+
+ESCOLAS_EXPORT_CHUNK_SIZE = int(os.getenv('ESCOLAS_EXPORT_CHUNK_SIZE', 2000))
+
+
+# Operações em lote (/escolas/bulk/)
+
+ESCOLAS_BULK_MAX_OPERACOES = int(os.getenv('ESCOLAS_BULK_MAX_OPERACOES', 10000))
+
+
+# Províncias normalizadas (ver escolas/provincias.py): as tabelas Provincia e
+# EscolaProvincia são sempre mantidas pela base de dados; com 1 os filtros e
+# as estatísticas por província usam-nas em vez do array e do índice GIN.
+
+ESCOLAS_PROVINCIAS_NORMALIZADAS = os.getenv('ESCOLAS_PROVINCIAS_NORMALIZADAS', '0').lower() in ('1', 'true')
+
+
+# Limites das rotas caras (ver escolas/limites.py), por orçamento: pedidos
+# por cliente ('N/s', 'N/min', 'N/h'; vazio sem limite) e pedidos em curso
+# por processo (0 sem limite). ESCOLAS_LIMITES=0 desliga todos.
+
+ESCOLAS_LIMITES = os.getenv('ESCOLAS_LIMITES', '1').lower() in ('1', 'true')
+ESCOLAS_LIMITES_CACHE_ALIAS = 'default'
+ESCOLAS_LIMITE_IMPORTACAO = os.getenv('ESCOLAS_LIMITE_IMPORTACAO', '10/min')
+ESCOLAS_LIMITE_BULK = os.getenv('ESCOLAS_LIMITE_BULK', '60/min')
+ESCOLAS_LIMITE_LEITURA = os.getenv('ESCOLAS_LIMITE_LEITURA', '600/min')
+ESCOLAS_CONCORRENCIA_IMPORTACAO = int(os.getenv('ESCOLAS_CONCORRENCIA_IMPORTACAO', 2))
+ESCOLAS_CONCORRENCIA_BULK = int(os.getenv('ESCOLAS_CONCORRENCIA_BULK', 4))
+ESCOLAS_CONCORRENCIA_LEITURA = int(os.getenv('ESCOLAS_CONCORRENCIA_LEITURA', 4))
+# Proxies à frente do servidor: só com NUM_PROXIES o X-Forwarded-For
+# identifica o cliente; sem ele conta o REMOTE_ADDR
+REST_FRAMEWORK = {'NUM_PROXIES': int(os.environ['NUM_PROXIES']) if os.getenv('NUM_PROXIES') else None}
+
+
+# Compressão das respostas (ver escolas/compressao.py): gzip, ou brotli com o
+# pacote instalado, a partir deste número de bytes (0 desliga)
+
+ESCOLAS_COMPRESSAO_MINIMO = int(os.getenv('ESCOLAS_COMPRESSAO_MINIMO', 1024))
+ESCOLAS_BROTLI_QUALIDADE = int(os.getenv('ESCOLAS_BROTLI_QUALIDADE', 5))
+
+
+# Instrumentação dos pedidos (Server-Timing e /metrics, ver escolas/metricas.py)
+# Fração dos pedidos medidos: 1 mede todos, 0 desliga.
+
+ESCOLAS_METRICS_SAMPLE_RATE = float(os.getenv('ESCOLAS_METRICS_SAMPLE_RATE', 1))
@@ -1,3 +1,4 @@
+from django.conf import settings
 from django.contrib import admin
 from django.urls import path, include
 from rest_framework import routers
@@ -6,7 +7,7 @@ from rest_framework import permissions
 from drf_yasg.views import get_schema_view
 from drf_yasg import openapi
 
-from escolas import views
+from escolas import assincrono, metricas, views
 
 schema_view = get_schema_view(
    openapi.Info(
@@ -27,10 +28,16 @@ router.register('escolas', views.EscolaViewSet)
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('escolas/upload-excel/', views.UploadExcelView.as_view(), name='upload_excel'),
+    path('escolas/import-jobs/<int:pk>/', views.ImportJobView.as_view(), name='import_job'),
+    path('metrics', metricas.exportar, name='metrics'),
     
     path('', include(router.urls)),
 ]
 
+# Leituras assíncronas à frente das rotas do router
+if settings.ESCOLAS_ASYNC_VIEWS:
+    urlpatterns[-1:-1] = assincrono.urlpatterns
+
 # Swagger routes
 urlpatterns += [
     path('swagger<format>/', schema_view.without_ui(cache_timeout=0), name='schema-json'),
@@ -0,0 +1,30 @@
+#!/bin/sh
+# Arranque do servidor web (CMD do Dockerfile), escolhido por SERVIDOR:
+#   runserver (omissão)  servidor de desenvolvimento do Django
+#   wsgi                 gunicorn com workers síncronos (labapp/wsgi.py)
+#   asgi                 gunicorn com workers uvicorn (labapp/asgi.py) e as
+#                        leituras de /escolas/ em vistas assíncronas
+# Workers, threads e timeout: ver gunicorn.conf.py. Com o gunicorn o cache
+# por omissão é o de arquivos, partilhado pelos workers.
+set -e
+
+case "${SERVIDOR:-runserver}" in
+    runserver)
+        exec python manage.py runserver 0.0.0.0:8000
+        ;;
+    wsgi)
+        export CACHE_BACKEND="${CACHE_BACKEND:-file}"
+        # Workers síncronos: cada thread reutiliza a sua conexão à base
+        export DB_CONN_MAX_AGE="${DB_CONN_MAX_AGE:-60}"
+        exec gunicorn labapp.wsgi:application -c gunicorn.conf.py
+        ;;
+    asgi)
+        export CACHE_BACKEND="${CACHE_BACKEND:-file}"
+        export ESCOLAS_ASYNC_VIEWS="${ESCOLAS_ASYNC_VIEWS:-1}"
+        exec gunicorn labapp.asgi:application -c gunicorn.conf.py -k uvicorn.workers.UvicornWorker
+        ;;
+    *)
+        echo "SERVIDOR desconhecido: $SERVIDOR (use runserver, wsgi ou asgi)" >&2
+        exit 1
+        ;;
+esac